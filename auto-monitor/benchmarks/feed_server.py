@@ -0,0 +1,61 @@
+"""Servidor HTTP local que hace de fuente: sirve un feed en memoria que se puede
+reemplazar entre ciclos y responde 304 a If-None-Match como un servidor real."""
+from __future__ import annotations
+
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+class FeedServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self._body = b'{"products": []}'
+        self._etag = self._make_etag(self._body)
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args: object) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                server.requests += 1
+                body, etag = server._body, server._etag
+                if etag and self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                if etag:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _make_etag(body: bytes) -> str:
+        return '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/products.json"
+
+    def set_feed(self, body: bytes, etag: bool = True) -> None:
+        # Sin etag el servidor no puede responder 304 y siempre manda el cuerpo
+        self._body = body
+        self._etag = self._make_etag(body) if etag else ""
+
+    def __enter__(self) -> "FeedServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,68 @@
+"""Feeds sinteticos y deterministas para los benchmarks.
+
+La misma (cantidad, semilla) produce siempre los mismos productos, y `churn`
+genera la version siguiente del catalogo con una fraccion fija de altas, bajas
+y cambios de precio, asi dos corridas miden exactamente el mismo trabajo.
+"""
+from __future__ import annotations
+
+import json
+import random
+from typing import Any, Dict, Iterable, Iterator, List
+
+Product = Dict[str, Any]
+
+def _product(pid: int, rnd: random.Random) -> Product:
+    return {"id": pid,
+            "title": f"Product {pid} " + "x" * rnd.randint(10, 60),
+            "price": round(rnd.uniform(1, 500), 2),
+            "description": "lorem ipsum " * rnd.randint(1, 8)}
+
+def iter_products(count: int, seed: int = 1) -> Iterator[Product]:
+    """Los mismos productos que generate_products, de a uno (sin tener la lista en memoria)."""
+    rnd = random.Random(seed)
+    return (_product(pid, rnd) for pid in range(count))
+
+def generate_products(count: int, seed: int = 1) -> List[Product]:
+    return list(iter_products(count, seed))
+
+def churn(products: List[Product], rate: float, seed: int = 1) -> List[Product]:
+    """Version siguiente del catalogo: `rate` de los productos cambia, repartido en
+    un tercio de bajas, un tercio de altas (ids nuevos) y un tercio de precios nuevos."""
+    rnd = random.Random(seed)
+    changes = int(len(products) * rate)
+    per_kind = max(changes // 3, 1) if changes else 0
+
+    result = list(products)
+    removed = set(rnd.sample(range(len(result)), min(per_kind, len(result))))
+    result = [p for i, p in enumerate(result) if i not in removed]
+    for i in rnd.sample(range(len(result)), min(per_kind, len(result))):
+        result[i] = {**result[i], "price": round(result[i]["price"] * rnd.uniform(0.5, 1.5), 2)}
+    next_id = max((p["id"] for p in products), default=-1) + 1
+    result.extend(_product(next_id + i, rnd) for i in range(per_kind))
+    return result
+
+def history(count: int, steps: int, rate: float, seed: int = 1) -> Iterator[List[Product]]:
+    """`steps` versiones sucesivas del mismo catalogo."""
+    products = generate_products(count, seed)
+    for step in range(steps):
+        yield products
+        products = churn(products, rate, seed=seed * 1_000_003 + step)
+
+def feed_payload(products: List[Product]) -> Dict[str, Any]:
+    return {"meta": {"generated": "benchmark", "count": len(products)}, "products": products}
+
+def feed_bytes(products: List[Product]) -> bytes:
+    return json.dumps(feed_payload(products)).encode("utf-8")
+
+def write_feed(path: str, products: Iterable[Product]) -> int:
+    """Escribe el feed de a un producto para no armar el JSON entero en memoria.
+
+    Con un generador (iter_products) tampoco hace falta tener el catalogo."""
+    size = 0
+    with open(path, "w", encoding="utf-8") as f:
+        size += f.write('{"meta": {"generated": "benchmark"}, "products": [')
+        for i, p in enumerate(products):
+            size += f.write(("," if i else "") + json.dumps(p))
+        size += f.write("]}")
+    return size
@@ -0,0 +1,304 @@
+"""Benchmarks de los caminos calientes de ingesta y consulta.
+
+    python -m benchmarks.run --sizes 1000,10000,100000 --history 10,100 --out bench.json
+    python -m benchmarks.run --compare bench_before.json bench_after.json
+
+Cada resultado guarda min/mediana/media de varias repeticiones; los JSON de dos
+corridas se comparan por nombre y parametros.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from .feed_server import FeedServer
+from .feedgen import churn, feed_bytes, feed_payload, generate_products, history
+
+Result = Dict[str, Any]
+
+def measure(name: str, fn: Callable[[], Any], repeat: int = 5, setup: Optional[Callable[[], Any]] = None,
+            **params: Any) -> Result:
+    timings: List[float] = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    result = {"name": name, "params": params, "repeat": repeat,
+              "min": min(timings), "median": statistics.median(timings), "mean": statistics.fmean(timings)}
+    print(f"{name:<32} {json.dumps(params):<40} median={result['median'] * 1000:10.3f} ms", file=sys.stderr)
+    return result
+
+def bench_domain(sizes: List[int], churn_rate: float, repeat: int) -> List[Result]:
+    from src.automonitor.domain.columnar import ColumnarState, diff_columnar
+    from src.automonitor.domain.diff import compute_state_hash, diff_products, serialize_state
+    from src.automonitor.domain.merkle import bucket_count, diff_buckets, hash_state
+    from src.automonitor.domain.models import extract_products
+
+    results: List[Result] = []
+    for size in sizes:
+        products = generate_products(size)
+        payload = feed_payload(products)
+        new_payload = feed_payload(churn(products, churn_rate))
+        old_state, new_state = extract_products(payload), extract_products(new_payload)
+
+        results.append(measure("extract_products", lambda: extract_products(payload), repeat, products=size))
+        results.append(measure("diff_products", lambda: diff_products(old_state, new_state), repeat,
+                               products=size, churn=churn_rate))
+        results.append(measure("compute_state_hash", lambda: compute_state_hash(new_state), repeat, products=size))
+        # Como en _record_state: el estado nuevo usa la cantidad de buckets del anterior si le sirve
+        old_hashes = hash_state(old_state)
+        new_hashes = hash_state(new_state, bucket_count(len(new_state), old_hashes.count))
+        if diff_buckets(old_state, old_hashes, new_state, new_hashes) != diff_products(old_state, new_state):
+            raise AssertionError("diff_buckets does not match diff_products")
+        results.append(measure("hash_state", lambda: hash_state(new_state), repeat, products=size))
+        results.append(measure("diff_buckets", lambda: diff_buckets(old_state, old_hashes, new_state, new_hashes),
+                               repeat, products=size, churn=churn_rate))
+
+        # Representacion en columnas: el camino de dicts es la referencia
+        old_columns = ColumnarState.from_products(payload["products"])
+        new_columns = ColumnarState.from_products(new_payload["products"])
+        if diff_columnar(old_columns, new_columns) != diff_products(old_state, new_state):
+            raise AssertionError("diff_columnar does not match diff_products")
+        if serialize_state(new_columns) != serialize_state(new_state):
+            raise AssertionError("ColumnarState.to_json does not match serialize_state")
+        results.append(measure("columnar.from_products", lambda: ColumnarState.from_products(new_payload["products"]),
+                               repeat, products=size))
+        results.append(measure("columnar.diff", lambda: diff_columnar(old_columns, new_columns), repeat,
+                               products=size, churn=churn_rate))
+        results.append(measure("columnar.serialize", lambda: serialize_state(new_columns), repeat, products=size))
+        results.append(_memory("state_memory", lambda: extract_products(payload), products=size, format="dict"))
+        results.append(_memory("state_memory", lambda: ColumnarState.from_products(payload["products"]),
+                               products=size, format="columnar"))
+    return results
+
+def _memory(name: str, fn: Callable[[], Any], **params: Any) -> Result:
+    # Bytes que quedan vivos en el objeto que devuelve fn (tracemalloc, una sola corrida)
+    tracemalloc.start()
+    try:
+        kept = fn()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del kept
+    print(f"{name:<32} {json.dumps(params):<40} {size / 1e6:10.1f} MB", file=sys.stderr)
+    return {"name": name, "params": params, "repeat": 1, "bytes": size,
+            "min": float(size), "median": float(size), "mean": float(size)}
+
+def _fresh_db(workdir: str, name: str) -> str:
+    path = os.path.join(workdir, f"{name}.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return path
+
+def bench_run_monitor(sizes: List[int], churn_rate: float, repeat: int, workdir: str,
+                      storage_mode: str, state_format: str = "dict") -> List[Result]:
+    """Un ciclo completo contra el servidor local: feed con cambios, cuerpo igual y 304."""
+    from src.automonitor.application.monitor_service import run_monitor, state_cache
+
+    results: List[Result] = []
+    with FeedServer() as server:
+        for size in sizes:
+            db_path = _fresh_db(workdir, f"run_monitor_{size}")
+            versions = [feed_bytes(p) for p in history(size, repeat + 1, churn_rate)]
+            server.set_feed(versions[0])
+            run_monitor(server.url, db_path, storage_mode=storage_mode, state_format=state_format)
+
+            step = iter(versions[1:])
+            results.append(measure("run_monitor.changed",
+                                   lambda: run_monitor(server.url, db_path, storage_mode=storage_mode,
+                                                       state_format=state_format),
+                                   repeat, setup=lambda: server.set_feed(next(step)),
+                                   products=size, churn=churn_rate, storage=storage_mode, state=state_format))
+
+            # Sin cache en memoria: el estado previo se reconstruye desde SQLite
+            cold = feed_bytes(churn(generate_products(size), 0.5, seed=7))
+            results.append(measure("run_monitor.changed_cold",
+                                   lambda: run_monitor(server.url, db_path, storage_mode=storage_mode,
+                                                       state_format=state_format),
+                                   1, setup=lambda: (server.set_feed(cold), state_cache.clear()),
+                                   products=size, storage=storage_mode, state=state_format))
+
+            # Mismo cuerpo sin etag: se descarga pero se corta por el hash del cuerpo
+            server.set_feed(cold, etag=False)
+            results.append(measure("run_monitor.unchanged_body", lambda: run_monitor(server.url, db_path), repeat,
+                                   products=size))
+
+            server.set_feed(cold, etag=True)
+            run_monitor(server.url, db_path)
+            results.append(measure("run_monitor.not_modified", lambda: run_monitor(server.url, db_path), repeat,
+                                   products=size))
+    return results
+
+def _build_history(db_path: str, products: int, events: int, churn_rate: float) -> None:
+    from src.automonitor.application.monitor_service import _record_state
+    from src.automonitor.domain.models import build_product_state
+    from src.automonitor.infrastructure.sqlite_repo import init_db
+
+    init_db(db_path)
+    for version in history(products, events, churn_rate):
+        _record_state(build_product_state(version), db_path, "default", "delta", 50, "zlib")
+
+def bench_queries(history_sizes: List[int], products: int, churn_rate: float, repeat: int,
+                  workdir: str) -> List[Result]:
+    """get_overview_metrics y los endpoints de la API con historias cada vez mas largas."""
+    from src.automonitor.application import query_service
+    from src.automonitor.infrastructure.sqlite_repo import get_overview_metrics, get_latest_event
+
+    results: List[Result] = []
+    for events in history_sizes:
+        db_path = _fresh_db(workdir, f"history_{events}")
+        _build_history(db_path, products, events, churn_rate)
+        results.append(measure("get_overview_metrics", lambda: get_overview_metrics(db_path), repeat,
+                               events=events, products=products))
+
+        os.environ["DB_PATH"] = db_path
+        os.environ.setdefault("SOURCE_URL", "http://127.0.0.1/unused.json")
+        from fastapi.testclient import TestClient
+        from src.automonitor.interfaces.api import create_app
+        client = TestClient(create_app())
+
+        latest = get_latest_event(db_path)
+        middle = max(latest["id"] // 2, 1) if latest else 1
+        since = "1970-01-01T00:00:00Z"
+        endpoints = {
+            "/events": "/events?limit=50",
+            "/events?before_id": f"/events?limit=50&before_id={middle}",
+            "/events/{id}": f"/events/{middle}",
+            "/events/{id}?include=diff": f"/events/{middle}?include=diff",
+            "/events/latest": "/events/latest",
+            "/metrics/overview": "/metrics/overview",
+            "/products?changed_since": f"/products?changed_since={since}&limit=100",
+        }
+        for label, path in endpoints.items():
+            # Sin LRU: se mide el costo real de armar la respuesta
+            results.append(measure(f"api {label}", lambda: client.get(path).raise_for_status(), repeat,
+                                   setup=query_service._detail_cache.clear, events=events, products=products))
+    return results
+
+# Modulos que el camino de "cli run" no debe importar: solo los usan la API y "watch"
+_STARTUP_FORBIDDEN = ("fastapi", "starlette", "pydantic", "apscheduler", "uvicorn")
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _python(code: str, env: Optional[Dict[str, str]] = None) -> str:
+    return subprocess.run([sys.executable, "-c", code], cwd=_ROOT, env=env, capture_output=True, text=True,
+                          check=True).stdout
+
+def bench_startup(repeat: int, workdir: str) -> List[Result]:
+    """Arranque en frio de "cli run" en un proceso nuevo, como lo lanza cron cada minuto."""
+    results: List[Result] = []
+    loaded = json.loads(_python(
+        "import json, sys; import src.automonitor.interfaces.cli; "
+        f"print(json.dumps(sorted(m for m in {_STARTUP_FORBIDDEN!r} if m in sys.modules)))",
+        env={**os.environ, "SOURCE_URL": "http://127.0.0.1/unused.json"}))
+    if loaded:
+        raise AssertionError(f"cli run imports {', '.join(loaded)}")
+
+    # Referencia: lo que cuesta el interprete solo
+    results.append(measure("startup.python", lambda: _python("pass"), repeat))
+    results.append(measure("startup.import_cli",
+                           lambda: _python("import src.automonitor.interfaces.cli",
+                                           env={**os.environ, "SOURCE_URL": "http://127.0.0.1/unused.json"}),
+                           repeat))
+
+    with FeedServer() as server:
+        server.set_feed(feed_bytes(generate_products(1_000)), etag=True)
+        db_path = _fresh_db(workdir, "startup")
+        env = {**os.environ, "SOURCE_URL": server.url, "DB_PATH": db_path,
+               "TELEGRAM_BOT_TOKEN": "", "TELEGRAM_CHAT_ID": ""}
+        run = "from src.automonitor.interfaces.cli import run_once; run_once()"
+        # Primera corrida: crea el esquema y guarda el etag; las siguientes reciben 304
+        results.append(measure("startup.run_new_db", lambda: _python(run, env), 1))
+        results.append(measure("startup.run_not_modified", lambda: _python(run, env), repeat))
+    return results
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _key(result: Result) -> str:
+    return result["name"] + " " + json.dumps(result["params"], sort_keys=True)
+
+def compare(base_path: str, new_path: str) -> None:
+    with open(base_path) as f:
+        base = {_key(r): r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = {_key(r): r for r in json.load(f)["results"]}
+    for key in sorted(base.keys() & new.keys()):
+        ratio = new[key]["median"] / base[key]["median"] if base[key]["median"] else float("inf")
+        flag = "  <-- slower" if ratio > 1.2 else ""
+        print(f"{key:<80} {base[key]['median'] * 1000:10.3f} ms -> {new[key]['median'] * 1000:10.3f} ms "
+              f"(x{ratio:.2f}){flag}")
+
+def _ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=_ints, default=[1_000, 10_000, 100_000],
+                        help="catalog sizes for the ingest benchmarks (up to 1000000)")
+    parser.add_argument("--history", type=_ints, default=[10, 100],
+                        help="number of events for the query benchmarks")
+    parser.add_argument("--history-products", type=int, default=5_000)
+    parser.add_argument("--churn", type=float, default=0.01, help="fraction of products changed per version")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--storage", choices=("full", "delta"), default="full")
+    parser.add_argument("--state-format", choices=("dict", "columnar"), default="dict")
+    parser.add_argument("--only", choices=("domain", "run_monitor", "queries", "startup"), action="append")
+    parser.add_argument("--out", help="write results as JSON to this path")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    only = set(args.only or ("domain", "run_monitor", "queries", "startup"))
+    workdir = tempfile.mkdtemp(prefix="automonitor-bench-")
+    results: List[Result] = []
+    try:
+        if "domain" in only:
+            results += bench_domain(args.sizes, args.churn, args.repeat)
+        if "run_monitor" in only:
+            results += bench_run_monitor(args.sizes, args.churn, args.repeat, workdir, args.storage, args.state_format)
+        if "queries" in only:
+            results += bench_queries(args.history, args.history_products, args.churn, args.repeat, workdir)
+        if "startup" in only:
+            results += bench_startup(args.repeat, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Pico de memoria (RSS) al extraer productos de un feed grande.
+
+Compara el camino en memoria (cuerpo completo + json.loads + extract_products)
+con el camino en streaming (archivo temporal + iter_json_array + build_product_state).
+Cada modo corre en un proceso aparte para que el pico de uno no tape al otro, y el
+feed se escribe desde un generador: en Linux ru_maxrss sobrevive a fork + exec, asi
+que un proceso padre que tuviera el catalogo en memoria inflaria el pico de cada hijo.
+"baseline" es el piso del interprete con los modulos importados.
+
+    python -m benchmarks.stream_memory --products 500000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from .feedgen import iter_products, write_feed
+
+MODES = ("baseline", "buffered", "streaming")
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss esta en KiB en Linux (y en bytes en macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _child(mode: str, path: str) -> None:
+    from src.automonitor.domain.models import build_product_state, extract_products
+    from src.automonitor.infrastructure.json_stream import iter_json_array
+
+    started = time.perf_counter()
+    count = 0
+    if mode == "buffered":
+        with open(path, "rb") as f:
+            body = f.read()
+        count = len(extract_products(json.loads(body)))
+    elif mode == "streaming":
+        with open(path, "rb") as f:
+            chunks = iter(lambda: f.read(64 * 1024), b"")
+            count = len(build_product_state(iter_json_array(chunks, "products")))
+    print(json.dumps({"mode": mode, "products": count,
+                      "seconds": round(time.perf_counter() - started, 3),
+                      "peak_rss_mb": round(_peak_rss_mb(), 1)}))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=500_000)
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--feed", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(args.child, args.feed)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "feed.json")
+        size = write_feed(path, iter_products(args.products))
+        results = []
+        for mode in MODES:
+            out = subprocess.run([sys.executable, "-m", "benchmarks.stream_memory", "--child", mode, "--feed", path],
+                                 check=True, capture_output=True, text=True).stdout
+            results.append(json.loads(out))
+
+    print(json.dumps({"feed_bytes": size, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
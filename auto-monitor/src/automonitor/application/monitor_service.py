@@ -1,32 +1,273 @@
 from __future__ import annotations
 
+import asyncio
 import json
-from datetime import datetime, timezone
-from typing import Optional
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Deque, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
 
-from ..domain.models import ProductState, extract_products
-from ..domain.diff import diff_products, compute_state_hash
-from ..infrastructure.http_fetcher import fetch_json
+from ..config import Settings, Source
+from ..domain.columnar import ColumnarState
+from ..domain.models import ProductState, build_product_state
+from ..domain.diff import make_delta, product_changes, serialize_state
+from ..domain.merkle import StateHashes, bucket_count, diff_buckets, hash_state, pack_buckets, unpack_buckets
+from ..infrastructure.archive import EventArchive
+from ..infrastructure.http_fetcher import DEFAULT_STREAM_THRESHOLD_BYTES, AsyncFeedFetcher, FetchResult, fetch_feed
 from ..infrastructure.sqlite_repo import (
+    DEFAULT_SOURCE,
+    STORAGE_DELTA,
     init_db,
-    get_last_state_json,
+    get_latest_event_id,
+    get_event_state,
+    get_event_buckets,
+    list_event_times,
+    count_since_keyframe,
+    FetchState,
+    get_fetch_state,
+    save_fetch_state,
+    record_run,
     upsert_hash,
     insert_event,
+    backfill_event_counts,
+    index_products as index_product_changes,
+    migrate_event_storage,
+    compact_events,
+    diff_event_range,
+    start_rebuild,
+    write_rebuilt_events,
+    finish_rebuild,
+    incremental_vacuum,
+    vacuum,
 )
+from .query_service import clear_event_cache
 
-def run_monitor(source_url: str, db_path: str) -> dict:
+logger = logging.getLogger(__name__)
+
+class _CachedState(NamedTuple):
+    event_id: int
+    hashes: StateHashes
+    state: ProductState
+
+class StateCache:
+    """Ultimo estado aceptado de cada fuente, guardado en memoria entre ciclos.
+
+    En modo watch el proceso ya calculo ese estado en el ciclo anterior, asi que no
+    hace falta releerlo (y reconstruirlo) desde SQLite. La entrada solo se usa si su
+    event_id sigue siendo el ultimo evento de la fuente en la base; si otro proceso
+    escribio un evento despues, se recarga.
+    """
+
+    def __init__(self) -> None:
+        self._entries: Dict[Tuple[str, str], _CachedState] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def previous(self, db_path: str, source: str, columnar: bool = False) -> Tuple[ProductState, StateHashes]:
+        """Ultimo estado de la fuente y sus hashes por bucket."""
+        latest_id = get_latest_event_id(db_path, source)
+        with self._lock:
+            entry = self._entries.get((db_path, source))
+            if entry is not None and entry.event_id == latest_id:
+                self.hits += 1
+                if columnar and not isinstance(entry.state, ColumnarState):
+                    # Se convierte una vez y queda en columnas para los proximos ciclos
+                    entry = entry._replace(state=ColumnarState.from_state(entry.state))
+                    self._entries[(db_path, source)] = entry
+                return entry.state, entry.hashes
+            self.misses += 1
+        if latest_id is None:
+            empty: ProductState = ColumnarState.from_state({}) if columnar else {}
+            return empty, hash_state(empty)
+        state = get_event_state(db_path, latest_id) or {}
+        if columnar:
+            state = ColumnarState.from_state(state)
+        # Los eventos anteriores a los hashes por bucket no los tienen guardados: se calculan
+        hashes = unpack_buckets(get_event_buckets(db_path, latest_id) or b"") or hash_state(state)
+        self.store(db_path, source, latest_id, hashes, state)
+        return state, hashes
+
+    def store(self, db_path: str, source: str, event_id: int, hashes: StateHashes, state: ProductState) -> None:
+        with self._lock:
+            self._entries[(db_path, source)] = _CachedState(event_id, hashes, state)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+# Compartido por todos los ciclos del proceso
+state_cache = StateCache()
+
+# Camino que tomo un ciclo para una fuente (se cuenta en monitor_runs / counters)
+OUTCOME_NOT_MODIFIED = "not_modified"      # el servidor respondio 304
+OUTCOME_UNCHANGED_BODY = "unchanged_body"  # mismo sha256 del cuerpo: no se parsea
+OUTCOME_UNCHANGED = "unchanged"            # cuerpo distinto, mismos productos
+OUTCOME_CHANGED = "changed"
+OUTCOME_ERROR = "error"
+
+# Representacion del catalogo en memoria: dicts por producto o columnas (ColumnarState)
+STATE_DICT = "dict"
+STATE_COLUMNAR = "columnar"
+
+class RunTimings:
+    """Milisegundos por fase de un ciclo (ver RUN_PHASES) y productos parseados."""
+
+    def __init__(self) -> None:
+        self.phases: Dict[str, float] = {}
+        self.products = 0
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+def run_monitor(source_url: str, db_path: str,
+                storage_mode: str = "full", keyframe_interval: int = 50,
+                snapshot_codec: str = "zlib", source: str = DEFAULT_SOURCE,
+                stream_threshold_bytes: int = DEFAULT_STREAM_THRESHOLD_BYTES,
+                state_format: str = STATE_DICT) -> dict:
     init_db(db_path)
+    started_iso = datetime.now(timezone.utc).isoformat()
+    started = time.perf_counter()
+
+    timings = RunTimings()
+    validators = get_fetch_state(db_path, source)
+    try:
+        with timings.phase("fetch"):
+            fetched = fetch_feed(source_url,
+                                 etag=validators["etag"] if validators else None,
+                                 last_modified=validators["last_modified"] if validators else None,
+                                 stream_threshold_bytes=stream_threshold_bytes)
+        result = _process_fetch(fetched, validators, db_path, source,
+                                storage_mode, keyframe_interval, snapshot_codec, timings, state_format)
+    except Exception:
+        _finish_run(db_path, source, started_iso, started, OUTCOME_ERROR, 0, timings)
+        raise
+    _finish_run(db_path, source, started_iso, started, result["outcome"], fetched.size, timings)
+    return result
+
+async def run_monitor_sources(settings: Settings, fetcher: AsyncFeedFetcher,
+                              sources: Optional[Sequence[Source]] = None) -> List[dict]:
+    """Descarga las fuentes en paralelo (todas, o solo `sources`) y registra los cambios de cada una.
+
+    Un error en una fuente no corta las demas: su resultado trae "error".
+    """
+    init_db(settings.db_path)
+
+    async def run_source(source: Source) -> dict:
+        started_iso = datetime.now(timezone.utc).isoformat()
+        started = time.perf_counter()
+        timings = RunTimings()
+        bytes_read = 0
+        try:
+            validators = get_fetch_state(settings.db_path, source.name)
+            with timings.phase("fetch"):
+                fetched = await fetcher.fetch(source.url,
+                                              etag=validators["etag"] if validators else None,
+                                              last_modified=validators["last_modified"] if validators else None)
+            bytes_read = fetched.size
+            # parseo, diff y escritura fuera del event loop para no frenar las otras descargas
+            result = await asyncio.to_thread(
+                _process_fetch, fetched, validators, settings.db_path, source.name,
+                settings.storage_mode, settings.keyframe_interval, settings.snapshot_codec, timings,
+                settings.state_format,
+            )
+        except Exception as e:
+            logger.exception("Monitor run failed for source %s", source.name)
+            result = {"source": source.name, "changed": False, "outcome": OUTCOME_ERROR,
+                      "added": [], "removed": [], "updated": [], "error": str(e)}
+        _finish_run(settings.db_path, source.name, started_iso, started, result["outcome"], bytes_read, timings)
+        return result
+
+    return list(await asyncio.gather(*(run_source(s) for s in (settings.sources if sources is None else sources))))
+
+def _finish_run(db_path: str, source: str, started_iso: str, started: float,
+                outcome: str, bytes_read: int, timings: RunTimings) -> None:
+    duration_ms = (time.perf_counter() - started) * 1000
+    logger.debug("Run timings | source=%s outcome=%s total_ms=%.1f phases=%s",
+                 source, outcome, duration_ms, timings.phases)
+    try:
+        record_run(db_path, source, started_iso, outcome, bytes_read, duration_ms=duration_ms,
+                   phases=timings.phases, products=timings.products)
+    except Exception:
+        logger.exception("Could not record monitor run for source %s", source)
+
+def _unchanged(source: str, outcome: str) -> dict:
+    return {"source": source, "changed": False, "outcome": outcome,
+            "added": [], "removed": [], "updated": []}
+
+def _process_fetch(fetched: FetchResult, validators: Optional[FetchState], db_path: str, source: str,
+                   storage_mode: str, keyframe_interval: int, snapshot_codec: str,
+                   timings: Optional[RunTimings] = None, state_format: str = STATE_DICT) -> dict:
+    """Corta el ciclo lo antes posible: un 304 o un cuerpo con el mismo sha256
+    que el ultimo procesado terminan aqui, sin parsear JSON ni leer el estado."""
+    if fetched.not_modified:
+        return _unchanged(source, OUTCOME_NOT_MODIFIED)
 
-    payload = fetch_json(source_url)
-    current_state = extract_products(payload)
+    timings = timings or RunTimings()
+    now_iso = datetime.now(timezone.utc).isoformat()
+    try:
+        if validators is not None and fetched.body_hash == validators["body_hash"]:
+            result = _unchanged(source, OUTCOME_UNCHANGED_BODY)
+        else:
+            # Feeds grandes: los productos se leen de a uno desde el archivo temporal
+            with timings.phase("parse"):
+                if state_format == STATE_COLUMNAR:
+                    current_state = ColumnarState.from_products(fetched.iter_products())
+                else:
+                    current_state = build_product_state(fetched.iter_products())
+            timings.products = len(current_state)
+            result = _record_state(current_state, db_path, source,
+                                   storage_mode, keyframe_interval, snapshot_codec, timings)
+            result["outcome"] = OUTCOME_CHANGED if result["changed"] else OUTCOME_UNCHANGED
+    finally:
+        fetched.close()
 
-    prev_state_json: Optional[str] = get_last_state_json(db_path)
-    previous_state: ProductState = json.loads(prev_state_json) if prev_state_json else {}
+    # Los validadores se guardan despues de procesar el cuerpo: si algo falla,
+    # el proximo ciclo vuelve a descargarlo completo
+    with timings.phase("write"):
+        save_fetch_state(db_path, fetched.etag, fetched.last_modified, fetched.body_hash, now_iso, source=source)
+    return result
+
+def run_monitor_all(settings: Settings) -> List[dict]:
+    """Un solo ciclo sobre todas las fuentes (modo "run")."""
+    async def run() -> List[dict]:
+        fetcher = AsyncFeedFetcher(concurrency=settings.fetch_concurrency,
+                                   stream_threshold_bytes=settings.stream_threshold_bytes)
+        try:
+            return await run_monitor_sources(settings, fetcher)
+        finally:
+            await fetcher.aclose()
+
+    return asyncio.run(run())
 
-    added, removed, updated = diff_products(previous_state, current_state)
+def _record_state(current_state: ProductState, db_path: str, source: str,
+                  storage_mode: str, keyframe_interval: int, snapshot_codec: str,
+                  timings: Optional[RunTimings] = None) -> dict:
+    timings = timings or RunTimings()
+    with timings.phase("load"):
+        previous_state, previous_hashes = state_cache.previous(db_path, source,
+                                                               columnar=isinstance(current_state, ColumnarState))
+
+    # Hash por buckets: misma raiz es mismo catalogo, y el diff solo mira los buckets que cambiaron.
+    # Se mantiene la cantidad de buckets del estado anterior mientras el tamano del catalogo la justifique
+    with timings.phase("hash"):
+        hashes = hash_state(current_state, bucket_count(len(current_state), previous_hashes.count))
+    with timings.phase("diff"):
+        added, removed, updated = diff_buckets(previous_state, previous_hashes, current_state, hashes)
     changed = bool(added or removed or updated)
 
     result = {
+        "source": source,
         "changed": changed,
         "added": added,
         "removed": removed,
@@ -35,10 +276,117 @@ def run_monitor(source_url: str, db_path: str) -> dict:
 
     if changed:
         now_iso = datetime.now(timezone.utc).isoformat()
-        current_hash = compute_state_hash(current_state)
-        state_json = json.dumps(current_state, sort_keys=True, separators=(",", ":"))
+        current_hash = hashes.root
+
+        with timings.phase("write"):
+            # El catalogo completo solo se serializa cuando el evento es un keyframe
+            state_json: Optional[str] = None
+            delta_json: Optional[str] = None
+            since = count_since_keyframe(db_path, source) if storage_mode == STORAGE_DELTA else None
+            if since is not None and since + 1 < keyframe_interval:
+                delta = make_delta(current_state, added, removed, updated)
+                delta_json = json.dumps(delta, sort_keys=True, separators=(",", ":"))
+            else:
+                state_json = serialize_state(current_state)
 
-        upsert_hash(db_path, current_hash, now_iso)
-        insert_event(db_path, current_hash, state_json, now_iso)
+            upsert_hash(db_path, current_hash, now_iso, source=source)
+            event_id = insert_event(db_path, current_hash, state_json, now_iso,
+                                    added_count=len(added),
+                                    removed_count=len(removed),
+                                    updated_count=len(updated),
+                                    delta_json=delta_json,
+                                    codec=snapshot_codec,
+                                    source=source,
+                                    changes=product_changes(previous_state, added, removed, updated),
+                                    bucket_hashes=pack_buckets(hashes.buckets))
+        state_cache.store(db_path, source, event_id, hashes, current_state)
 
     return result
+
+def recent_change_times(db_path: str, source: str, limit: int = 20) -> List[float]:
+    """Momentos (epoch) de los ultimos cambios registrados de una fuente, en orden."""
+    init_db(db_path)
+    return [datetime.fromisoformat(t).timestamp() for t in list_event_times(db_path, source, limit)]
+
+def backfill_metrics(db_path: str) -> int:
+    init_db(db_path)
+    return backfill_event_counts(db_path)
+
+def index_products(db_path: str) -> int:
+    init_db(db_path)
+    return index_product_changes(db_path)
+
+def migrate_storage(db_path: str, storage_mode: str, keyframe_interval: int,
+                    snapshot_codec: str = "zlib") -> int:
+    init_db(db_path)
+    written = migrate_event_storage(db_path, storage_mode, keyframe_interval, codec=snapshot_codec)
+    vacuum(db_path)
+    return written
+
+class RebuildStatus(NamedTuple):
+    last_event_id: int
+    target_id: int
+    # Eventos recalculados en esta corrida (sin contar los de una corrida cortada)
+    events: int
+    elapsed_seconds: float
+
+def rebuild_history(db_path: str, workers: Optional[int] = None, chunk_size: int = 500, restart: bool = False,
+                    progress: Optional[Callable[[RebuildStatus], None]] = None) -> RebuildStatus:
+    """Recalcula contadores, diffs, products, totales y rollups de toda la historia.
+
+    El rango de ids se parte en tramos de chunk_size ids que un pool de procesos
+    reconstruye y diffea en paralelo; este proceso los escribe en orden, un tramo
+    por transaccion, y guarda hasta donde llego. Si se corta, la proxima llamada
+    sigue desde el ultimo tramo escrito (restart=True empieza de nuevo).
+    """
+    init_db(db_path)
+    run = start_rebuild(db_path, restart=restart)
+    target_id, resume_id = run["target_id"], run["last_event_id"]
+    if resume_id:
+        logger.info("Resuming rebuild | after event=%s target=%s", resume_id, target_id)
+    chunks = ((lo, min(lo + chunk_size - 1, target_id)) for lo in range(resume_id + 1, target_id + 1, chunk_size))
+    started = time.perf_counter()
+    status = RebuildStatus(resume_id, target_id, 0, 0.0)
+
+    # multiprocessing solo se importa aca: "run" no lo necesita
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Pocos tramos en vuelo: los resultados no se acumulan si la escritura va mas lenta
+        pending: Deque[Tuple[int, "Future[list]"]] = deque()
+
+        def submit() -> None:
+            nxt = next(chunks, None)
+            if nxt is not None:
+                lo, hi = nxt
+                pending.append((hi, pool.submit(diff_event_range, db_path, lo, hi)))
+
+        for _ in range(2 * workers):
+            submit()
+        while pending:
+            hi, future = pending.popleft()
+            events = future.result()
+            submit()
+            write_rebuilt_events(db_path, events, hi)
+            status = RebuildStatus(hi, target_id, status.events + len(events), time.perf_counter() - started)
+            if progress is not None:
+                progress(status)
+
+    finish_rebuild(db_path, target_id)
+    return status._replace(elapsed_seconds=time.perf_counter() - started)
+
+def compact_history(db_path: str, keep_all_days: int, daily_days: int, archive_dir: str,
+                    snapshot_codec: str = "zlib", now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Retencion: todo por keep_all_days, despues un catalogo por dia hasta
+    daily_days y de ahi en mas solo los diffs. Lo que se borra queda en archive_dir."""
+    now = now or datetime.now(timezone.utc)
+    archive = EventArchive(archive_dir, now)
+    stats = compact_events(db_path,
+                           keep_all_before=(now - timedelta(days=keep_all_days)).isoformat(),
+                           daily_before=(now - timedelta(days=daily_days)).isoformat(),
+                           archive=archive, codec=snapshot_codec)
+    # Los detalles guardados en este proceso pueden ser de eventos que se acaban de reescribir
+    clear_event_cache()
+    full_vacuum = incremental_vacuum(db_path)
+    return {**stats, "archived_files": sorted(archive.files.values()), "full_vacuum": full_vacuum}
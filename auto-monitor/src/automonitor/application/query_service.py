@@ -1,19 +1,30 @@
 from __future__ import annotations;
-import json;
-from typing import List, TypedDict;
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Tuple, TypedDict;
 
-from ..domain.models import ProductState, ProductSummary
+from ..domain.models import ProductChange, ProductState, ProductSummary
 from ..domain.diff import diff_products
-from ..infrastructure.sqlite_repo import list_events, get_event_by_id, get_previous_event, get_latest_event, count_events, get_overview_metrics, EventRow
+from ..infrastructure.compression import gzip_stream
+from ..infrastructure.sqlite_repo import STORAGE_PRUNED, list_events, list_events_before, list_events_after, get_event_by_id, get_previous_event, get_latest_event, get_event_state, get_event_changes, count_events, get_overview_metrics, get_run_stats, list_sources, get_product, list_product_history, list_products_changed_since, list_runs, list_counters, count_notifications, iter_events_export, list_rollups, get_event_change_counts, list_event_changes, ROLLUP_BUCKETS, EventRow, RunRow, ProductRow, ProductHistoryRow, RollupRow, EventChangeCounts
 
 class EventSummary(TypedDict):
     id: int
+    source: str
     hash: str
+    hash_algo: str
     created_at: str
+    added: Optional[int]
+    removed: Optional[int]
+    updated: Optional[int]
 
 class EventDetail(TypedDict):
     id: int
+    source: str
     hash: str
+    hash_algo: str
     created_at: str
     added: List[ProductSummary]
     removed: List[ProductSummary]
@@ -25,60 +36,302 @@ class PagedEvents(TypedDict):
     total_count: int
     limit: int
     offset: int
+    next_before_id: Optional[int]
 
-def list_event_summaries(db_path: str, limit: int = 50, offset: int = 0) -> List[EventSummary]:
-    rows = list_events(db_path, limit = limit, offset = offset);
-    return [{
-        "id": r["id"],
-        "hash": r["hash"],
-        "created_at": r["created_at"]
-    } for r in rows ];
+def _to_summary(row: EventRow) -> EventSummary:
+    return {
+        "id": row["id"],
+        "source": row["source"],
+        "hash": row["hash"],
+        "hash_algo": row["hash_algo"],
+        "created_at": row["created_at"],
+        "added": row["added_count"],
+        "removed": row["removed_count"],
+        "updated": row["updated_count"],
+    }
+
+def list_event_summaries(db_path: str, limit: int = 50, offset: int = 0,
+                         source: Optional[str] = None) -> List[EventSummary]:
+    rows = list_events(db_path, limit = limit, offset = offset, source = source);
+    return [_to_summary(r) for r in rows ];
 
 # CANTIDAD TOTAL DE EVENTS, SIN IMPORTAR LIMIT O OFFSET
-def list_event_summaries_paged(db_path: str, limit: int = 50, offset: int = 0) -> PagedEvents:
-    rows = list_events(db_path, limit = limit, offset = offset);
-    items: List[EventSummary] = [{
-        "id": r["id"],
-        "hash": r["hash"],
-        "created_at": r["created_at"]
-    } for r in rows ];
-    total = count_events(db_path);
+# Con before_id se pagina por cursor (offset se ignora); next_before_id es el cursor
+# de la pagina siguiente o None si ya no quedan eventos.
+def list_event_summaries_paged(db_path: str, limit: int = 50, offset: int = 0,
+                               before_id: Optional[int] = None,
+                               source: Optional[str] = None) -> PagedEvents:
+    if before_id is not None:
+        rows = list_events_before(db_path, before_id, limit = limit, source = source);
+        offset = 0
+    else:
+        rows = list_events(db_path, limit = limit, offset = offset, source = source);
+    items: List[EventSummary] = [_to_summary(r) for r in rows ];
+    total = count_events(db_path, source = source);
     return {
         "items": items,
         "total_count": total,
         "limit": limit,
-        "offset": offset
+        "offset": offset,
+        "next_before_id": items[-1]["id"] if len(items) == limit else None
     }
 
-def get_event_detail(db_path: str, event_id: int) -> EventDetail | None:
+def list_event_summaries_after(db_path: str, after_id: int, limit: int = 100,
+                               source: Optional[str] = None) -> List[EventSummary]:
+    """Eventos con id mayor a after_id, del mas viejo al mas nuevo."""
+    return [_to_summary(r) for r in list_events_after(db_path, after_id, limit=limit, source=source)];
+
+def get_latest_event_id(db_path: str) -> int:
+    latest = get_latest_event(db_path);
+    return latest["id"] if latest else 0;
+
+# (base, evento, storage, hash, con estado)
+_CacheKey = Tuple[str, int, str, str, bool]
+
+class _DetailCache:
+    """LRU de detalles de evento. La compactacion reescribe eventos viejos (su
+    "storage" pasa a snapshot o pruned y el catalogo puede dejar de estar) y
+    rebuild puede recalcular su hash, asi que la clave lleva storage y hash
+    leidos de la base: un evento reescrito por otro proceso no vuelve a encontrar
+    su entrada vieja. Los eventos inexistentes no se guardan."""
+
+    def __init__(self, max_entries: int) -> None:
+        self._entries: "OrderedDict[_CacheKey, EventDetail]" = OrderedDict()
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def get(self, key: _CacheKey) -> EventDetail | None:
+        with self._lock:
+            detail = self._entries.get(key)
+            if detail is not None:
+                self._entries.move_to_end(key)
+            return detail
+
+    def put(self, key: _CacheKey, detail: EventDetail) -> None:
+        with self._lock:
+            self._entries[key] = detail
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+# Cada detalle incluye el catalogo completo: pocas entradas alcanzan para los eventos "calientes"
+_detail_cache = _DetailCache(max_entries=32)
+
+def clear_event_cache() -> None:
+    """Vacia el LRU de detalles; lo llama compact_history despues de reescribir eventos."""
+    _detail_cache.clear()
+
+def get_event_detail(db_path: str, event_id: int, include_state: bool = True) -> EventDetail | None:
+    """Detalle de un evento. Con include_state=False no se reconstruye el catalogo
+    (si el diff esta guardado) y "state" queda vacio."""
+    # La fila se lee siempre (una busqueda por clave primaria): storage y hash son parte de la clave
     row = get_event_by_id(db_path, event_id);
     if not row:
         return None;
 
-    # Estado actual
-    current_state: ProductState = json.loads(row["state_json"]);
+    version = (row["storage"], row["hash"])
+    cached = _detail_cache.get((db_path, event_id, *version, True));
+    if cached is None and not include_state:
+        cached = _detail_cache.get((db_path, event_id, *version, False));
+    if cached is not None:
+        return cached;
 
-    # Estado previo para diff completo con limit = 8 (Telegram)
-    prev_row = get_previous_event(db_path, event_id);
-    previous_state: ProductState = json.loads(prev_row["state_json"]) if prev_row else {};
+    # El diff se guarda al escribir el evento; solo las bases sin indexar lo recalculan
+    changes = get_event_changes(db_path, event_id);
 
-    added, removed, updated = diff_products(previous_state, current_state);
+    # Estado actual (se reconstruye desde el keyframe si el evento es un delta)
+    current_state: ProductState = {};
+    if include_state or changes is None:
+        current_state = get_event_state(db_path, event_id) or {};
 
-    return {
+    if changes is not None:
+        added, removed, updated = changes["added"], changes["removed"], changes["updated"];
+    else:
+        prev_row = get_previous_event(db_path, event_id, row["source"]);
+        previous_state: ProductState = (get_event_state(db_path, prev_row["id"]) or {}) if prev_row else {};
+        added, removed, updated = diff_products(previous_state, current_state);
+
+    detail: EventDetail = {
         "id": row["id"],
+        "source": row["source"],
         "hash": row["hash"],
+        "hash_algo": row["hash_algo"],
         "created_at": row["created_at"],
         "added": added,
         "removed": removed,
         "updated": updated,
         "state": current_state
     }
+    _detail_cache.put((db_path, event_id, *version, include_state), detail);
+    return detail;
+
+CHANGE_KINDS = ("added", "removed", "updated")
+
+class EventChangesPage(TypedDict):
+    event_id: int
+    kind: Optional[str]
+    counts: EventChangeCounts
+    items: List[ProductChange]
+    limit: int
+    next_cursor: Optional[str]
+
+def get_event_changes_page(db_path: str, event_id: int, kind: Optional[str] = None,
+                           cursor: Optional[str] = None, limit: int = 100) -> EventChangesPage | None:
+    """Una pagina de los cambios de un evento (por id de producto), con los totales de cada tipo.
+
+    next_cursor es el id del ultimo producto de la pagina, o None si no quedan mas.
+    """
+    if kind is not None and kind not in CHANGE_KINDS:
+        raise ValueError(f"Unknown kind '{kind}'.");
+    counts = get_event_change_counts(db_path, event_id);
+    if counts is not None:
+        items = list_event_changes(db_path, event_id, kind, cursor, limit);
+    else:
+        # Evento sin diff indexado (base sin "index-products"): se pagina el diff recalculado
+        detail = get_event_detail(db_path, event_id, include_state=False);
+        if detail is None:
+            return None;
+        counts = {"added": len(detail["added"]), "removed": len(detail["removed"]), "updated": len(detail["updated"])};
+        previous = get_previous_event(db_path, event_id, detail["source"]);
+        old_state = (get_event_state(db_path, previous["id"]) or {}) if previous and detail["updated"] else {};
+        changes = [{**p, "kind": k, "old_title": None, "old_price": None}
+                   for k in CHANGE_KINDS if kind in (None, k) for p in detail[k]];  # type: ignore[literal-required]
+        changes.sort(key=lambda c: c["id"]);
+        items = [c for c in changes if cursor is None or c["id"] > cursor][:limit];  # type: ignore[misc]
+        for c in items:
+            if c["kind"] == "updated" and c["id"] in old_state:
+                c["old_title"], c["old_price"] = str(old_state[c["id"]]["title"]), float(old_state[c["id"]]["price"]);
+    return {
+        "event_id": event_id,
+        "kind": kind,
+        "counts": counts,
+        "items": items,
+        "limit": limit,
+        "next_cursor": items[-1]["id"] if len(items) == limit else None,
+    };
+
+# Campos que se pueden pedir con ?fields= en el detalle de un evento
+EVENT_DETAIL_FIELDS = ("id", "source", "hash", "hash_algo", "created_at", "added", "removed", "updated", "state")
+EVENT_DIFF_FIELDS = EVENT_DETAIL_FIELDS[:-1]
+
+def project_event_detail(detail: EventDetail, fields: Tuple[str, ...]) -> dict:
+    return {f: detail[f] for f in fields};  # type: ignore[literal-required]
 
-def get_latest_event_detail(db_path: str) -> EventDetail | None:
-    row = get_latest_event(db_path);
+def get_event_summary(db_path: str, event_id: int) -> EventSummary | None:
+    row = get_event_by_id(db_path, event_id);
+    return _to_summary(row) if row else None;
+
+def get_latest_event_summary(db_path: str, source: Optional[str] = None) -> EventSummary | None:
+    row = get_latest_event(db_path, source);
+    return _to_summary(row) if row else None;
+
+class EventVersion(TypedDict):
+    id: int
+    hash: str
+    storage: str
+
+def _to_version(row: EventRow) -> EventVersion:
+    return {"id": row["id"], "hash": row["hash"], "storage": row["storage"]}
+
+def get_event_version(db_path: str, event_id: int) -> EventVersion | None:
+    """Lo que identifica la representacion actual de un evento (para ETag y cache)."""
+    row = get_event_by_id(db_path, event_id);
+    return _to_version(row) if row else None;
+
+def get_latest_event_version(db_path: str, source: Optional[str] = None) -> EventVersion | None:
+    row = get_latest_event(db_path, source);
+    return _to_version(row) if row else None;
+
+def is_final_version(version: EventVersion) -> bool:
+    """Un evento pruned ya no lo toca la compactacion: su respuesta no cambia mas."""
+    return version["storage"] == STORAGE_PRUNED;
+
+def get_latest_event_detail(db_path: str, source: Optional[str] = None) -> EventDetail | None:
+    row = get_latest_event(db_path, source);
     if not row:
         return None;
     return get_event_detail(db_path, row["id"]);
 
 def get_metrics(db_path: str) -> dict:
     return get_overview_metrics(db_path);
+
+def get_sources(db_path: str) -> List[str]:
+    return list_sources(db_path);
+
+def get_runs_metrics(db_path: str) -> dict:
+    return {"runs": get_run_stats(db_path)};
+
+def export_events(db_path: str, since_id: int = 0, created_from: Optional[str] = None,
+                  created_to: Optional[str] = None, source: Optional[str] = None,
+                  include_state: bool = False, gzip: bool = False) -> Iterator[bytes]:
+    """Historia de eventos como NDJSON: una linea por evento con el resumen y el diff
+    (los mismos campos que /events/{id}), en orden de id y sin cargarla entera."""
+    lines = (json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+             for record in iter_events_export(db_path, since_id,
+                                              _normalize_timestamp(created_from) if created_from else None,
+                                              _normalize_timestamp(created_to) if created_to else None,
+                                              source, include_state));
+    return gzip_stream(lines) if gzip else lines;
+
+class ProductHistory(TypedDict):
+    product: ProductRow
+    items: List[ProductHistoryRow]
+
+class PagedProducts(TypedDict):
+    items: List[ProductRow]
+    limit: int
+    offset: int
+
+def _normalize_timestamp(value: str) -> str:
+    # Los eventos guardan created_at en ISO UTC; se compara en el mismo formato
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+def get_product_history(db_path: str, product_id: str, source: str, limit: int = 100) -> ProductHistory | None:
+    product = get_product(db_path, product_id, source);
+    if product is None:
+        return None;
+    return {"product": product, "items": list_product_history(db_path, product_id, source, limit)};
+
+def list_changed_products(db_path: str, changed_since: Optional[str] = None, limit: int = 50, offset: int = 0,
+                          source: Optional[str] = None) -> PagedProducts:
+    since = _normalize_timestamp(changed_since) if changed_since else None;
+    items = list_products_changed_since(db_path, since, limit = limit, offset = offset, source = source);
+    return {"items": items, "limit": limit, "offset": offset};
+
+class TimeSeries(TypedDict):
+    bucket: str
+    source: Optional[str]
+    items: List[RollupRow]
+    # False si algun bucket tiene eventos sin contadores (falta correr "backfill-metrics")
+    complete: bool
+
+def get_timeseries(db_path: str, bucket: str, created_from: Optional[str] = None,
+                   created_to: Optional[str] = None, source: Optional[str] = None) -> TimeSeries:
+    """Eventos y cambios por hora o por dia, leidos de metrics_rollups (nunca de los snapshots)."""
+    if bucket not in ROLLUP_BUCKETS:
+        raise ValueError(f"Unknown bucket '{bucket}'.");
+    since = _normalize_timestamp(created_from) if created_from else None;
+    until = _normalize_timestamp(created_to) if created_to else None;
+    items = list_rollups(db_path, bucket, since, until, source);
+    return {"bucket": bucket, "source": source, "items": items,
+            "complete": not any(item["uncounted"] for item in items)};
+
+class PagedRuns(TypedDict):
+    items: List[RunRow]
+    limit: int
+    next_before_id: Optional[int]
+
+def list_recent_runs(db_path: str, limit: int = 100, before_id: Optional[int] = None,
+                     source: Optional[str] = None) -> PagedRuns:
+    items = list_runs(db_path, limit = limit, before_id = before_id, source = source);
+    return {"items": items, "limit": limit, "next_before_id": items[-1]["id"] if len(items) == limit else None};
+
+def get_runtime_counters(db_path: str) -> dict:
+    return {"counters": list_counters(db_path), "notifications": count_notifications(db_path)};
@@ -1,30 +1,78 @@
 from dataclasses import dataclass
 import os
+import re
 from dotenv import load_dotenv
-from fastapi import FastAPI
 
 # Load environment variables from .env file
 
 load_dotenv();
 
+# Nombre de la fuente usado cuando solo se configura SOURCE_URL
+DEFAULT_SOURCE_NAME = "default"
+
+_SOURCE_NAME_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+@dataclass(frozen=True)
+class Source:
+    name: str
+    url: str
+
 @dataclass(frozen=True)
 class Settings:
     source_url: str
+    sources: tuple[Source, ...]
     db_path: str
     telegram_bot_token: str | None
     telegram_chat_id: str | None
+    telegram_api_base: str
     run_interval_seconds: int
+    schedule_mode: str
+    min_interval_seconds: int
+    max_interval_seconds: int
+    storage_mode: str
+    keyframe_interval: int
+    snapshot_codec: str
+    fetch_concurrency: int
+    stream_threshold_bytes: int
+    state_format: str
+    retention_keep_all_days: int
+    retention_daily_days: int
+    archive_dir: str
+    maintenance_interval_seconds: int
+    stream_poll_seconds: float
+
+def _parse_sources(raw: str) -> tuple[Source, ...]:
+    # SOURCES="proveedor_a=https://a/products.json;proveedor_b=https://b/products.json"
+    sources: list[Source] = []
+    for entry in raw.split(";"):
+        entry = entry.strip();
+        if not entry:
+            continue
+        name, sep, url = entry.partition("=");
+        name, url = name.strip(), url.strip();
+        if not sep or not url or not _SOURCE_NAME_RE.match(name):
+            raise ValueError(f"Invalid SOURCES entry '{entry}': expected name=url.");
+        if any(s.name == name for s in sources):
+            raise ValueError(f"Duplicated source name '{name}' in SOURCES.");
+        sources.append(Source(name=name, url=url))
+    return tuple(sources)
 
 def get_settings() -> Settings:
     source_url = os.getenv("SOURCE_URL", "").strip();
     db_path = os.getenv("DB_PATH", "automonitor.db").strip();
 
+    sources = _parse_sources(os.getenv("SOURCES", ""));
+    if not sources and source_url:
+        sources = (Source(name=DEFAULT_SOURCE_NAME, url=source_url),);
 
-    if not source_url:
-        raise ValueError("SOURCE_URL environment variable is not set or is empty.");
+    if not sources:
+        raise ValueError("SOURCE_URL or SOURCES environment variable must be set.");
+    source_url = source_url or sources[0].url;
 
     token = os.getenv("TELEGRAM_BOT_TOKEN");
     chat_id = os.getenv("TELEGRAM_CHAT_ID");
+    # Se puede apuntar a un servidor local que imite la API de Telegram
+    telegram_api_base = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org").strip();
 
     interval_raw = os.getenv("RUN_INTERVAL_SECONDS", "60").strip();
     try:
@@ -34,12 +82,120 @@ def get_settings() -> Settings:
     except ValueError as e:
         raise ValueError(f"Invalid RUN_INTERVAL_SECONDS = '{interval_raw}': {e}") from e;
 
+    # "adaptive": cada fuente se sondea segun su ritmo de cambios, entre MIN y MAX
+    schedule_mode = os.getenv("SCHEDULE_MODE", "fixed").strip().lower();
+    if schedule_mode not in ("fixed", "adaptive"):
+        raise ValueError(f"Invalid SCHEDULE_MODE = '{schedule_mode}': expected 'fixed' or 'adaptive'.");
+
+    min_interval_raw = os.getenv("MIN_INTERVAL_SECONDS", "30").strip();
+    try:
+        min_interval_seconds = int(min_interval_raw);
+        if min_interval_seconds < 10:
+            raise ValueError("MIN_INTERVAL_SECONDS must be at least 10 seconds.");
+    except ValueError as e:
+        raise ValueError(f"Invalid MIN_INTERVAL_SECONDS = '{min_interval_raw}': {e}") from e;
+
+    max_interval_raw = os.getenv("MAX_INTERVAL_SECONDS", "3600").strip();
+    try:
+        max_interval_seconds = int(max_interval_raw);
+        if max_interval_seconds < min_interval_seconds:
+            raise ValueError("MAX_INTERVAL_SECONDS must be at least MIN_INTERVAL_SECONDS.");
+    except ValueError as e:
+        raise ValueError(f"Invalid MAX_INTERVAL_SECONDS = '{max_interval_raw}': {e}") from e;
+
+    storage_mode = os.getenv("STORAGE_MODE", "full").strip().lower();
+    if storage_mode not in ("full", "delta"):
+        raise ValueError(f"Invalid STORAGE_MODE = '{storage_mode}': expected 'full' or 'delta'.");
+
+    keyframe_raw = os.getenv("KEYFRAME_INTERVAL", "50").strip();
+    try:
+        keyframe_interval = int(keyframe_raw);
+        if keyframe_interval < 1:
+            raise ValueError("KEYFRAME_INTERVAL must be at least 1.");
+    except ValueError as e:
+        raise ValueError(f"Invalid KEYFRAME_INTERVAL = '{keyframe_raw}': {e}") from e;
+
+    snapshot_codec = os.getenv("SNAPSHOT_CODEC", "zlib").strip().lower();
+    if snapshot_codec not in ("zlib", "lzma", "none"):
+        raise ValueError(f"Invalid SNAPSHOT_CODEC = '{snapshot_codec}': expected 'zlib', 'lzma' or 'none'.");
+
+    concurrency_raw = os.getenv("FETCH_CONCURRENCY", "8").strip();
+    try:
+        fetch_concurrency = int(concurrency_raw);
+        if fetch_concurrency < 1:
+            raise ValueError("FETCH_CONCURRENCY must be at least 1.");
+    except ValueError as e:
+        raise ValueError(f"Invalid FETCH_CONCURRENCY = '{concurrency_raw}': {e}") from e;
+
+    threshold_raw = os.getenv("STREAM_THRESHOLD_BYTES", "8388608").strip();
+    try:
+        stream_threshold_bytes = int(threshold_raw);
+        if stream_threshold_bytes < 0:
+            raise ValueError("STREAM_THRESHOLD_BYTES must be zero or greater.");
+    except ValueError as e:
+        raise ValueError(f"Invalid STREAM_THRESHOLD_BYTES = '{threshold_raw}': {e}") from e;
+
+    state_format = os.getenv("STATE_FORMAT", "dict").strip().lower();
+    if state_format not in ("dict", "columnar"):
+        raise ValueError(f"Invalid STATE_FORMAT = '{state_format}': expected 'dict' or 'columnar'.");
+
+    # Retencion: 0 deja la compactacion apagada
+    keep_all_raw = os.getenv("RETENTION_KEEP_ALL_DAYS", "0").strip();
+    try:
+        retention_keep_all_days = int(keep_all_raw);
+        if retention_keep_all_days < 0:
+            raise ValueError("RETENTION_KEEP_ALL_DAYS must be zero or greater.");
+    except ValueError as e:
+        raise ValueError(f"Invalid RETENTION_KEEP_ALL_DAYS = '{keep_all_raw}': {e}") from e;
+
+    daily_raw = os.getenv("RETENTION_DAILY_DAYS", "30").strip();
+    try:
+        retention_daily_days = int(daily_raw);
+        if retention_daily_days < retention_keep_all_days:
+            raise ValueError("RETENTION_DAILY_DAYS must be at least RETENTION_KEEP_ALL_DAYS.");
+    except ValueError as e:
+        raise ValueError(f"Invalid RETENTION_DAILY_DAYS = '{daily_raw}': {e}") from e;
+
+    archive_dir = os.getenv("ARCHIVE_DIR", "archive").strip();
+
+    maintenance_raw = os.getenv("MAINTENANCE_INTERVAL_SECONDS", "3600").strip();
+    try:
+        maintenance_interval_seconds = int(maintenance_raw);
+        if maintenance_interval_seconds < 60:
+            raise ValueError("MAINTENANCE_INTERVAL_SECONDS must be at least 60 seconds.");
+    except ValueError as e:
+        raise ValueError(f"Invalid MAINTENANCE_INTERVAL_SECONDS = '{maintenance_raw}': {e}") from e;
+
+    # Cada cuanto el API busca eventos nuevos para /events/stream
+    stream_poll_raw = os.getenv("STREAM_POLL_SECONDS", "1").strip();
+    try:
+        stream_poll_seconds = float(stream_poll_raw);
+        if stream_poll_seconds < 0.1:
+            raise ValueError("STREAM_POLL_SECONDS must be at least 0.1 seconds.");
+    except ValueError as e:
+        raise ValueError(f"Invalid STREAM_POLL_SECONDS = '{stream_poll_raw}': {e}") from e;
 
     return Settings(source_url=source_url, 
+                    sources=sources,
                     db_path=db_path,
                     telegram_bot_token=token.strip() if token else None,
                     telegram_chat_id=chat_id.strip() if chat_id else None,
-                    run_interval_seconds=interval
+                    telegram_api_base=telegram_api_base,
+                    run_interval_seconds=interval,
+                    schedule_mode=schedule_mode,
+                    min_interval_seconds=min_interval_seconds,
+                    max_interval_seconds=max_interval_seconds,
+                    storage_mode=storage_mode,
+                    keyframe_interval=keyframe_interval,
+                    snapshot_codec=snapshot_codec,
+                    fetch_concurrency=fetch_concurrency,
+                    stream_threshold_bytes=stream_threshold_bytes,
+                    state_format=state_format,
+                    retention_keep_all_days=retention_keep_all_days,
+                    retention_daily_days=retention_daily_days,
+                    archive_dir=archive_dir,
+                    maintenance_interval_seconds=maintenance_interval_seconds,
+                    stream_poll_seconds=stream_poll_seconds
                 );
 
 
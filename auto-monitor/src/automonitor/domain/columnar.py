@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import math
+from array import array
+from bisect import bisect_left
+from itertools import compress
+from json.encoder import encode_basestring_ascii
+from operator import ne, or_
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from .models import ProductState, ProductSummary, same_price
+
+class ColumnarState:
+    """Estado de productos en columnas: ids ordenados y titulos/precios paralelos.
+
+    Equivale a un ProductState ({id: {"title", "price"}}) pero sin un dict por
+    producto: los precios van en un array("d") y los ids y titulos en listas.
+    Se lee como un mapping (`state[pid]`, `len`, `in`, iteracion por id en orden),
+    asi que make_delta y product_changes lo aceptan igual que a un dict.
+    """
+
+    __slots__ = ("ids", "titles", "prices")
+
+    def __init__(self, ids: List[str], titles: List[str], prices: "array[float]") -> None:
+        self.ids = ids
+        self.titles = titles
+        self.prices = prices
+
+    @classmethod
+    def from_products(cls, products: Iterable[Dict[str, Any]]) -> "ColumnarState":
+        """Arma el estado desde los productos del feed (sirve para un generador).
+
+        Con ids repetidos gana el ultimo, igual que en build_product_state.
+        """
+        ids: List[str] = []
+        titles: List[str] = []
+        prices: "array[float]" = array("d")
+        for p in products:
+            ids.append(str(p["id"]))
+            titles.append(str(p["title"]))
+            prices.append(float(p["price"]))
+        return cls._sorted(ids, titles, prices)
+
+    @classmethod
+    def from_state(cls, state: ProductState) -> "ColumnarState":
+        if isinstance(state, ColumnarState):
+            return state
+        ids = sorted(state)
+        return cls(ids, [str(state[pid]["title"]) for pid in ids],
+                   array("d", (float(state[pid]["price"]) for pid in ids)))
+
+    @classmethod
+    def _sorted(cls, ids: List[str], titles: List[str], prices: "array[float]") -> "ColumnarState":
+        if all(ids[i] < ids[i + 1] for i in range(len(ids) - 1)):
+            return cls(ids, titles, prices)
+        # sorted es estable: entre ids iguales el ultimo del feed queda al final del grupo
+        order = sorted(range(len(ids)), key=ids.__getitem__)
+        keep = [k for n, k in enumerate(order) if n + 1 == len(order) or ids[order[n + 1]] != ids[k]]
+        return cls([ids[k] for k in keep], [titles[k] for k in keep], array("d", (prices[k] for k in keep)))
+
+    def to_state(self) -> ProductState:
+        return {pid: {"title": t, "price": p} for pid, t, p in zip(self.ids, self.titles, self.prices)}
+
+    def _index(self, pid: str) -> int:
+        i = bisect_left(self.ids, pid)
+        if i == len(self.ids) or self.ids[i] != pid:
+            raise KeyError(pid)
+        return i
+
+    def __getitem__(self, pid: str) -> Dict[str, Any]:
+        i = self._index(pid)
+        return {"title": self.titles[i], "price": self.prices[i]}
+
+    def __contains__(self, pid: object) -> bool:
+        try:
+            self._index(pid)  # type: ignore[arg-type]
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.ids)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ColumnarState):
+            return self.ids == other.ids and self.titles == other.titles and self.prices == other.prices
+        if isinstance(other, dict):
+            return self.to_state() == other
+        return NotImplemented
+
+    def to_json(self) -> str:
+        """Mismo texto que serialize_state(self.to_state()), sin armar los dicts."""
+        return "{" + ",".join(
+            f'{encode_basestring_ascii(pid)}:{{"price":{_float_json(p)},"title":{encode_basestring_ascii(t)}}}'
+            for pid, t, p in zip(self.ids, self.titles, self.prices)
+        ) + "}"
+
+def _float_json(value: float) -> str:
+    # Igual que json.dumps: repr para los finitos, NaN/Infinity para el resto
+    if math.isfinite(value):
+        return float.__repr__(value)
+    if math.isnan(value):
+        return "NaN"
+    return "Infinity" if value > 0 else "-Infinity"
+
+def _summary(state: ColumnarState, i: int) -> ProductSummary:
+    return {"id": state.ids[i], "title": state.titles[i], "price": state.prices[i]}
+
+def diff_columnar(
+    old: ColumnarState,
+    new: ColumnarState,
+) -> Tuple[List[ProductSummary], List[ProductSummary], List[ProductSummary]]:
+    """Mismo resultado que diff_products sobre los estados en columnas.
+
+    Con los mismos ids en los dos lados (solo cambiaron precios o titulos, el caso
+    comun) las columnas ya estan alineadas y se comparan enteras: array == array y
+    list == list en C y, si difieren, un map(ne) marca las posiciones distintas sin
+    un paso de Python por producto. Si cambiaron los ids se usa el merge-join.
+    """
+    if old.ids != new.ids:
+        return _merge_join(old, new)
+    if old.prices == new.prices and old.titles == new.titles:
+        return [], [], []
+    updated: List[ProductSummary] = []
+    differs = map(or_, map(ne, old.prices, new.prices), map(ne, old.titles, new.titles))
+    for i in compress(range(len(new.ids)), differs):
+        # Un precio NaN que sigue siendo NaN no es un cambio (como en diff_products)
+        if old.titles[i] != new.titles[i] or not same_price(old.prices[i], new.prices[i]):
+            updated.append(_summary(new, i))
+    return [], [], updated
+
+def _merge_join(
+    old: ColumnarState,
+    new: ColumnarState,
+) -> Tuple[List[ProductSummary], List[ProductSummary], List[ProductSummary]]:
+    """Ids distintos en cada lado: una sola pasada sobre los ids ordenados, sin sets ni sorts."""
+    added: List[ProductSummary] = []
+    removed: List[ProductSummary] = []
+    updated: List[ProductSummary] = []
+    old_ids, new_ids = old.ids, new.ids
+    old_titles, new_titles = old.titles, new.titles
+    old_prices, new_prices = old.prices, new.prices
+    i = j = 0
+    n_old, n_new = len(old_ids), len(new_ids)
+    while i < n_old and j < n_new:
+        a, b = old_ids[i], new_ids[j]
+        if a == b:
+            op, np_ = old_prices[i], new_prices[j]
+            # Un precio NaN que sigue siendo NaN no es un cambio (como en diff_products)
+            if (op != np_ and (op == op or np_ == np_)) or old_titles[i] != new_titles[j]:
+                updated.append(_summary(new, j))
+            i += 1
+            j += 1
+        elif a < b:
+            removed.append(_summary(old, i))
+            i += 1
+        else:
+            added.append(_summary(new, j))
+            j += 1
+    removed.extend(_summary(old, k) for k in range(i, n_old))
+    added.extend(_summary(new, k) for k in range(j, n_new))
+    return added, removed, updated
@@ -4,12 +4,17 @@ import hashlib
 import json
 from typing import List, Tuple
 
-from .models import ProductState, ProductSummary
+from .columnar import ColumnarState, diff_columnar
+from .models import ProductChange, ProductDelta, ProductState, ProductSummary, same_product
 
 def diff_products(
     old: ProductState,
     new: ProductState,
 ) -> Tuple[List[ProductSummary], List[ProductSummary], List[ProductSummary]]:
+    # Con un estado en columnas se usa el merge-join; los dicts siguen este camino (el de referencia)
+    if isinstance(old, ColumnarState) or isinstance(new, ColumnarState):
+        return diff_columnar(ColumnarState.from_state(old), ColumnarState.from_state(new))
+
     old_ids = set(old.keys())
     new_ids = set(new.keys())
 
@@ -28,13 +33,58 @@ def diff_products(
 
     updated: List[ProductSummary] = []
     for pid in sorted(old_ids & new_ids):
-        if old[pid] != new[pid]:
+        if old[pid] != new[pid] and not same_product(old[pid], new[pid]):
             updated.append(
                 {"id": pid, "title": str(new[pid]["title"]), "price": float(new[pid]["price"])}
             )
 
     return added, removed, updated
 
+def product_changes(
+    old: ProductState,
+    added: List[ProductSummary],
+    removed: List[ProductSummary],
+    updated: List[ProductSummary],
+) -> List[ProductChange]:
+    """Aplana el resultado de diff_products; en "updated" agrega titulo y precio anteriores."""
+    changes: List[ProductChange] = []
+    for kind, items in (("added", added), ("removed", removed)):
+        changes.extend({"id": p["id"], "kind": kind, "title": p["title"], "price": p["price"],
+                        "old_title": None, "old_price": None} for p in items)
+    for p in updated:
+        before = old[p["id"]]
+        changes.append({"id": p["id"], "kind": "updated", "title": p["title"], "price": p["price"],
+                        "old_title": str(before["title"]), "old_price": float(before["price"])})
+    return changes
+
+def serialize_state(state: ProductState) -> str:
+    if isinstance(state, ColumnarState):
+        return state.to_json()
+    return json.dumps(state, sort_keys=True, separators=(",", ":"))
+
+def hash_serialized_state(state_json: str) -> str:
+    return hashlib.sha256(state_json.encode("utf-8")).hexdigest()
+
 def compute_state_hash(state: ProductState) -> str:
-    normalized = json.dumps(state, sort_keys=True, separators=(",", ":")).encode("utf-8")
-    return hashlib.sha256(normalized).hexdigest()
+    return hash_serialized_state(serialize_state(state))
+
+def make_delta(
+    new: ProductState,
+    added: List[ProductSummary],
+    removed: List[ProductSummary],
+    updated: List[ProductSummary],
+) -> ProductDelta:
+    return {
+        "added": {p["id"]: new[p["id"]] for p in added},
+        "removed": [p["id"] for p in removed],
+        "updated": {p["id"]: new[p["id"]] for p in updated},
+    }
+
+def apply_delta(state: ProductState, delta: ProductDelta) -> ProductState:
+    # Devuelve un estado nuevo: quien llama puede seguir usando el anterior
+    result: ProductState = dict(state)
+    for pid in delta["removed"]:
+        result.pop(pid, None)
+    result.update(delta["added"])
+    result.update(delta["updated"])
+    return result
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import hashlib
+import struct
+import zlib
+from typing import Iterator, List, Optional, Set, Tuple
+
+from .columnar import ColumnarState
+from .diff import diff_products
+from .models import ProductState, ProductSummary, same_price
+
+# Hash jerarquico del catalogo: cada producto cae en un bucket segun su id, cada
+# bucket tiene un hash y la raiz es el hash de los hashes de los buckets. Dos
+# estados con la misma raiz son iguales; si difieren, solo hace falta comparar
+# los productos de los buckets cuyo hash cambio.
+#
+# El hash de un bucket es la suma (mod 2^64) de los hashes de sus productos, asi
+# no depende del orden en que se recorren y no hay que ordenar nada para calcularlo.
+#
+# La cantidad de buckets crece con el catalogo (potencias de 2, ~PRODUCTS_PER_BUCKET
+# productos en cada uno) y queda guardada con el evento: son 8 bytes por bucket, asi
+# que el largo de bucket_hashes la fija. Con 256 buckets fijos un cambio del 1% de un
+# catalogo de 200k productos tocaba todos los buckets.
+
+PRODUCTS_PER_BUCKET = 64
+MIN_BUCKETS = 256
+MAX_BUCKETS = 1 << 16
+# Si cambio mas que esta fraccion de los buckets, el diff por bucket no ahorra nada
+FULL_DIFF_RATIO = 0.5
+_DIGEST_SIZE = 8
+_MASK = (1 << (8 * _DIGEST_SIZE)) - 1
+_LENGTH = struct.Struct("<I").pack
+_PRICE = struct.Struct("<d").pack
+
+class StateHashes:
+    """Hashes por bucket de un estado y, si se calcularon, los ids de cada bucket."""
+
+    __slots__ = ("buckets", "members", "root")
+
+    def __init__(self, buckets: List[int], members: Optional[List[List[str]]] = None) -> None:
+        self.buckets = buckets
+        self.members = members
+        self.root = hashlib.blake2b(pack_buckets(buckets), digest_size=32).hexdigest()
+
+    @property
+    def count(self) -> int:
+        return len(self.buckets)
+
+def _valid_count(count: int) -> bool:
+    return MIN_BUCKETS <= count <= MAX_BUCKETS and count & (count - 1) == 0
+
+def bucket_count(products: int, current: Optional[int] = None) -> int:
+    """Cantidad de buckets para un catalogo de `products` productos.
+
+    `current` (la cantidad del estado anterior) se conserva mientras cada bucket
+    tenga entre un cuarto y cuatro veces PRODUCTS_PER_BUCKET: un catalogo que
+    oscila alrededor de un limite no cambia de cantidad en cada ciclo, y los
+    hashes de dos estados solo se comparan si tienen la misma.
+    """
+    if current is not None and _valid_count(current):
+        per_bucket = products / current
+        if ((per_bucket >= PRODUCTS_PER_BUCKET / 4 or current == MIN_BUCKETS)
+                and (per_bucket <= PRODUCTS_PER_BUCKET * 4 or current == MAX_BUCKETS)):
+            return current
+    count = MIN_BUCKETS
+    while count < MAX_BUCKETS and count * PRODUCTS_PER_BUCKET < products:
+        count *= 2
+    return count
+
+def bucket_of(pid: str, count: int) -> int:
+    return zlib.crc32(pid.encode("utf-8")) % count
+
+def _items(state: ProductState) -> Iterator[Tuple[str, object, object]]:
+    if isinstance(state, ColumnarState):
+        return zip(state.ids, state.titles, state.prices)
+    return ((pid, p["title"], p["price"]) for pid, p in state.items())
+
+def hash_state(state: ProductState, count: Optional[int] = None) -> StateHashes:
+    """Hashes por bucket del estado; sin `count`, la cantidad que le toca por su tamano."""
+    count = count or bucket_count(len(state))
+    buckets = [0] * count
+    members: List[List[str]] = [[] for _ in range(count)]
+    crc32, blake2b, from_bytes = zlib.crc32, hashlib.blake2b, int.from_bytes
+    for pid, title, price in _items(state):
+        raw_id = pid.encode("utf-8")
+        b = crc32(raw_id) % count
+        # Largo del id adelante y precio de largo fijo al final: no hay ambiguedad entre campos
+        data = _LENGTH(len(raw_id)) + raw_id + str(title).encode("utf-8") + _PRICE(float(price))  # type: ignore[arg-type]
+        buckets[b] = (buckets[b] + from_bytes(blake2b(data, digest_size=_DIGEST_SIZE).digest(), "big")) & _MASK
+        members[b].append(pid)
+    return StateHashes(buckets, members)
+
+def pack_buckets(buckets: List[int]) -> bytes:
+    return b"".join(h.to_bytes(_DIGEST_SIZE, "big") for h in buckets)
+
+def unpack_buckets(data: bytes) -> Optional[StateHashes]:
+    """StateHashes guardado con un evento (sin los ids de cada bucket); None si no es valido."""
+    if not data or len(data) % _DIGEST_SIZE or not _valid_count(len(data) // _DIGEST_SIZE):
+        return None
+    return StateHashes([int.from_bytes(data[i:i + _DIGEST_SIZE], "big")
+                        for i in range(0, len(data), _DIGEST_SIZE)])
+
+def changed_buckets(old: StateHashes, new: StateHashes) -> List[int]:
+    # Solo tiene sentido con la misma cantidad de buckets (ver diff_buckets)
+    return [b for b, (x, y) in enumerate(zip(old.buckets, new.buckets)) if x != y]
+
+def _members(state: ProductState, hashes: StateHashes, wanted: Set[int]) -> List[List[str]]:
+    if hashes.members is not None:
+        return hashes.members
+    # Hashes leidos de la base: se reparten los ids una vez, sin volver a hashear productos
+    members: List[List[str]] = [[] for _ in range(hashes.count)]
+    for pid in state:
+        b = bucket_of(pid, hashes.count)
+        if b in wanted:
+            members[b].append(pid)
+    return members
+
+def diff_buckets(
+    old: ProductState,
+    old_hashes: StateHashes,
+    new: ProductState,
+    new_hashes: StateHashes,
+) -> Tuple[List[ProductSummary], List[ProductSummary], List[ProductSummary]]:
+    """Mismo resultado que diff_products, comparando solo los buckets cuyo hash cambio.
+
+    Con distinta cantidad de buckets (el catalogo cambio de escala) o con mas de
+    FULL_DIFF_RATIO de los buckets cambiados se compara el estado completo.
+    """
+    if old_hashes.count != new_hashes.count:
+        return diff_products(old, new)
+    changed = changed_buckets(old_hashes, new_hashes)
+    if not changed:
+        return [], [], []
+    if len(changed) > new_hashes.count * FULL_DIFF_RATIO:
+        return diff_products(old, new)
+    wanted = set(changed)
+    old_members = _members(old, old_hashes, wanted)
+    new_members = _members(new, new_hashes, wanted)
+
+    added: List[ProductSummary] = []
+    removed: List[ProductSummary] = []
+    updated: List[ProductSummary] = []
+    for b in changed:
+        old_ids = set(old_members[b])
+        new_ids = set(new_members[b])
+        for pid in new_ids - old_ids:
+            p = new[pid]
+            added.append({"id": pid, "title": str(p["title"]), "price": float(p["price"])})
+        for pid in old_ids - new_ids:
+            p = old[pid]
+            removed.append({"id": pid, "title": str(p["title"]), "price": float(p["price"])})
+        for pid in old_ids & new_ids:
+            before, after = old[pid], new[pid]
+            if before["title"] != after["title"] or not same_price(before["price"], after["price"]):
+                updated.append({"id": pid, "title": str(after["title"]), "price": float(after["price"])})
+
+    def by_id(p: ProductSummary) -> str:
+        return p["id"]
+    return sorted(added, key=by_id), sorted(removed, key=by_id), sorted(updated, key=by_id)
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Any, Dict, TypedDict
+from typing import Any, Dict, Iterable, List, Optional, TypedDict
 
 class ProductSummary(TypedDict):
     id: str
@@ -9,8 +9,32 @@ class ProductSummary(TypedDict):
 
 ProductState = Dict[str, Dict[str, str | float]]
 
+class ProductDelta(TypedDict):
+    added: ProductState
+    removed: List[str]
+    updated: ProductState
+
+# Cambio de un producto en un evento; old_* solo se completa en "updated"
+class ProductChange(TypedDict):
+    id: str
+    kind: str
+    title: str
+    price: float
+    old_title: Optional[str]
+    old_price: Optional[float]
+
+def same_price(a: float, b: float) -> bool:
+    # NaN != NaN: un precio que sigue siendo NaN no cuenta como cambio (el hash tampoco lo ve)
+    return a == b or (a != a and b != b)
+
+def same_product(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    return a["title"] == b["title"] and same_price(a["price"], b["price"])
+
 def extract_products(payload: Dict[str, Any]) -> ProductState:
-    products = payload.get("products", [])
+    return build_product_state(payload.get("products", []))
+
+def build_product_state(products: Iterable[Dict[str, Any]]) -> ProductState:
+    """Arma el estado a partir de los productos de a uno (sirve para un generador)."""
     result: ProductState = {}
 
     for p in products:
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import random
+import statistics
+from collections import deque
+from typing import Callable, Deque, Iterable, Optional
+
+# Cuanto se alarga el intervalo por cada ciclo sin cambios
+GROWTH = 1.5
+# Variacion aleatoria de cada espera (+-10%): las fuentes no se sincronizan entre si
+JITTER = 0.1
+# Cambios recientes que se usan para estimar el ritmo de la fuente
+HISTORY = 20
+
+class AdaptiveInterval:
+    """Intervalo de sondeo de una fuente que sigue su ritmo de cambios.
+
+    Despues de un cambio vuelve al minimo, para no perderse una rafaga. En cada
+    ciclo sin cambios crece un GROWTH hasta un techo: la mitad del tiempo tipico
+    entre cambios (la mediana de los ultimos HISTORY), o la mitad del tiempo que
+    lleva quieta la fuente si eso es mayor. Asi una fuente que cambia dos veces
+    por dia termina cerca del maximo y una que cambia cada minuto queda cerca
+    del minimo.
+
+    Ante un error la espera se duplica por cada fallo seguido (backoff
+    exponencial hasta el maximo) sin tocar el intervalo normal, que se retoma
+    con el primer ciclo que sale bien. Los tiempos son segundos epoch.
+    """
+
+    def __init__(self, min_seconds: float, max_seconds: float, initial_seconds: float,
+                 jitter: float = JITTER, rng: Optional[Callable[[float, float], float]] = None) -> None:
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.interval = self._clamp(initial_seconds)
+        self.failures = 0
+        self._jitter = jitter
+        self._uniform = rng or random.uniform
+        self._changes: Deque[float] = deque(maxlen=HISTORY)
+
+    def _clamp(self, seconds: float) -> float:
+        return min(max(seconds, self.min_seconds), self.max_seconds)
+
+    def seed(self, change_times: Iterable[float]) -> None:
+        """Carga los cambios ya registrados (en orden ascendente) al arrancar."""
+        self._changes.extend(change_times)
+
+    def typical_gap(self) -> Optional[float]:
+        if len(self._changes) < 2:
+            return None
+        times = list(self._changes)
+        return statistics.median(b - a for a, b in zip(times, times[1:]))
+
+    def ceiling(self, now: float) -> float:
+        gap = self.typical_gap()
+        quiet = now - self._changes[-1] if self._changes else None
+        if gap is None and quiet is None:
+            return self.max_seconds
+        return self._clamp(max(gap or 0.0, quiet or 0.0) / 2)
+
+    def next_delay(self, changed: bool, failed: bool, now: float) -> float:
+        """Registra el resultado de un ciclo y devuelve cuanto esperar hasta el proximo."""
+        if failed:
+            self.failures += 1
+            delay = min(self.interval * 2 ** self.failures, self.max_seconds)
+        else:
+            self.failures = 0
+            if changed:
+                self._changes.append(now)
+                self.interval = self.min_seconds
+            else:
+                self.interval = min(self.interval * GROWTH, self.ceiling(now))
+                self.interval = max(self.interval, self.min_seconds)
+            delay = self.interval
+        return delay * self._uniform(1 - self._jitter, 1 + self._jitter)
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import gzip
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from .sqlite_repo import ArchivedEvent
+
+class EventArchive:
+    """Escribe los eventos compactados como NDJSON comprimido con gzip.
+
+    Un archivo por fuente y por corrida de compactacion:
+    <archive_dir>/<fuente>/events-<AAAAMMDDTHHMMSSZ>.ndjson.gz. Cada lote se agrega
+    como un miembro gzip nuevo (gzip/zcat los leen como un solo flujo) y se hace
+    fsync antes de que la compactacion confirme el lote en la base.
+    """
+
+    def __init__(self, archive_dir: str, now: Optional[datetime] = None) -> None:
+        self._dir = archive_dir
+        self._stamp = (now or datetime.now(timezone.utc)).strftime("%Y%m%dT%H%M%SZ")
+        self.files: Dict[str, str] = {}
+
+    def __call__(self, source: str, events: List[ArchivedEvent]) -> None:
+        path = self.files.get(source)
+        if path is None:
+            directory = os.path.join(self._dir, source)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"events-{self._stamp}.ndjson.gz")
+            self.files[source] = path
+        with open(path, "ab") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                for event in events:
+                    f.write(json.dumps(event, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+                    f.write(b"\n")
+            raw.flush()
+            os.fsync(raw.fileno())
@@ -0,0 +1,33 @@
+import lzma
+import zlib
+from typing import Iterable, Iterator
+
+# Codecs disponibles para los snapshots; "none" guarda los bytes tal cual
+CODECS = ("zlib", "lzma", "none")
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == "zlib":
+        return zlib.compress(data, 6)
+    if codec == "lzma":
+        return lzma.compress(data, preset=6)
+    if codec == "none":
+        return data
+    raise ValueError(f"Unknown codec '{codec}'.")
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "lzma":
+        return lzma.decompress(data)
+    if codec == "none":
+        return bytes(data)
+    raise ValueError(f"Unknown codec '{codec}'.")
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Comprime en formato gzip a medida que llegan los datos (sin juntar todo en memoria)."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,6 +1,13 @@
-from typing import Any, Dict
+import asyncio
+import hashlib
+import json
+from dataclasses import dataclass
+import tempfile
+from typing import IO, Any, Dict, Iterable, List, Optional
 import httpx;
 
+from .json_stream import iter_json_array, not_a_list_error
+
 def fetch_json(url: str, timeout_seconds: float = 15.0) -> Dict[str, Any]:
     with httpx.Client(timeout=timeout_seconds, follow_redirects = True) as client:
         response = client.get(url);
@@ -9,4 +16,139 @@ def fetch_json(url: str, timeout_seconds: float = 15.0) -> Dict[str, Any]:
         data = response.json();
         if not isinstance(data, dict):
             raise ValueError("Expected JSON response to be a dictionary.");
-        return data;
\ No newline at end of file
+        return data;
+
+# Cuerpos mas grandes que esto se vuelcan a un archivo temporal y se parsean en streaming
+DEFAULT_STREAM_THRESHOLD_BYTES = 8 * 1024 * 1024
+
+_READ_CHUNK = 64 * 1024
+
+@dataclass(frozen=True)
+class FetchResult:
+    """Respuesta de una descarga condicional.
+
+    Si el servidor respondio 304, `not_modified` es True y no hay cuerpo.
+    `body_hash` es el sha256 de los bytes recibidos, calculado mientras llegan.
+    Un cuerpo chico queda en `body`; uno grande queda en `spool` (archivo temporal)
+    y sus productos se leen de a uno con `iter_products`.
+    """
+    not_modified: bool
+    body: bytes
+    body_hash: Optional[str]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    size: int = 0
+    spool: Optional[IO[bytes]] = None
+
+    def json(self) -> Dict[str, Any]:
+        data = json.loads(self.body)
+        if not isinstance(data, dict):
+            raise ValueError("Expected JSON response to be a dictionary.");
+        return data
+
+    def iter_products(self) -> Iterable[Dict[str, Any]]:
+        if self.spool is None:
+            products = self.json().get("products", [])
+            if not isinstance(products, list):
+                raise not_a_list_error("products")
+            return products
+        spool = self.spool
+        spool.seek(0)
+        return iter_json_array(iter(lambda: spool.read(_READ_CHUNK), b""), "products")
+
+    def close(self) -> None:
+        if self.spool is not None:
+            self.spool.close()
+
+class _BodySink:
+    """Acumula el cuerpo mientras llega: hashea cada bloque y, al pasar el umbral,
+    sigue escribiendo en un archivo temporal en lugar de memoria."""
+
+    def __init__(self, threshold: int) -> None:
+        self._threshold = threshold
+        self._digest = hashlib.sha256()
+        self._chunks: List[bytes] = []
+        self._spool: Optional[IO[bytes]] = None
+        self._size = 0
+
+    def write(self, chunk: bytes) -> None:
+        self._digest.update(chunk)
+        self._size += len(chunk)
+        if self._spool is None and self._size > self._threshold:
+            self._spool = tempfile.TemporaryFile()
+            for buffered in self._chunks:
+                self._spool.write(buffered)
+            self._chunks = []
+        if self._spool is not None:
+            self._spool.write(chunk)
+        else:
+            self._chunks.append(chunk)
+
+    def result(self, response: httpx.Response) -> FetchResult:
+        return FetchResult(not_modified=False,
+                           body=b"".join(self._chunks),
+                           body_hash=self._digest.hexdigest(),
+                           etag=response.headers.get("ETag"),
+                           last_modified=response.headers.get("Last-Modified"),
+                           size=self._size,
+                           spool=self._spool)
+
+def _conditional_headers(etag: Optional[str], last_modified: Optional[str]) -> Dict[str, str]:
+    headers: Dict[str, str] = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+def _not_modified(response: httpx.Response, etag: Optional[str], last_modified: Optional[str]) -> FetchResult:
+    return FetchResult(not_modified=True, body=b"", body_hash=None,
+                       etag=response.headers.get("ETag") or etag,
+                       last_modified=response.headers.get("Last-Modified") or last_modified)
+
+def fetch_feed(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None,
+               timeout_seconds: float = 15.0,
+               stream_threshold_bytes: int = DEFAULT_STREAM_THRESHOLD_BYTES) -> FetchResult:
+    with httpx.Client(timeout=timeout_seconds, follow_redirects = True) as client:
+        with client.stream("GET", url, headers=_conditional_headers(etag, last_modified)) as response:
+            if response.status_code == 304:
+                return _not_modified(response, etag, last_modified)
+            response.raise_for_status();
+
+            sink = _BodySink(stream_threshold_bytes)
+            for chunk in response.iter_bytes(_READ_CHUNK):
+                sink.write(chunk)
+            return sink.result(response)
+
+class AsyncFeedFetcher:
+    """Cliente HTTP asincrono compartido por todas las fuentes.
+
+    Reutiliza las conexiones (keep-alive) entre fuentes y entre ciclos, y limita
+    cuantas descargas corren a la vez con un semaforo.
+    """
+
+    def __init__(self, concurrency: int = 8, timeout_seconds: float = 15.0,
+                 stream_threshold_bytes: int = DEFAULT_STREAM_THRESHOLD_BYTES) -> None:
+        self._stream_threshold = stream_threshold_bytes
+        self._client = httpx.AsyncClient(
+            timeout=timeout_seconds,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(self, url: str, etag: Optional[str] = None,
+                    last_modified: Optional[str] = None) -> FetchResult:
+        async with self._semaphore:
+            async with self._client.stream("GET", url, headers=_conditional_headers(etag, last_modified)) as response:
+                if response.status_code == 304:
+                    return _not_modified(response, etag, last_modified)
+                response.raise_for_status();
+
+                sink = _BodySink(self._stream_threshold)
+                async for chunk in response.aiter_bytes(_READ_CHUNK):
+                    sink.write(chunk)
+                return sink.result(response)
+
+    async def aclose(self) -> None:
+        await self._client.aclose();
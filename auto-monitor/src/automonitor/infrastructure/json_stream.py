@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import codecs
+import json
+from typing import Any, Iterable, Iterator
+
+# Parser incremental minimo para feeds del tipo {"...": ..., "products": [{...}, {...}]}.
+# Solo recorre el objeto de primer nivel: los valores que no son la lista pedida se
+# decodifican y se descartan, y cada elemento de la lista se entrega apenas esta
+# completo en el buffer. La memoria queda acotada por el elemento mas grande, no
+# por el tamano del cuerpo.
+
+_WHITESPACE = " \t\n\r"
+
+# Cuando el prefijo ya consumido supera este tamano se recorta el buffer
+_COMPACT_AT = 1 << 16
+
+class _Reader:
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        if self.pos > _COMPACT_AT:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        for chunk in self._chunks:
+            text = self._decoder.decode(chunk)
+            if text:
+                self.buf += text
+                return True
+        self.buf += self._decoder.decode(b"", final=True)
+        self.eof = True
+        return True
+
+    def peek(self) -> str:
+        """Siguiente caracter que no es espacio ("" al final del cuerpo)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError(f"Invalid JSON feed: expected one of {chars!r} at offset {self.pos}, got {c!r}.")
+        self.pos += 1
+        return c
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # Un numero al final del buffer puede estar cortado: todo valor valido
+            # va seguido de ',' '}' o ']', asi que se exige ver al menos un caracter mas
+            if end >= len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+def not_a_list_error(key: str) -> ValueError:
+    """Mismo error para el cuerpo chico (json.loads) y el leido en streaming."""
+    return ValueError(f"Invalid JSON feed: expected {key!r} to be a list.")
+
+def iter_json_array(chunks: Iterable[bytes], key: str) -> Iterator[Any]:
+    """Entrega uno a uno los elementos de la lista `key` del objeto JSON de primer nivel.
+
+    Si la clave no existe no entrega nada. Levanta ValueError si el cuerpo no es un
+    objeto o si el valor de `key` no es una lista.
+    """
+    reader = _Reader(chunks)
+    if reader.peek() != "{":
+        raise ValueError("Expected JSON response to be a dictionary.");
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+
+    while True:
+        name = reader.value()
+        reader.expect(":")
+        if name == key:
+            if reader.peek() != "[":
+                raise not_a_list_error(key)
+            reader.expect("[")
+            if reader.peek() != "]":
+                while True:
+                    yield reader.value()
+                    if reader.expect(",]") == "]":
+                        break
+            else:
+                reader.expect("]")
+            # La clave ya se consumio; el resto del objeto no se necesita
+            return
+        reader.value()
+        if reader.expect(",}") == "}":
+            return
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from ..config import Settings
+from .sqlite_repo import (
+    NotificationRow,
+    delete_notifications,
+    enqueue_notification,
+    list_due_notifications,
+    mark_notification_part_sent,
+    next_notification_due,
+    reschedule_notifications,
+)
+from .telegram import MAX_MESSAGE_LENGTH, TelegramClient, TelegramSendError, split_message
+
+logger = logging.getLogger(__name__)
+
+# Espera entre reintentos: BACKOFF_BASE * 2^intentos (con jitter), hasta BACKOFF_MAX
+BACKOFF_BASE_SECONDS = 5.0
+BACKOFF_MAX_SECONDS = 900.0
+MAX_ATTEMPTS = 10
+
+def queue_notification(db_path: str, text: str) -> int:
+    """Deja el mensaje en la cola persistente; lo envia el dispatcher."""
+    return enqueue_notification(db_path, text, datetime.now(timezone.utc).isoformat())
+
+def _batches(rows: List[NotificationRow], limit: int) -> List[Tuple[List[int], List[str]]]:
+    """Agrupa notificaciones consecutivas en mensajes de hasta `limit` caracteres.
+
+    Cada lote es (ids, partes): normalmente una sola parte con varias notificaciones
+    juntas; una notificacion que sola no entra se parte en varias partes, sin las
+    que ya se enviaron en un intento anterior.
+    """
+    batches: List[Tuple[List[int], List[str]]] = []
+    ids: List[int] = []
+    text = ""
+    for row in rows:
+        if len(row["text"]) > limit or row["parts_sent"]:
+            if ids:
+                batches.append((ids, [text]))
+                ids, text = [], ""
+            batches.append(([row["id"]], split_message(row["text"], limit)[row["parts_sent"]:]))
+            continue
+        candidate = f"{text}\n\n{row['text']}" if text else row["text"]
+        if len(candidate) > limit:
+            batches.append((ids, [text]))
+            ids, candidate = [], row["text"]
+        ids.append(row["id"])
+        text = candidate
+    if ids:
+        batches.append((ids, [text]))
+    return batches
+
+def _backoff(attempts: int) -> float:
+    delay = min(BACKOFF_BASE_SECONDS * (2 ** attempts), BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+class NotificationDispatcher:
+    """Vacia la cola de notificaciones desde un hilo propio.
+
+    El ciclo de monitoreo solo encola (una escritura local) y llama a `wake`; el
+    envio, los reintentos y las esperas de la red pasan aca. Despues de despertar
+    espera `coalesce_seconds` para juntar en un mensaje las alertas de un mismo ciclo.
+    """
+
+    def __init__(self, db_path: str, client: TelegramClient, coalesce_seconds: float = 2.0,
+                 idle_poll_seconds: float = 30.0, message_limit: int = MAX_MESSAGE_LENGTH) -> None:
+        self._db_path = db_path
+        self._client = client
+        self._coalesce = coalesce_seconds
+        self._idle_poll = idle_poll_seconds
+        self._limit = message_limit
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> Optional["NotificationDispatcher"]:
+        if not (settings.telegram_bot_token and settings.telegram_chat_id):
+            return None
+        client = TelegramClient(settings.telegram_bot_token, settings.telegram_chat_id,
+                                api_base=settings.telegram_api_base)
+        return cls(settings.db_path, client)
+
+    def drain(self) -> int:
+        """Envia todo lo que esta vencido. Devuelve la cantidad de notificaciones enviadas.
+
+        Se corta en el primer error para no desordenar los mensajes: lo que falla se
+        reprograma con backoff y lo que sigue queda pendiente para la proxima vuelta.
+        De un mensaje partido se anota cada parte enviada, asi el reintento no las repite.
+        Un rechazo permanente (4xx) no se reintenta: queda como "failed" y se sigue.
+        """
+        sent = 0
+        while not self._stop.is_set():
+            rows = list_due_notifications(self._db_path, time.time())
+            if not rows:
+                return sent
+            attempts = {r["id"]: r["attempts"] for r in rows}
+            for ids, parts in _batches(rows, self._limit):
+                try:
+                    for n, part in enumerate(parts, 1):
+                        self._client.send(part)
+                        if n < len(parts):
+                            mark_notification_part_sent(self._db_path, ids[0])
+                except TelegramSendError as e:
+                    if e.permanent:
+                        # Sin reintentos: pasan a "failed" y la cola sigue con lo demas
+                        reschedule_notifications(self._db_path, ids, time.time(), str(e), 0)
+                        logger.error("Notification rejected; not retrying | ids=%s error=%s", ids, e)
+                        continue
+                    delay = e.retry_after if e.retry_after is not None else _backoff(max(attempts[i] for i in ids))
+                    reschedule_notifications(self._db_path, ids, time.time() + delay, str(e), MAX_ATTEMPTS)
+                    logger.warning("Notification send failed; retrying in %.0fs | ids=%s error=%s", delay, ids, e)
+                    return sent
+                delete_notifications(self._db_path, ids)
+                sent += len(ids)
+                logger.info("Notification sent | coalesced=%s parts=%s", len(ids), len(parts))
+        return sent
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.drain()
+                due = next_notification_due(self._db_path)
+            except Exception:
+                logger.exception("Notification dispatcher failed; retrying")
+                due = None
+            timeout = self._idle_poll if due is None else min(max(due - time.time(), 0.0), self._idle_poll)
+            if self._wake.wait(timeout):
+                self._wake.clear()
+                # Ventana corta para que las alertas de todas las fuentes salgan juntas
+                self._stop.wait(self._coalesce)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+        self._thread.start()
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._client.close()
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import time
 from datetime import datetime, timezone
@@ -7,19 +8,114 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 
 
-from ..application.monitor_service import run_monitor
-from ..config import Settings
-from .telegram import send_telegram_message
+from ..application.monitor_service import compact_history, recent_change_times, run_monitor_sources
+from ..config import Settings, Source
+from ..domain.polling import HISTORY, AdaptiveInterval
+from .http_fetcher import AsyncFeedFetcher
+from .notifier import NotificationDispatcher, queue_notification
 
 logger = logging.getLogger(__name__)
 
-def _job(settings: Settings) -> None:
-    result = run_monitor(settings.source_url, settings.db_path);
+class _SourcesRunner:
+    """Event loop y cliente HTTP que sobreviven entre ciclos del scheduler.
+
+    Asi el pool de conexiones del AsyncClient se reutiliza en cada ejecucion
+    en lugar de abrir conexiones nuevas contra cada fuente.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self._settings = settings
+        self._loop = asyncio.new_event_loop()
+        self._fetcher = AsyncFeedFetcher(concurrency=settings.fetch_concurrency,
+                                         stream_threshold_bytes=settings.stream_threshold_bytes)
+
+    def run_cycle(self, sources: list[Source] | None = None) -> list[dict]:
+        return self._loop.run_until_complete(run_monitor_sources(self._settings, self._fetcher, sources))
+
+    def close(self) -> None:
+        self._loop.run_until_complete(self._fetcher.aclose())
+        self._loop.close()
+
+def _job(settings: Settings, runner: _SourcesRunner, dispatcher: NotificationDispatcher | None) -> None:
+    source_urls = {s.name: s.url for s in settings.sources}
+
+    for result in runner.run_cycle():
+        _report(settings, result, source_urls.get(result["source"], "?"))
+    if dispatcher is not None:
+        dispatcher.wake()
+
+class _AdaptiveSchedule:
+    """Proximo ciclo de cada fuente en modo adaptativo (ver domain.polling)."""
+
+    def __init__(self, settings: Settings, now: float) -> None:
+        self.intervals: dict[str, AdaptiveInterval] = {}
+        # Al arrancar todas las fuentes se consultan de inmediato
+        self.due: dict[str, float] = {}
+        for source in settings.sources:
+            interval = AdaptiveInterval(settings.min_interval_seconds, settings.max_interval_seconds,
+                                        settings.run_interval_seconds)
+            try:
+                interval.seed(recent_change_times(settings.db_path, source.name, HISTORY))
+            except Exception:
+                logger.exception("Could not read change history | source=%s", source.name)
+            self.intervals[source.name] = interval
+            self.due[source.name] = now
+
+    def due_sources(self, settings: Settings, now: float) -> list[Source]:
+        return [s for s in settings.sources if self.due[s.name] <= now]
+
+    def record(self, source: str, changed: bool, failed: bool, now: float) -> float:
+        delay = self.intervals[source].next_delay(changed, failed, now)
+        self.due[source] = now + delay
+        return delay
+
+    def next_run(self) -> datetime:
+        return datetime.fromtimestamp(min(self.due.values()), timezone.utc)
+
+def _adaptive_job(settings: Settings, runner: _SourcesRunner, dispatcher: NotificationDispatcher | None,
+                  schedule: _AdaptiveSchedule, scheduler: BackgroundScheduler) -> None:
+    source_urls = {s.name: s.url for s in settings.sources}
+    now = time.time()
+    sources = schedule.due_sources(settings, now)
+    try:
+        results = runner.run_cycle(sources) if sources else []
+    except Exception as e:
+        logger.exception("Scheduled cycle failed")
+        results = [{"source": s.name, "changed": False, "error": str(e)} for s in sources]
+
+    finished = time.time()
+    for result in results:
+        _report(settings, result, source_urls.get(result["source"], "?"))
+        delay = schedule.record(result["source"], result["changed"], bool(result.get("error")), finished)
+        logger.debug("Next poll | source=%s in=%.0fs failures=%s", result["source"], delay,
+                     schedule.intervals[result["source"]].failures)
+    if dispatcher is not None and results:
+        dispatcher.wake()
+    # El trigger del job es solo un respaldo: la proxima corrida es la fuente mas proxima a vencer
+    scheduler.modify_job("automonitor_job", next_run_time=schedule.next_run())
+
+def _maintenance_job(settings: Settings) -> None:
+    try:
+        stats = compact_history(settings.db_path, settings.retention_keep_all_days, settings.retention_daily_days,
+                                settings.archive_dir, snapshot_codec=settings.snapshot_codec)
+    except Exception:
+        logger.exception("Maintenance run failed")
+        return
+    logger.info("Maintenance finished | pruned=%s snapshots written=%s snapshots deleted=%s archives=%s",
+                stats["events_pruned"], stats["snapshots_written"], stats["snapshots_deleted"],
+                stats["archived_files"])
+
+def _report(settings: Settings, result: dict, source_url: str) -> None:
+    source = result["source"]
+    if result.get("error"):
+        logger.error("Scheduled run failed | source=%s error=%s", source, result["error"])
+        return
 
     if result["changed"]:
         now_iso = datetime.now(timezone.utc).isoformat();
         logger.info(
-        "Change detected | added=%s removed=%s updated=%s",
+        "Change detected | source=%s added=%s removed=%s updated=%s",
+        source,
         len(result["added"]),
         len(result["removed"]),
         len(result["updated"]),
@@ -31,27 +127,58 @@ def _job(settings: Settings) -> None:
                 format_products("Added", result["added"]),
                 format_products("Removed", result["removed"]),
                 format_products("Updated", result["updated"]),
-                f"Source: {settings.source_url}",
+                f"Source: {source} ({source_url})",
             ])
-            send_telegram_message(settings.telegram_bot_token, settings.telegram_chat_id, msg);
-            logger.info("Telegram notification sent.");
+            # Solo se encola: el envio lo hace el dispatcher sin frenar el ciclo
+            queue_notification(settings.db_path, msg);
+            logger.info("Telegram notification queued.");
         else: 
             logger.info("Telegram settings not configured; skipping notification.");
     else:
-        logger.info("No changes detected (scheduled run).");
+        logger.info("No changes detected (scheduled run) | source=%s outcome=%s", source, result["outcome"]);
 
 def run_scheduler(settings: Settings) -> None:
+    runner = _SourcesRunner(settings)
+    dispatcher = NotificationDispatcher.from_settings(settings)
+    if dispatcher is not None:
+        dispatcher.start()
     scheduler = BackgroundScheduler(timezone="UTC");
-    scheduler.add_job(_job, 
-                      trigger=IntervalTrigger(seconds=settings.run_interval_seconds), 
-                      args=[settings], 
-                      id="automonitor_job",
-                      max_instances=1,
-                      coalesce=True,
-                      misfire_grace_time=30, 
-                      replace_existing=True);
+    if settings.schedule_mode == "adaptive":
+        schedule = _AdaptiveSchedule(settings, time.time())
+        scheduler.add_job(_adaptive_job,
+                          trigger=IntervalTrigger(seconds=settings.max_interval_seconds),
+                          args=[settings, runner, dispatcher, schedule, scheduler],
+                          id="automonitor_job",
+                          next_run_time=schedule.next_run(),
+                          max_instances=1,
+                          coalesce=True,
+                          misfire_grace_time=30,
+                          replace_existing=True);
+    else:
+        scheduler.add_job(_job, 
+                          trigger=IntervalTrigger(seconds=settings.run_interval_seconds), 
+                          args=[settings, runner, dispatcher], 
+                          id="automonitor_job",
+                          max_instances=1,
+                          coalesce=True,
+                          misfire_grace_time=30, 
+                          replace_existing=True);
+    if settings.retention_keep_all_days > 0:
+        # La compactacion toma el writer por lotes: no frena los ciclos de monitoreo
+        scheduler.add_job(_maintenance_job,
+                          trigger=IntervalTrigger(seconds=settings.maintenance_interval_seconds),
+                          args=[settings],
+                          id="automonitor_maintenance",
+                          max_instances=1,
+                          coalesce=True,
+                          replace_existing=True);
     scheduler.start();
-    logger.info("Scheduler started with interval of %d seconds.", settings.run_interval_seconds);
+    if settings.schedule_mode == "adaptive":
+        logger.info("Scheduler started in adaptive mode (%d-%d seconds) for %d source(s).",
+                    settings.min_interval_seconds, settings.max_interval_seconds, len(settings.sources));
+    else:
+        logger.info("Scheduler started with interval of %d seconds for %d source(s).",
+                    settings.run_interval_seconds, len(settings.sources));
 
     try:
         while True:
@@ -59,6 +186,9 @@ def run_scheduler(settings: Settings) -> None:
     except KeyboardInterrupt:
         logger.info("Shutting down scheduler...");
         scheduler.shutdown(wait=True);
+        runner.close()
+        if dispatcher is not None:
+            dispatcher.stop()
         logger.info("Scheduler shut down successfully.");
 
 
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Set
+
+# Pragmas aplicados a cada conexion. WAL deja leer mientras el writer escribe;
+# con synchronous=NORMAL en WAL solo se pierde durabilidad ante un corte de luz.
+_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+)
+
+class ConnectionPool:
+    """Conexiones SQLite reutilizables para una base.
+
+    Un unico writer protegido por un lock (SQLite solo admite un escritor a la vez)
+    y lectores que se prestan y devuelven a una cola. Se guardan hasta
+    `max_readers` lectores ociosos; si todos estan en uso se abre uno extra que
+    se cierra al devolverlo, asi una rafaga de lecturas nunca espera a otra.
+    Las conexiones viven lo mismo que el proceso, asi que la cache de sentencias
+    preparadas de sqlite3 (`cached_statements`) se aprovecha entre llamadas.
+    """
+
+    def __init__(self, db_path: str, max_readers: int = 4, busy_timeout_seconds: float = 10.0,
+                 cached_statements: int = 256) -> None:
+        self.db_path = db_path
+        self.pid = os.getpid()
+        self._max_readers = max_readers
+        self._timeout = busy_timeout_seconds
+        self._cached_statements = cached_statements
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened: Set[sqlite3.Connection] = set()
+        self._lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._writer: sqlite3.Connection | None = None
+        self._write_depth = 0
+
+    def _connect(self, read_only: bool) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path,
+                               timeout=self._timeout,
+                               check_same_thread=False,
+                               cached_statements=self._cached_statements)
+        conn.row_factory = sqlite3.Row
+        if not read_only:
+            # Solo tiene efecto en una base nueva (antes de pasar a WAL y crear tablas);
+            # las existentes cambian de modo con el VACUUM de incremental_vacuum
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("PRAGMA journal_mode = WAL")
+        for pragma in _PRAGMAS:
+            conn.execute(pragma)
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+        with self._lock:
+            self._opened.add(conn)
+        return conn
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            conn = self._connect(read_only=True)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            if self._readers.qsize() < self._max_readers:
+                self._readers.put(conn)
+            else:
+                with self._lock:
+                    self._opened.discard(conn)
+                conn.close()
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        # RLock: una escritura anidada reutiliza la transaccion de la escritura externa,
+        # que es la unica que hace commit/rollback
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._connect(read_only=False)
+            self._write_depth += 1
+            try:
+                if self._write_depth > 1:
+                    yield self._writer
+                else:
+                    with self._writer:
+                        yield self._writer
+            finally:
+                self._write_depth -= 1
+
+    def close(self) -> None:
+        with self._write_lock, self._lock:
+            for conn in self._opened:
+                conn.close()
+            self._opened.clear()
+            self._writer = None
+            self._readers = queue.LifoQueue()
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_path: str) -> ConnectionPool:
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        # Las conexiones no se pueden compartir con un proceso hijo (fork)
+        if pool is None or pool.pid != os.getpid():
+            pool = ConnectionPool(db_path)
+            _pools[db_path] = pool
+        return pool
+
+def close_pools() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            if pool.pid == os.getpid():
+                pool.close()
+        _pools.clear()
+
+atexit.register(close_pools)
@@ -1,104 +1,857 @@
 from __future__ import annotations
 import sqlite3
-from typing import Optional, TypedDict, List, Dict, Any, Tuple
+from typing import Optional, TypedDict, NamedTuple, List, Dict, Any, Iterator, Tuple, Callable
 import json
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from ..domain.models import ProductChange, ProductDelta, ProductState, ProductSummary
+from ..domain.diff import (apply_delta, diff_products, hash_serialized_state, make_delta, product_changes,
+                           serialize_state)
+from ..domain.merkle import hash_state, pack_buckets
+from .compression import compress, decompress
+from .sqlite_pool import get_pool
+
+# Modos de almacenamiento de un evento:
+#   full     -> state_json tiene el catalogo completo (keyframe, formato original)
+#   snapshot -> el catalogo completo esta comprimido en la tabla snapshots,
+#               referenciado por snapshot_hash (keyframe)
+#   delta    -> delta_json tiene solo los cambios respecto al evento anterior;
+#               keyframe_id apunta al keyframe desde el que se reconstruye
+#   pruned   -> la compactacion archivo y borro el catalogo; quedan el resumen
+#               del evento y su diff en product_changes
+STORAGE_FULL = "full"
+STORAGE_SNAPSHOT = "snapshot"
+STORAGE_DELTA = "delta"
+STORAGE_PRUNED = "pruned"
+
+# Como se calculo events.hash:
+#   sha256          -> sha256 del JSON serializado (eventos anteriores a los buckets)
+#   blake2b-buckets -> raiz del hash por buckets (domain.merkle), la de los eventos nuevos
+# backfill-metrics, rebuild y compact pasan los sha256 a la raiz cuando tienen el estado.
+HASH_SHA256 = "sha256"
+HASH_BUCKETS = "blake2b-buckets"
+
+# Fuente asignada a los eventos escritos antes de soportar varias fuentes
+DEFAULT_SOURCE = "default"
 
 class EventRow(TypedDict):
     id: int
+    source: str
     hash: str
-    state_json: str
     created_at: str
+    added_count: Optional[int]
+    removed_count: Optional[int]
+    updated_count: Optional[int]
+    storage: str
+    hash_algo: str
+
+# Fases de un ciclo de monitoreo con tiempo propio en monitor_runs (<fase>_ms)
+RUN_PHASES = ("fetch", "parse", "load", "diff", "hash", "write")
+
+_RUN_COLUMNS = {"products": "INTEGER NOT NULL DEFAULT 0", **{f"{p}_ms": "REAL" for p in RUN_PHASES}}
+
+# Columnas agregadas a "products" despues del indice original: ultimo evento de la
+# fuente en que el producto seguia en el feed, solo en los productos quitados
+_PRODUCT_COLUMNS = {
+    "last_seen_event_id": "INTEGER",
+    "last_seen_at": "TEXT",
+}
+
+# Columnas agregadas a "source_state": ultimo evento de la fuente. Un producto que
+# sigue en el feed se vio por ultima vez ahi (se resuelve al leer, ver _PRODUCT_FIELDS)
+_SOURCE_STATE_COLUMNS = {
+    "last_event_id": "INTEGER",
+    "last_event_at": "TEXT",
+}
+
+# Columnas agregadas a "metrics_rollups" despues de la tabla original
+_ROLLUP_COLUMNS = {"uncounted": "INTEGER NOT NULL DEFAULT 0"}
+
+# Columnas agregadas a "notifications": partes ya enviadas de un mensaje partido
+_NOTIFICATION_COLUMNS = {"parts_sent": "INTEGER NOT NULL DEFAULT 0"}
+
+# Solo columnas de resumen: el estado se lee aparte (get_event_state) cuando hace falta
+_EVENT_FIELDS = "id, source, hash, hash_algo, created_at, added_count, removed_count, updated_count, storage"
+
+# Columnas agregadas a "events" despues del esquema original
+_EVENT_COLUMNS = {
+    "added_count": "INTEGER",
+    "removed_count": "INTEGER",
+    "updated_count": "INTEGER",
+    "storage": f"TEXT NOT NULL DEFAULT '{STORAGE_FULL}'",
+    "delta_json": "TEXT",
+    "keyframe_id": "INTEGER",
+    "snapshot_hash": "TEXT",
+    "source": f"TEXT NOT NULL DEFAULT '{DEFAULT_SOURCE}'",
+    # 1 cuando el diff del evento esta guardado en product_changes
+    "changes_indexed": "INTEGER NOT NULL DEFAULT 0",
+    # Hashes por bucket del estado (domain.merkle); hash es la raiz
+    "bucket_hashes": "BLOB",
+    # Las filas que ya existian al agregar la columna tienen el sha256 del JSON
+    "hash_algo": f"TEXT NOT NULL DEFAULT '{HASH_SHA256}'",
+}
+
+def _make_state_json_nullable(conn: sqlite3.Connection) -> None:
+    # Las tablas creadas antes del modo delta declaran state_json NOT NULL y
+    # SQLite no permite quitar la restriccion con ALTER: se reconstruye la tabla.
+    info = {r[1]: r[3] for r in conn.execute("PRAGMA table_info(events)")}
+    if not info.get("state_json"):
+        return
+    columns = ", ".join(info.keys())
+    conn.execute("DROP TABLE IF EXISTS events_migrated");
+    conn.execute("""CREATE TABLE events_migrated(
+                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 hash TEXT NOT NULL,
+                 state_json TEXT,
+                 created_at TEXT NOT NULL
+                 )""");
+    _ensure_columns(conn, "events_migrated", _EVENT_COLUMNS)
+    conn.execute(f"INSERT INTO events_migrated ({columns}) SELECT {columns} FROM events");
+    conn.execute("DROP TABLE events");
+    conn.execute("ALTER TABLE events_migrated RENAME TO events");
+
+def _ensure_columns(conn: sqlite3.Connection, table: str, columns: Dict[str, str]) -> None:
+    existing = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+    for name, decl in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}");
+
+# Version del esquema guardada en PRAGMA user_version. Subirla cada vez que
+# _create_schema cambia: una base ya en esta version no vuelve a correr el DDL.
+SCHEMA_VERSION = 9
+
+_schema_ready: set[str] = set()
+_schema_lock = threading.Lock()
+
+@contextmanager
+def _read(db_path: str) -> Iterator[sqlite3.Connection]:
+    init_db(db_path)
+    with get_pool(db_path).read() as conn:
+        yield conn
+
+@contextmanager
+def _write(db_path: str) -> Iterator[sqlite3.Connection]:
+    init_db(db_path)
+    with get_pool(db_path).write() as conn:
+        yield conn
 
 def init_db(db_path: str) -> None:
-    with sqlite3.connect(db_path) as conn:
-        conn.execute("""CREATE TABLE IF NOT EXISTS monitor_state (
-                     id INTEGER PRIMARY KEY CHECK (id = 1),
-                     last_hash TEXT NOT NULL,
-                     updated_at TEXT NOT NULL
-                     )""");
-
-        conn.execute("""CREATE TABLE IF NOT EXISTS events(
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    hash TEXT NOT NULL,
-                    state_json TEXT NOT NULL,
-                    created_at TEXT NOT NULL
-                    )""");
-
-
-def list_events(db_path: str, limit: int = 50, offset: int = 0) -> List[EventRow]:
-    with sqlite3.connect(db_path) as conn:
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute("""SELECT id, hash, state_json, created_at FROM events
+    # El DDL corre una sola vez por proceso y base, no en cada ciclo del monitor
+    if db_path in _schema_ready:
+        return
+    with _schema_lock:
+        if db_path in _schema_ready:
+            return
+        with get_pool(db_path).write() as conn:
+            # Un "run" desde cron es un proceso nuevo por ciclo: con el esquema al dia
+            # basta leer user_version (una base de una version mas nueva tampoco se toca)
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                _create_schema(conn)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}");
+        _schema_ready.add(db_path)
+
+def _create_schema(conn: sqlite3.Connection) -> None:
+    conn.execute("""CREATE TABLE IF NOT EXISTS monitor_state (
+                 id INTEGER PRIMARY KEY CHECK (id = 1),
+                 last_hash TEXT NOT NULL,
+                 updated_at TEXT NOT NULL
+                 )""");
+
+    conn.execute("""CREATE TABLE IF NOT EXISTS events(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                hash TEXT NOT NULL,
+                state_json TEXT,
+                created_at TEXT NOT NULL
+                )""");
+    had_hash_algo = "hash_algo" in {r[1] for r in conn.execute("PRAGMA table_info(events)")}
+    _ensure_columns(conn, "events", _EVENT_COLUMNS)
+    if not had_hash_algo:
+        # Los eventos con hashes por bucket guardados ya tienen la raiz en hash. Los
+        # compactados pierden sus buckets: esos quedan como sha256 aunque fueran raiz.
+        conn.execute("UPDATE events SET hash_algo = ? WHERE bucket_hashes IS NOT NULL", (HASH_BUCKETS,));
+    _make_state_json_nullable(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_source_id ON events (source, id)");
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_created_at ON events (created_at)");
+
+    # Estado por fuente (reemplaza a monitor_state, que solo admite una fila)
+    conn.execute("""CREATE TABLE IF NOT EXISTS source_state (
+                 source TEXT PRIMARY KEY,
+                 last_hash TEXT NOT NULL,
+                 updated_at TEXT NOT NULL
+                 )""");
+    conn.execute(f"""INSERT OR IGNORE INTO source_state (source, last_hash, updated_at)
+                 SELECT '{DEFAULT_SOURCE}', last_hash, updated_at FROM monitor_state""");
+    _ensure_columns(conn, "source_state", _SOURCE_STATE_COLUMNS)
+    _fill_last_events(conn)
+
+    # Snapshots direccionados por contenido: un mismo estado se guarda una sola vez
+    conn.execute("""CREATE TABLE IF NOT EXISTS snapshots (
+                 hash TEXT PRIMARY KEY,
+                 codec TEXT NOT NULL,
+                 data BLOB NOT NULL,
+                 raw_size INTEGER NOT NULL
+                 )""");
+
+    conn.execute("""CREATE TABLE IF NOT EXISTS metrics_totals (
+                 id INTEGER PRIMARY KEY CHECK (id = 1),
+                 total_events INTEGER NOT NULL,
+                 sum_added INTEGER NOT NULL,
+                 sum_removed INTEGER NOT NULL,
+                 sum_updated INTEGER NOT NULL
+                 )""");
+    # Solo una base vacia puede arrancar los totales en cero; una base
+    # existente necesita "backfill-metrics" antes de tener totales.
+    conn.execute("""INSERT OR IGNORE INTO metrics_totals
+                 (id, total_events, sum_added, sum_removed, sum_updated)
+                 SELECT 1, 0, 0, 0, 0
+                 WHERE NOT EXISTS (SELECT 1 FROM events)""");
+
+    # Totales por hora y por dia de cada fuente, sumados al escribir cada evento.
+    # start es el inicio del bucket en UTC, con el mismo formato que created_at.
+    # uncounted: eventos del bucket sin contadores guardados (anteriores a los
+    # contadores, hasta correr "backfill-metrics"); sus cambios no estan sumados.
+    conn.execute("""CREATE TABLE IF NOT EXISTS metrics_rollups (
+                 bucket TEXT NOT NULL,
+                 start TEXT NOT NULL,
+                 source TEXT NOT NULL,
+                 events INTEGER NOT NULL,
+                 added INTEGER NOT NULL,
+                 removed INTEGER NOT NULL,
+                 updated INTEGER NOT NULL,
+                 PRIMARY KEY (bucket, start, source)
+                 ) WITHOUT ROWID""");
+    had_uncounted = "uncounted" in {r[1] for r in conn.execute("PRAGMA table_info(metrics_rollups)")}
+    _ensure_columns(conn, "metrics_rollups", _ROLLUP_COLUMNS)
+    # Una base existente arma los suyos una sola vez desde los contadores de cada evento
+    # (y los vuelve a armar si son de antes de uncounted, que contaba esos eventos como cero)
+    if ((not had_uncounted or conn.execute("SELECT 1 FROM metrics_rollups LIMIT 1").fetchone() is None)
+            and conn.execute("SELECT 1 FROM events LIMIT 1").fetchone() is not None):
+        _rebuild_rollups(conn)
+
+    # Contadores mantenidos en cada escritura; el COUNT(*) inicial corre una sola vez
+    conn.execute("""CREATE TABLE IF NOT EXISTS counters (
+                 name TEXT PRIMARY KEY,
+                 value INTEGER NOT NULL
+                 )""");
+    conn.execute("""INSERT INTO counters (name, value)
+                 SELECT 'events', (SELECT COUNT(*) FROM events)
+                 WHERE NOT EXISTS (SELECT 1 FROM counters WHERE name = 'events')""");
+    conn.execute("""INSERT INTO counters (name, value)
+                 SELECT 'events:' || source, COUNT(*) FROM events
+                 WHERE NOT EXISTS (SELECT 1 FROM counters WHERE name LIKE 'events:%')
+                 GROUP BY source""");
+
+    # Validadores HTTP y hash del ultimo cuerpo procesado de cada fuente
+    conn.execute("""CREATE TABLE IF NOT EXISTS fetch_state (
+                 source TEXT PRIMARY KEY,
+                 etag TEXT,
+                 last_modified TEXT,
+                 body_hash TEXT,
+                 updated_at TEXT NOT NULL
+                 )""");
+
+    # Indice normalizado de productos: ultima version de cada uno. removed_event_id
+    # es NULL mientras sigue en el feed; al quitarlo, last_seen_event_id guarda el
+    # evento anterior de la fuente (el ultimo que lo incluia).
+    conn.execute("""CREATE TABLE IF NOT EXISTS products (
+                 source TEXT NOT NULL,
+                 product_id TEXT NOT NULL,
+                 title TEXT NOT NULL,
+                 price REAL NOT NULL,
+                 first_seen_event_id INTEGER NOT NULL,
+                 last_changed_event_id INTEGER NOT NULL,
+                 last_changed_at TEXT NOT NULL,
+                 removed_event_id INTEGER,
+                 PRIMARY KEY (source, product_id)
+                 )""");
+    _ensure_columns(conn, "products", _PRODUCT_COLUMNS)
+    if "fingerprint" in {r[1] for r in conn.execute("PRAGMA table_info(products)")}:
+        # La huella por producto no se usaba: los hashes por bucket ya separan lo que cambio
+        conn.execute("ALTER TABLE products DROP COLUMN fingerprint");
+    _fill_last_seen(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_products_changed ON products (last_changed_at)");
+
+    # Historia por producto: una fila por cada evento en que el producto cambio
+    conn.execute("""CREATE TABLE IF NOT EXISTS product_changes (
+                 event_id INTEGER NOT NULL,
+                 source TEXT NOT NULL,
+                 product_id TEXT NOT NULL,
+                 kind TEXT NOT NULL,
+                 title TEXT NOT NULL,
+                 price REAL NOT NULL,
+                 old_title TEXT,
+                 old_price REAL,
+                 PRIMARY KEY (event_id, product_id)
+                 ) WITHOUT ROWID""");
+    conn.execute("""CREATE INDEX IF NOT EXISTS idx_product_changes_product
+                 ON product_changes (source, product_id, event_id)""");
+    # Paginado de los cambios de un tipo dentro de un evento (/events/{id}/changes?kind=)
+    conn.execute("""CREATE INDEX IF NOT EXISTS idx_product_changes_kind
+                 ON product_changes (event_id, kind, product_id)""");
+
+    # Cola de notificaciones salientes; una fila se borra cuando se envia
+    conn.execute("""CREATE TABLE IF NOT EXISTS notifications (
+                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 text TEXT NOT NULL,
+                 created_at TEXT NOT NULL,
+                 status TEXT NOT NULL DEFAULT 'pending',
+                 attempts INTEGER NOT NULL DEFAULT 0,
+                 next_attempt_at REAL NOT NULL DEFAULT 0,
+                 last_error TEXT
+                 )""");
+    conn.execute("""CREATE INDEX IF NOT EXISTS idx_notifications_due
+                 ON notifications (status, next_attempt_at)""");
+    _ensure_columns(conn, "notifications", _NOTIFICATION_COLUMNS)
+
+    # Avance de "rebuild": eventos ya escritos hasta last_event_id (incluido) de los
+    # que existian al empezar (hasta target_id). Sin fila no hay reconstruccion en curso.
+    conn.execute("""CREATE TABLE IF NOT EXISTS rebuild_progress (
+                 id INTEGER PRIMARY KEY CHECK (id = 1),
+                 last_event_id INTEGER NOT NULL,
+                 target_id INTEGER NOT NULL,
+                 started_at TEXT NOT NULL
+                 )""");
+
+    # Una fila por ciclo y fuente, con el camino que tomo el ciclo
+    conn.execute("""CREATE TABLE IF NOT EXISTS monitor_runs (
+                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 source TEXT NOT NULL,
+                 started_at TEXT NOT NULL,
+                 outcome TEXT NOT NULL,
+                 bytes_read INTEGER NOT NULL DEFAULT 0,
+                 duration_ms REAL NOT NULL DEFAULT 0
+                 )""");
+    _ensure_columns(conn, "monitor_runs", _RUN_COLUMNS)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_monitor_runs_source_id ON monitor_runs (source, id)");
+
+def list_events(db_path: str, limit: int = 50, offset: int = 0,
+                source: Optional[str] = None) -> List[EventRow]:
+    with _read(db_path) as conn:
+        rows = conn.execute(f"""SELECT {_EVENT_FIELDS} FROM events
+                            WHERE (? IS NULL OR source = ?)
                             ORDER BY id DESC
                             LIMIT ? OFFSET ?
-                            """, (limit, offset)).fetchall();
+                            """, (source, source, limit, offset)).fetchall();
+        return [dict(r) for r in rows] #type: ignore[return-value]
+
+def list_events_before(db_path: str, before_id: Optional[int], limit: int = 50,
+                       source: Optional[str] = None) -> List[EventRow]:
+    # Paginacion por cursor: usa la clave primaria, el costo no crece con la profundidad
+    with _read(db_path) as conn:
+        rows = conn.execute(f"""SELECT {_EVENT_FIELDS} FROM events
+                            WHERE id < ? AND (? IS NULL OR source = ?)
+                            ORDER BY id DESC
+                            LIMIT ?
+                            """, (before_id if before_id is not None else 2**63 - 1, source, source, limit)).fetchall();
         return [dict(r) for r in rows] #type: ignore[return-value]
     
+def list_events_after(db_path: str, after_id: int, limit: int = 100,
+                      source: Optional[str] = None) -> List[EventRow]:
+    # Eventos nuevos en orden ascendente (para seguir la historia desde un id conocido)
+    with _read(db_path) as conn:
+        rows = conn.execute(f"""SELECT {_EVENT_FIELDS} FROM events
+                            WHERE id > ? AND (? IS NULL OR source = ?)
+                            ORDER BY id ASC
+                            LIMIT ?
+                            """, (after_id, source, source, limit)).fetchall();
+        return [dict(r) for r in rows] #type: ignore[return-value]
+
+def list_event_times(db_path: str, source: str = DEFAULT_SOURCE, limit: int = 20) -> List[str]:
+    # created_at de los ultimos eventos de una fuente, del mas viejo al mas nuevo
+    with _read(db_path) as conn:
+        rows = conn.execute("""SELECT created_at FROM events
+                            WHERE source = ?
+                            ORDER BY id DESC
+                            LIMIT ?
+                            """, (source, limit)).fetchall();
+        return [r[0] for r in reversed(rows)]
+
 def get_event_by_id(db_path: str, event_id: int) -> Optional[EventRow]:
-    with sqlite3.connect(db_path) as conn:
-        conn.row_factory = sqlite3.Row
-        row = conn.execute("""SELECT id, hash, state_json, created_at 
+    with _read(db_path) as conn:
+        row = conn.execute(f"""SELECT {_EVENT_FIELDS}
                            FROM events
                            WHERE id = ?
                            """, (event_id,)).fetchone();
         return dict(row) if row else None  # type: ignore[return-value]
     
-def get_previous_event(db_path: str, event_id: int) -> Optional[EventRow]:
-    with sqlite3.connect(db_path) as conn:
-        conn.row_factory = sqlite3.Row
-        row = conn.execute("""
-                            SELECT id, hash, state_json, created_at
+def get_previous_event(db_path: str, event_id: int, source: str = DEFAULT_SOURCE) -> Optional[EventRow]:
+    with _read(db_path) as conn:
+        row = conn.execute(f"""
+                            SELECT {_EVENT_FIELDS}
                             FROM events 
-                            WHERE id < ?
+                            WHERE id < ? AND source = ?
                             ORDER BY id DESC
                             LIMIT 1
-                            """, (event_id,)).fetchone();
+                            """, (event_id, source)).fetchone();
         return dict(row) if row else None  # type: ignore[return-value]
                            
 
-def get_latest_event(db_path: str) -> Optional[EventRow]:
-    with sqlite3.connect(db_path) as conn:
-        conn.row_factory = sqlite3.Row
-        row = conn.execute("""
-                            SELECT id, hash, state_json, created_at
+def get_latest_event(db_path: str, source: Optional[str] = None) -> Optional[EventRow]:
+    with _read(db_path) as conn:
+        row = conn.execute(f"""
+                            SELECT {_EVENT_FIELDS}
                             FROM events 
+                            WHERE (? IS NULL OR source = ?)
                             ORDER BY id DESC
                             LIMIT 1
-                            """).fetchone();
+                            """, (source, source)).fetchone();
         return dict(row) if row else None  # type: ignore[return-value]
 
-def insert_event(db_path: str, state_hash: str, state_json: str, created_at_iso: str) -> None:
-    with sqlite3.connect(db_path) as conn:
-        conn.execute("INSERT INTO events (hash, state_json, created_at) VALUES (?, ?, ?)",
-                     (state_hash, state_json, created_at_iso)
+def get_event_buckets(db_path: str, event_id: int) -> Optional[bytes]:
+    """Hashes por bucket guardados con el evento (None en eventos anteriores a su uso)."""
+    with _read(db_path) as conn:
+        row = conn.execute("SELECT bucket_hashes FROM events WHERE id = ?", (event_id,)).fetchone();
+        return bytes(row[0]) if row and row[0] is not None else None;
+
+def get_latest_event_id(db_path: str, source: str = DEFAULT_SOURCE) -> Optional[int]:
+    with _read(db_path) as conn:
+        row = conn.execute("SELECT MAX(id) FROM events WHERE source = ?", (source,)).fetchone();
+        return row[0] if row else None;
+
+def _last_keyframe_id(conn: sqlite3.Connection, source: str) -> Optional[int]:
+    row = conn.execute("""SELECT id, storage, keyframe_id FROM events
+                       WHERE source = ?
+                       ORDER BY id DESC LIMIT 1""", (source,)).fetchone();
+    if row is None:
+        return None
+    return row[2] if row[1] == STORAGE_DELTA else row[0]
+
+def count_since_keyframe(db_path: str, source: str = DEFAULT_SOURCE) -> Optional[int]:
+    """Eventos delta de la fuente escritos despues de su ultimo keyframe (None si no hay eventos)."""
+    with _read(db_path) as conn:
+        keyframe_id = _last_keyframe_id(conn, source)
+        if keyframe_id is None:
+            return None
+        row = conn.execute("SELECT COUNT(*) FROM events WHERE source = ? AND id > ?",
+                           (source, keyframe_id)).fetchone();
+        return row[0]
+
+def _store_snapshot(conn: sqlite3.Connection, snapshot_hash: str, state_json: str, codec: str) -> None:
+    # Si el estado ya existe (el feed volvio a un estado anterior) no se comprime de nuevo
+    if conn.execute("SELECT 1 FROM snapshots WHERE hash = ?", (snapshot_hash,)).fetchone():
+        return
+    raw = state_json.encode("utf-8")
+    conn.execute("INSERT INTO snapshots (hash, codec, data, raw_size) VALUES (?, ?, ?, ?)",
+                 (snapshot_hash, codec, compress(raw, codec), len(raw)));
+
+def insert_event(db_path: str, state_hash: str, state_json: Optional[str], created_at_iso: str,
+                 added_count: int = 0, removed_count: int = 0, updated_count: int = 0,
+                 delta_json: Optional[str] = None, codec: str = "zlib",
+                 source: str = DEFAULT_SOURCE, changes: Optional[List[ProductChange]] = None,
+                 bucket_hashes: Optional[bytes] = None, hash_algo: str = HASH_BUCKETS) -> int:
+    """Guarda un evento completo (state_json, como snapshot comprimido) o, si
+    state_json es None, un delta encadenado al ultimo keyframe de la fuente.
+    Si vienen `changes`, actualiza en la misma transaccion el indice de productos.
+    Devuelve el id del evento."""
+    with _write(db_path) as conn:
+        # El primer evento de cada fuente es su linea base: se guarda su diff pero no suma a los totales
+        is_baseline = conn.execute("SELECT 1 FROM events WHERE source = ? LIMIT 1", (source,)).fetchone() is None;
+
+        snapshot_hash: Optional[str] = None
+        if state_json is None:
+            keyframe_id = _last_keyframe_id(conn, source)
+            if keyframe_id is None or delta_json is None:
+                raise ValueError("A delta event needs delta_json and a previous keyframe.");
+            storage = STORAGE_DELTA
+        else:
+            keyframe_id = None
+            delta_json = None
+            storage = STORAGE_SNAPSHOT
+            # Los snapshots se direccionan por el sha256 del JSON, no por el hash del evento
+            snapshot_hash = hash_serialized_state(state_json)
+            _store_snapshot(conn, snapshot_hash, state_json, codec)
+
+        cur = conn.execute("""INSERT INTO events (source, hash, hash_algo, state_json, created_at, added_count, removed_count,
+                                            updated_count, storage, delta_json, keyframe_id, snapshot_hash,
+                                            changes_indexed, bucket_hashes)
+                     VALUES (?, ?, ?, NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                     (source, state_hash, hash_algo, created_at_iso, added_count, removed_count, updated_count,
+                      storage, delta_json, keyframe_id, snapshot_hash, int(changes is not None), bucket_hashes)
+                    );
+        conn.executemany("""INSERT INTO counters (name, value) VALUES (?, 1)
+                         ON CONFLICT(name) DO UPDATE SET value = value + 1""",
+                         [("events",), (_source_counter(source),)]);
+        if is_baseline:
+            added_count = removed_count = updated_count = 0
+        conn.execute("""UPDATE metrics_totals SET
+                        total_events = total_events + 1,
+                        sum_added = sum_added + ?,
+                        sum_removed = sum_removed + ?,
+                        sum_updated = sum_updated + ?
+                     WHERE id = 1""",
+                     (added_count, removed_count, updated_count)
                     );
+        _add_to_rollups(conn, source, created_at_iso, added_count, removed_count, updated_count)
+        if changes:
+            _index_product_changes(conn, source, cur.lastrowid, created_at_iso, changes)
+        # Una fila por fuente: los productos que siguen en el feed no se tocan
+        conn.execute("""INSERT INTO source_state (source, last_hash, updated_at, last_event_id, last_event_at)
+                     VALUES (?, ?, ?, ?, ?)
+                     ON CONFLICT(source) DO UPDATE SET
+                        last_event_id=excluded.last_event_id,
+                        last_event_at=excluded.last_event_at""",
+                     (source, state_hash, created_at_iso, cur.lastrowid, created_at_iso));
+        return cur.lastrowid
+
+def _index_product_changes(conn: sqlite3.Connection, source: str, event_id: int, created_at_iso: str,
+                           changes: List[ProductChange]) -> None:
+    # Solo se tocan las filas de productos que cambiaron en este evento
+    conn.executemany("""INSERT INTO product_changes
+                     (event_id, source, product_id, kind, title, price, old_title, old_price)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                     [(event_id, source, c["id"], c["kind"], c["title"], c["price"], c["old_title"], c["old_price"])
+                      for c in changes]);
+    _apply_product_changes(conn, source, event_id, created_at_iso, changes)
+
+def _apply_product_changes(conn: sqlite3.Connection, source: str, event_id: int, created_at_iso: str,
+                           changes: List[ProductChange]) -> None:
+    conn.executemany("""INSERT INTO products
+                     (source, product_id, title, price, first_seen_event_id,
+                      last_changed_event_id, last_changed_at, removed_event_id, last_seen_event_id, last_seen_at)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, NULL, NULL, NULL)
+                     ON CONFLICT(source, product_id) DO UPDATE SET
+                        title=excluded.title,
+                        price=excluded.price,
+                        last_changed_event_id=excluded.last_changed_event_id,
+                        last_changed_at=excluded.last_changed_at,
+                        removed_event_id=NULL,
+                        last_seen_event_id=NULL,
+                        last_seen_at=NULL""",
+                     [(source, c["id"], c["title"], c["price"], event_id, event_id, created_at_iso)
+                      for c in changes if c["kind"] != "removed"]);
+    removed = [c["id"] for c in changes if c["kind"] == "removed"]
+    if not removed:
+        return
+    # Lo quitado se vio por ultima vez en el evento anterior de la fuente
+    seen = conn.execute("""SELECT id, created_at FROM events WHERE source = ? AND id < ?
+                        ORDER BY id DESC LIMIT 1""", (source, event_id)).fetchone();
+    conn.executemany("""UPDATE products
+                     SET removed_event_id = ?, last_changed_event_id = ?, last_changed_at = ?,
+                         last_seen_event_id = ?, last_seen_at = ?
+                     WHERE source = ? AND product_id = ?""",
+                     [(event_id, event_id, created_at_iso, seen[0] if seen else None, seen[1] if seen else None,
+                       source, pid) for pid in removed]);
+
+def _fill_last_events(conn: sqlite3.Connection) -> None:
+    # Ultimo evento de cada fuente en source_state (bases de antes de guardarlo ahi)
+    conn.execute("""INSERT INTO source_state (source, last_hash, updated_at, last_event_id, last_event_at)
+                 SELECT e.source, e.hash, e.created_at, e.id, e.created_at FROM events AS e
+                 WHERE e.id IN (SELECT MAX(id) FROM events GROUP BY source)
+                 ON CONFLICT(source) DO UPDATE SET
+                    last_event_id=excluded.last_event_id,
+                    last_event_at=excluded.last_event_at""");
+
+def _fill_last_seen(conn: sqlite3.Connection) -> None:
+    """Calcula last_seen_* de los productos quitados desde la historia (el evento anterior a
+    removed_event_id); en los que siguen en el feed queda NULL y se lee de source_state."""
+    conn.execute("""UPDATE products SET last_seen_event_id = CASE
+                        WHEN removed_event_id IS NULL THEN NULL
+                        ELSE (SELECT MAX(id) FROM events
+                              WHERE source = products.source AND id < products.removed_event_id)
+                    END""");
+    conn.execute("""UPDATE products SET last_seen_at = (SELECT created_at FROM events WHERE id = last_seen_event_id)""");
 
         
-def get_last_hash(db_path: str) -> Optional[str]:
-    with sqlite3.connect(db_path) as conn:
-        row = conn.execute("SELECT last_hash FROM monitor_state WHERE id = 1").fetchone();
+def get_last_hash(db_path: str, source: str = DEFAULT_SOURCE) -> Optional[str]:
+    with _read(db_path) as conn:
+        row = conn.execute("SELECT last_hash FROM source_state WHERE source = ?", (source,)).fetchone();
         return row[0] if row else None;
 
-def upsert_hash(db_path: str, new_hash: str, updated_at_iso: str) -> None:
-    with sqlite3.connect(db_path) as conn:
-        conn.execute("""INSERT INTO monitor_state (id, last_hash, updated_at)
-                     VALUES (1, ?, ?)
-                     ON CONFLICT(id) DO UPDATE SET
+def upsert_hash(db_path: str, new_hash: str, updated_at_iso: str, source: str = DEFAULT_SOURCE) -> None:
+    with _write(db_path) as conn:
+        conn.execute("""INSERT INTO source_state (source, last_hash, updated_at)
+                     VALUES (?, ?, ?)
+                     ON CONFLICT(source) DO UPDATE SET
                         last_hash=excluded.last_hash,
                         updated_at=excluded.updated_at""",
-                     (new_hash, updated_at_iso)
+                     (source, new_hash, updated_at_iso)
+                    );
+
+def list_sources(db_path: str) -> List[str]:
+    with _read(db_path) as conn:
+        rows = conn.execute("SELECT source FROM source_state ORDER BY source").fetchall();
+        return [r[0] for r in rows]
+
+class FetchState(TypedDict):
+    etag: Optional[str]
+    last_modified: Optional[str]
+    body_hash: Optional[str]
+
+def get_fetch_state(db_path: str, source: str = DEFAULT_SOURCE) -> Optional[FetchState]:
+    with _read(db_path) as conn:
+        row = conn.execute("SELECT etag, last_modified, body_hash FROM fetch_state WHERE source = ?",
+                           (source,)).fetchone();
+        if row is None:
+            return None
+        return FetchState(etag=row[0], last_modified=row[1], body_hash=row[2])
+
+def save_fetch_state(db_path: str, etag: Optional[str], last_modified: Optional[str], body_hash: Optional[str],
+                     updated_at_iso: str, source: str = DEFAULT_SOURCE) -> None:
+    with _write(db_path) as conn:
+        conn.execute("""INSERT INTO fetch_state (source, etag, last_modified, body_hash, updated_at)
+                     VALUES (?, ?, ?, ?, ?)
+                     ON CONFLICT(source) DO UPDATE SET
+                        etag=excluded.etag,
+                        last_modified=excluded.last_modified,
+                        body_hash=excluded.body_hash,
+                        updated_at=excluded.updated_at""",
+                     (source, etag, last_modified, body_hash, updated_at_iso)
+                    );
+
+def _run_counter(outcome: str, source: Optional[str] = None) -> str:
+    return f"runs:{outcome}" if source is None else f"runs:{source}:{outcome}"
+
+# Limites (en segundos) de los buckets del histograma de duracion por fase
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _duration_bucket(seconds: float) -> str:
+    for le in DURATION_BUCKETS:
+        if seconds <= le:
+            return repr(le)
+    return "+Inf"
+
+def record_run(db_path: str, source: str, started_at_iso: str, outcome: str,
+               bytes_read: int = 0, duration_ms: float = 0.0,
+               phases: Optional[Dict[str, float]] = None, products: int = 0) -> None:
+    """Guarda un ciclo en monitor_runs y suma sus contadores.
+
+    `phases` son milisegundos por fase (ver RUN_PHASES). Cada duracion, y la del
+    ciclo completo ("total"), cae en un bucket de su histograma persistido en
+    counters: phase_seconds:<fase>:<le>, :count y :sum_us.
+    """
+    phases = phases or {}
+    with _write(db_path) as conn:
+        conn.execute(f"""INSERT INTO monitor_runs (source, started_at, outcome, bytes_read, duration_ms, products,
+                                                   {", ".join(f"{p}_ms" for p in RUN_PHASES)})
+                     VALUES (?, ?, ?, ?, ?, ?, {", ".join("?" for _ in RUN_PHASES)})""",
+                     (source, started_at_iso, outcome, bytes_read, duration_ms, products,
+                      *(phases.get(p) for p in RUN_PHASES))
                     );
+        increments: List[Tuple[str, int]] = [(_run_counter(outcome), 1), (_run_counter(outcome, source), 1),
+                                             ("bytes_downloaded", bytes_read), ("products_parsed", products)]
+        for phase, ms in [*phases.items(), ("total", duration_ms)]:
+            increments += [(f"phase_seconds:{phase}:{_duration_bucket(ms / 1000)}", 1),
+                           (f"phase_seconds:{phase}:count", 1),
+                           (f"phase_seconds:{phase}:sum_us", int(ms * 1000))]
+        conn.executemany("""INSERT INTO counters (name, value) VALUES (?, ?)
+                         ON CONFLICT(name) DO UPDATE SET value = value + excluded.value""",
+                         increments);
+
+class RunRow(TypedDict):
+    id: int
+    source: str
+    started_at: str
+    outcome: str
+    bytes_read: int
+    products: int
+    duration_ms: float
+    fetch_ms: Optional[float]
+    parse_ms: Optional[float]
+    load_ms: Optional[float]
+    diff_ms: Optional[float]
+    hash_ms: Optional[float]
+    write_ms: Optional[float]
 
-def get_last_state_json(db_path: str) -> Optional[str]:
-    with sqlite3.connect(db_path) as conn:
-        row = conn.execute("""SELECT state_json FROM events
-                            ORDER BY id DESC LIMIT 1""").fetchone();
+def list_runs(db_path: str, limit: int = 100, before_id: Optional[int] = None,
+              source: Optional[str] = None) -> List[RunRow]:
+    with _read(db_path) as conn:
+        rows = conn.execute(f"""SELECT id, source, started_at, outcome, bytes_read, products, duration_ms,
+                                       {", ".join(f"{p}_ms" for p in RUN_PHASES)}
+                            FROM monitor_runs
+                            WHERE (? IS NULL OR id < ?) AND (? IS NULL OR source = ?)
+                            ORDER BY id DESC
+                            LIMIT ?""", (before_id, before_id, source, source, limit)).fetchall();
+        return [dict(r) for r in rows]  # type: ignore[misc]
+
+def list_counters(db_path: str) -> Dict[str, int]:
+    with _read(db_path) as conn:
+        return {name: value for name, value in conn.execute("SELECT name, value FROM counters")}
+
+def get_run_stats(db_path: str) -> Dict[str, Dict[str, int]]:
+    """Ciclos por camino ("outcome"), en total ("all") y por fuente."""
+    stats: Dict[str, Dict[str, int]] = {}
+    with _read(db_path) as conn:
+        for name, value in conn.execute("SELECT name, value FROM counters WHERE name LIKE 'runs:%'"):
+            parts = name.split(":")
+            source, outcome = ("all", parts[1]) if len(parts) == 2 else (":".join(parts[1:-1]), parts[-1])
+            stats.setdefault(source, {})[outcome] = value
+    return stats
+
+NOTIFICATION_PENDING = "pending"
+NOTIFICATION_FAILED = "failed"
+
+class NotificationRow(TypedDict):
+    id: int
+    text: str
+    attempts: int
+    parts_sent: int
+
+def enqueue_notification(db_path: str, text: str, created_at_iso: str) -> int:
+    with _write(db_path) as conn:
+        cur = conn.execute("INSERT INTO notifications (text, created_at) VALUES (?, ?)",
+                           (text, created_at_iso));
+        return cur.lastrowid
+
+def list_due_notifications(db_path: str, now: float, limit: int = 100) -> List[NotificationRow]:
+    """Notificaciones pendientes en orden de llegada, hasta la primera que todavia
+    espera un reintento: las posteriores no se adelantan a ella."""
+    with _read(db_path) as conn:
+        rows = conn.execute("""SELECT n.id, n.text, n.attempts, n.parts_sent FROM notifications AS n
+                            WHERE n.status = ?
+                              AND NOT EXISTS (SELECT 1 FROM notifications AS w
+                                              WHERE w.status = ? AND w.next_attempt_at > ? AND w.id <= n.id)
+                            ORDER BY n.id ASC
+                            LIMIT ?""", (NOTIFICATION_PENDING, NOTIFICATION_PENDING, now, limit)).fetchall();
+        return [dict(r) for r in rows]  # type: ignore[misc]
+
+def next_notification_due(db_path: str) -> Optional[float]:
+    with _read(db_path) as conn:
+        row = conn.execute("SELECT MIN(next_attempt_at) FROM notifications WHERE status = ?",
+                           (NOTIFICATION_PENDING,)).fetchone();
         return row[0] if row else None;
 
+def delete_notifications(db_path: str, ids: List[int]) -> None:
+    with _write(db_path) as conn:
+        conn.executemany("DELETE FROM notifications WHERE id = ?", [(i,) for i in ids]);
+
+def mark_notification_part_sent(db_path: str, notification_id: int) -> None:
+    """Una parte mas enviada de un mensaje partido: un reintento sigue desde la proxima."""
+    with _write(db_path) as conn:
+        conn.execute("UPDATE notifications SET parts_sent = parts_sent + 1 WHERE id = ?", (notification_id,));
+
+def reschedule_notifications(db_path: str, ids: List[int], next_attempt_at: float, error: str,
+                             max_attempts: int) -> None:
+    # Pasado el maximo de intentos quedan como "failed" (no se reintentan, pero no se pierden)
+    with _write(db_path) as conn:
+        conn.executemany("""UPDATE notifications SET
+                            attempts = attempts + 1,
+                            next_attempt_at = ?,
+                            last_error = ?,
+                            status = CASE WHEN attempts + 1 >= ? THEN ? ELSE status END
+                         WHERE id = ?""",
+                         [(next_attempt_at, error, max_attempts, NOTIFICATION_FAILED, i) for i in ids]);
+
+def count_notifications(db_path: str) -> Dict[str, int]:
+    with _read(db_path) as conn:
+        return {status: n for status, n in conn.execute("SELECT status, COUNT(*) FROM notifications GROUP BY status")}
+
+def _load_snapshot(conn: sqlite3.Connection, snapshot_hash: Optional[str]) -> ProductState:
+    row = conn.execute("SELECT codec, data FROM snapshots WHERE hash = ?", (snapshot_hash,)).fetchone();
+    if row is None:
+        return {}
+    return _loads_state(decompress(row[1], row[0]).decode("utf-8"))
+
+def _keyframe_state(conn: sqlite3.Connection, storage: str, state_json: Optional[str],
+                    snapshot_hash: Optional[str]) -> ProductState:
+    if storage == STORAGE_SNAPSHOT:
+        return _load_snapshot(conn, snapshot_hash)
+    return _loads_state(state_json)
+
+def _load_state(conn: sqlite3.Connection, event_id: int) -> Optional[ProductState]:
+    row = conn.execute("""SELECT storage, state_json, snapshot_hash, keyframe_id, source FROM events
+                       WHERE id = ?""", (event_id,)).fetchone();
+    if row is None:
+        return None
+    storage, state_json, snapshot_hash, keyframe_id, source = row
+    if storage == STORAGE_PRUNED:
+        return None
+    if storage != STORAGE_DELTA:
+        return _keyframe_state(conn, storage, state_json, snapshot_hash)
+
+    # Keyframe + todos los deltas hasta el evento pedido, en orden
+    keyframe = conn.execute("""SELECT storage, state_json, snapshot_hash FROM events
+                            WHERE id = ?""", (keyframe_id,)).fetchone();
+    state: ProductState = _keyframe_state(conn, *keyframe) if keyframe else {}
+    for (delta_json,) in conn.execute("""SELECT delta_json FROM events
+                                      WHERE source = ? AND id > ? AND id <= ?
+                                      ORDER BY id ASC""", (source, keyframe_id, event_id)):
+        state = apply_delta(state, _loads_delta(delta_json))
+    return state
+
+def get_event_state(db_path: str, event_id: int) -> Optional[ProductState]:
+    with _read(db_path) as conn:
+        return _load_state(conn, event_id)
 
-def count_events(db_path: str) -> int:
-    with sqlite3.connect(db_path) as conn:
-        row = conn.execute("SELECT COUNT(*) FROM events").fetchone();
+def get_latest_state(db_path: str, source: str = DEFAULT_SOURCE) -> Optional[ProductState]:
+    with _read(db_path) as conn:
+        row = conn.execute("SELECT id FROM events WHERE source = ? ORDER BY id DESC LIMIT 1",
+                           (source,)).fetchone();
+        return _load_state(conn, row[0]) if row else None;
+
+
+# Buckets de metrics_rollups: formato de strftime que lleva created_at al inicio del bucket
+ROLLUP_BUCKETS = {
+    "hour": "%Y-%m-%dT%H:00:00+00:00",
+    "day": "%Y-%m-%dT00:00:00+00:00",
+}
+
+def _add_to_rollups(conn: sqlite3.Connection, source: str, created_at_iso: str,
+                    added: int, removed: int, updated: int) -> None:
+    conn.executemany("""INSERT INTO metrics_rollups (bucket, start, source, events, added, removed, updated)
+                     VALUES (?, strftime(?, ?), ?, 1, ?, ?, ?)
+                     ON CONFLICT(bucket, start, source) DO UPDATE SET
+                        events = events + 1,
+                        added = added + excluded.added,
+                        removed = removed + excluded.removed,
+                        updated = updated + excluded.updated""",
+                     [(bucket, fmt, created_at_iso, source, added, removed, updated)
+                      for bucket, fmt in ROLLUP_BUCKETS.items()]);
+
+def _rebuild_rollups(conn: sqlite3.Connection) -> None:
+    # Mismo criterio que metrics_totals: el primer evento de cada fuente cuenta como evento sin cambios
+    conn.execute("DELETE FROM metrics_rollups");
+    for bucket, fmt in ROLLUP_BUCKETS.items():
+        conn.execute("""INSERT INTO metrics_rollups (bucket, start, source, events, added, removed, updated, uncounted)
+                     SELECT ?, strftime(?, e.created_at) AS start, e.source, COUNT(*),
+                            COALESCE(SUM(CASE WHEN e.id > first.id THEN e.added_count END), 0),
+                            COALESCE(SUM(CASE WHEN e.id > first.id THEN e.removed_count END), 0),
+                            COALESCE(SUM(CASE WHEN e.id > first.id THEN e.updated_count END), 0),
+                            SUM(CASE WHEN e.id > first.id AND (e.added_count IS NULL OR e.removed_count IS NULL
+                                                               OR e.updated_count IS NULL) THEN 1 ELSE 0 END)
+                     FROM events AS e
+                     JOIN (SELECT source, MIN(id) AS id FROM events GROUP BY source) AS first
+                       ON first.source = e.source
+                     WHERE strftime(?, e.created_at) IS NOT NULL
+                     GROUP BY start, e.source""", (bucket, fmt, fmt));
+
+class RollupRow(TypedDict):
+    start: str
+    events: int
+    added: int
+    removed: int
+    updated: int
+    # Eventos sin contadores guardados: sus cambios faltan en added/removed/updated
+    uncounted: int
+
+def list_rollups(db_path: str, bucket: str, start_from: Optional[str] = None, start_to: Optional[str] = None,
+                 source: Optional[str] = None) -> List[RollupRow]:
+    """Buckets con al menos un evento, en orden; sin source se suman todas las fuentes.
+
+    start_from se redondea al inicio de su bucket; start_to es exclusivo.
+    """
+    with _read(db_path) as conn:
+        rows = conn.execute("""SELECT start, SUM(events) AS events, SUM(added) AS added,
+                                   SUM(removed) AS removed, SUM(updated) AS updated, SUM(uncounted) AS uncounted
+                            FROM metrics_rollups
+                            WHERE bucket = ?
+                              AND (? IS NULL OR start >= strftime(?, ?))
+                              AND (? IS NULL OR start < ?)
+                              AND (? IS NULL OR source = ?)
+                            GROUP BY start
+                            ORDER BY start ASC""",
+                            (bucket, start_from, ROLLUP_BUCKETS[bucket], start_from, start_to, start_to,
+                             source, source)).fetchall();
+        return [dict(r) for r in rows]  # type: ignore[misc]
+
+def _source_counter(source: str) -> str:
+    return f"events:{source}"
+
+def count_events(db_path: str, source: Optional[str] = None) -> int:
+    with _read(db_path) as conn:
+        name = "events" if source is None else _source_counter(source)
+        row = conn.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone();
         return row[0] if row else 0;
 
 
@@ -113,6 +866,62 @@ def _loads_state(s: Any) -> Dict[str, Any]:
     except Exception:
         return {}
     
+def _loads_delta(s: Any) -> ProductDelta:
+    data = _loads_state(s)
+    return {
+        "added": _as_dict(data.get("added")),
+        "removed": list(data.get("removed") or []),
+        "updated": _as_dict(data.get("updated")),
+    }
+
+class _HistoryStep(TypedDict):
+    id: int
+    source: str
+    created_at: str
+    storage: str
+    hash_algo: str
+    # True en el primer evento de la fuente
+    baseline: bool
+    previous: Optional[ProductState]
+    state: Optional[ProductState]
+
+def _iter_states(conn: sqlite3.Connection, batch_size: int = 200) -> Iterator[_HistoryStep]:
+    """Recorre la historia en orden ascendente reconstruyendo cada estado.
+
+    Los deltas se aplican sobre el estado anterior de la misma fuente, asi que
+    solo se leen snapshots completos en los keyframes. `previous` es None en el
+    primer evento de cada fuente y en el que sigue a un evento compactado;
+    `state` es None en los eventos compactados.
+    """
+    states: Dict[str, Optional[ProductState]] = {}
+    last_id = 0
+    while True:
+        rows = conn.execute("""SELECT id, source, created_at, storage, state_json, snapshot_hash, delta_json, hash_algo
+                            FROM events
+                            WHERE id > ?
+                            ORDER BY id ASC
+                            LIMIT ?""", (last_id, batch_size)).fetchall();
+        if not rows:
+            return
+        for event_id, source, created_at, storage, state_json, snapshot_hash, delta_json, hash_algo in rows:
+            baseline = source not in states
+            previous = states.get(source)
+            state: Optional[ProductState]
+            if storage == STORAGE_PRUNED:
+                state = None
+            elif storage == STORAGE_DELTA:
+                state = apply_delta(previous or {}, _loads_delta(delta_json))
+            else:
+                state = _keyframe_state(conn, storage, state_json, snapshot_hash)
+            states[source] = state
+            last_id = event_id
+            yield {"id": event_id, "source": source, "created_at": created_at, "storage": storage,
+                   "hash_algo": hash_algo, "baseline": baseline, "previous": previous, "state": state}
+
+def _replayable(step: _HistoryStep) -> bool:
+    # Sin estado propio o sin el anterior (por compactacion) el diff no se puede recalcular
+    return step["state"] is not None and (step["previous"] is not None or step["baseline"])
+
 def _diff_counts(prev: Dict[str, Any], curr: Dict[str, Any]) -> Tuple[int, int, int]:
     prev_keys = set(prev.keys())
     curr_keys = set(curr.keys())
@@ -128,44 +937,714 @@ def _diff_counts(prev: Dict[str, Any], curr: Dict[str, Any]) -> Tuple[int, int,
     return (len(added_keys), len(removed_keys), updated)
         
    
+def backfill_event_counts(db_path: str, batch_size: int = 200) -> int:
+    """Recalcula los contadores de cada evento y reconstruye metrics_totals.
+
+    Recorre la historia una sola vez manteniendo solo el estado previo en memoria.
+    De paso pasa a la raiz por buckets los hashes sha256 de los eventos viejos.
+    Devuelve la cantidad de eventos cuyos contadores fueron escritos.
+    """
+    written = 0
+    updates: List[Tuple[int, int, int, int, int, int, int]] = []
+    rehashed: List[Tuple[int, str, bytes]] = []
+
+    def flush() -> int:
+        cur = conn.executemany("""UPDATE events
+                               SET added_count = ?, removed_count = ?, updated_count = ?
+                               WHERE id = ?
+                                 AND (added_count IS NOT ? OR removed_count IS NOT ? OR updated_count IS NOT ?)""",
+                               updates);
+        _write_rehashed(conn, rehashed)
+        conn.commit()
+        updates.clear()
+        rehashed.clear()
+        return cur.rowcount
+
+    with _write(db_path) as conn:
+        for step in _iter_states(conn, batch_size):
+            if step["state"] is not None and step["hash_algo"] != HASH_BUCKETS:
+                rehashed.append((step["id"], *_bucket_hash(step["state"])))
+            if not _replayable(step):
+                # Eventos compactados: se conservan los contadores guardados
+                continue
+            counts = _diff_counts(step["previous"] or {}, step["state"])
+            updates.append((*counts, step["id"], *counts))
+            if len(updates) >= batch_size:
+                written += flush()
+        written += flush()
+
+        _refresh_last_hashes(conn)
+        _rebuild_metrics_totals(conn)
+        _rebuild_rollups(conn)
+
+    return written
+
+def _bucket_hash(state: ProductState) -> Tuple[str, bytes]:
+    hashes = hash_state(state)
+    return hashes.root, pack_buckets(hashes.buckets)
+
+def _write_rehashed(conn: sqlite3.Connection, rows: List[Tuple[int, str, bytes]]) -> None:
+    # Filas (id, raiz, buckets) de eventos que tenian el sha256 del JSON
+    conn.executemany("""UPDATE events SET hash = ?, hash_algo = ?, bucket_hashes = ?
+                     WHERE id = ?""", [(root, HASH_BUCKETS, buckets, event_id) for event_id, root, buckets in rows]);
+
+def _refresh_last_hashes(conn: sqlite3.Connection) -> None:
+    # source_state guarda el hash del ultimo evento de cada fuente: sigue al evento si se recalculo
+    conn.execute("""UPDATE source_state SET last_hash = (SELECT e.hash FROM events AS e
+                                                         WHERE e.source = source_state.source
+                                                         ORDER BY e.id DESC LIMIT 1)
+                 WHERE EXISTS (SELECT 1 FROM events AS e WHERE e.source = source_state.source)""");
+
+def _rebuild_metrics_totals(conn: sqlite3.Connection) -> None:
+    conn.execute("""INSERT OR REPLACE INTO metrics_totals
+                 (id, total_events, sum_added, sum_removed, sum_updated)
+                 SELECT 1, COUNT(*),
+                        COALESCE(SUM(CASE WHEN e.id > first.id THEN e.added_count END), 0),
+                        COALESCE(SUM(CASE WHEN e.id > first.id THEN e.removed_count END), 0),
+                        COALESCE(SUM(CASE WHEN e.id > first.id THEN e.updated_count END), 0)
+                 FROM events AS e
+                 JOIN (SELECT source, MIN(id) AS id FROM events GROUP BY source) AS first
+                   ON first.source = e.source""");
+
+
+def index_products(db_path: str, batch_size: int = 200) -> int:
+    """Reconstruye products y product_changes recorriendo toda la historia.
+
+    Necesario una vez en bases creadas antes del indice; despues lo mantiene insert_event.
+    Los eventos compactados conservan su diff guardado, que solo se vuelve a aplicar
+    sobre products. Devuelve la cantidad de cambios de producto escritos.
+    """
+    written = 0
+    with _write(db_path) as conn:
+        conn.execute("DELETE FROM products");
+        for step in _iter_states(conn, batch_size):
+            if not _replayable(step):
+                _apply_product_changes(conn, step["source"], step["id"], step["created_at"],
+                                       _stored_product_changes(conn, step["id"]))
+                continue
+            conn.execute("DELETE FROM product_changes WHERE event_id = ?", (step["id"],));
+            previous = step["previous"] or {}
+            changes = product_changes(previous, *diff_products(previous, step["state"]))
+            if changes:
+                _index_product_changes(conn, step["source"], step["id"], step["created_at"], changes)
+                written += len(changes)
+        conn.execute("UPDATE events SET changes_indexed = 1 WHERE changes_indexed = 0");
+    return written
+
+class RebuiltEvent(NamedTuple):
+    id: int
+    source: str
+    created_at: str
+    # None en los eventos que no se pueden recalcular (compactados): se conserva lo guardado
+    counts: Optional[Tuple[int, int, int]]
+    changes: Optional[List[ProductChange]]
+    # (raiz, buckets) cuando el evento tenia el sha256 del JSON y su estado se pudo reconstruir
+    rehash: Optional[Tuple[str, bytes]] = None
+
+class RebuildProgress(TypedDict):
+    last_event_id: int
+    target_id: int
+    started_at: str
+
+def diff_event_range(db_path: str, first_id: int, last_id: int) -> List[RebuiltEvent]:
+    """Recalcula el diff de cada evento con id en [first_id, last_id] contra el anterior de su fuente.
+
+    Solo lee, asi que varios procesos pueden repartirse la historia por rangos:
+    el estado previo de cada fuente se reconstruye una vez al empezar el rango y
+    despues se arrastra de un evento al siguiente, como en _iter_states.
+    """
+    results: List[RebuiltEvent] = []
+    states: Dict[str, Optional[ProductState]] = {}
+    baselines: set[str] = set()
+    with _read(db_path) as conn:
+        for event_id, source, created_at, storage, state_json, snapshot_hash, delta_json, hash_algo in conn.execute(
+                """SELECT id, source, created_at, storage, state_json, snapshot_hash, delta_json, hash_algo FROM events
+                WHERE id BETWEEN ? AND ?
+                ORDER BY id ASC""", (first_id, last_id)):
+            if source not in states:
+                row = conn.execute("""SELECT id FROM events WHERE source = ? AND id < ?
+                                   ORDER BY id DESC LIMIT 1""", (source, event_id)).fetchone();
+                states[source] = _load_state(conn, row[0]) if row else None
+                if row is None:
+                    baselines.add(source)
+            previous = states[source]
+            state: Optional[ProductState]
+            if storage == STORAGE_PRUNED:
+                state = None
+            elif storage == STORAGE_DELTA and previous is not None:
+                state = apply_delta(previous, _loads_delta(delta_json))
+            elif storage == STORAGE_DELTA:
+                state = _load_state(conn, event_id)
+            else:
+                state = _keyframe_state(conn, storage, state_json, snapshot_hash)
+
+            rehash = _bucket_hash(state) if state is not None and hash_algo != HASH_BUCKETS else None
+            if state is not None and (previous is not None or source in baselines):
+                added, removed, updated = diff_products(previous or {}, state)
+                results.append(RebuiltEvent(event_id, source, created_at, (len(added), len(removed), len(updated)),
+                                            product_changes(previous or {}, added, removed, updated), rehash))
+            else:
+                results.append(RebuiltEvent(event_id, source, created_at, None, None, rehash))
+            states[source] = state
+            baselines.discard(source)
+    return results
+
+def start_rebuild(db_path: str, restart: bool = False) -> RebuildProgress:
+    """Devuelve la reconstruccion en curso o empieza una nueva hasta el ultimo evento actual.
+
+    Empezar de cero vacia products, que se vuelve a armar en orden de id.
+    """
+    with _write(db_path) as conn:
+        row = conn.execute("SELECT last_event_id, target_id, started_at FROM rebuild_progress WHERE id = 1").fetchone();
+        if row is not None and not restart:
+            return dict(row)  # type: ignore[return-value]
+        target_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0];
+        started_at = datetime.now(timezone.utc).isoformat()
+        conn.execute("DELETE FROM products");
+        conn.execute("""INSERT OR REPLACE INTO rebuild_progress (id, last_event_id, target_id, started_at)
+                     VALUES (1, 0, ?, ?)""", (target_id, started_at));
+        return {"last_event_id": 0, "target_id": target_id, "started_at": started_at}
+
+def write_rebuilt_events(db_path: str, events: List[RebuiltEvent], last_event_id: int) -> None:
+    """Escribe un rango ya recalculado y avanza rebuild_progress en la misma transaccion.
+
+    Los rangos se escriben en orden de id: products queda igual que si se hubiera
+    recorrido la historia de una vez, y un corte retoma desde el ultimo rango escrito.
+    """
+    with _write(db_path) as conn:
+        _write_rehashed(conn, [(event.id, *event.rehash) for event in events if event.rehash is not None])
+        for event in events:
+            if event.changes is None:
+                _apply_product_changes(conn, event.source, event.id, event.created_at,
+                                       _stored_product_changes(conn, event.id))
+                continue
+            conn.execute("""UPDATE events SET added_count = ?, removed_count = ?, updated_count = ?, changes_indexed = 1
+                         WHERE id = ?""", (*event.counts, event.id));  # type: ignore[misc]
+            conn.execute("DELETE FROM product_changes WHERE event_id = ?", (event.id,));
+            if event.changes:
+                _index_product_changes(conn, event.source, event.id, event.created_at, event.changes)
+        conn.execute("UPDATE rebuild_progress SET last_event_id = ? WHERE id = 1", (last_event_id,));
+
+def finish_rebuild(db_path: str, target_id: int) -> None:
+    """Cierra la reconstruccion: ultimos hashes, totales, rollups y los eventos escritos mientras corria."""
+    with _write(db_path) as conn:
+        # El monitor pudo escribir eventos nuevos (ya indexados) sobre el products vacio:
+        # se vuelven a aplicar despues de los viejos para que gane la ultima version
+        for event_id, source, created_at in conn.execute("""SELECT id, source, created_at FROM events
+                                                         WHERE id > ? ORDER BY id ASC""", (target_id,)).fetchall():
+            _apply_product_changes(conn, source, event_id, created_at, _stored_product_changes(conn, event_id))
+        _refresh_last_hashes(conn)
+        _rebuild_metrics_totals(conn)
+        _rebuild_rollups(conn)
+        conn.execute("DELETE FROM rebuild_progress WHERE id = 1");
+
+def _stored_product_changes(conn: sqlite3.Connection, event_id: int) -> List[ProductChange]:
+    rows = conn.execute("""SELECT product_id AS id, kind, title, price, old_title, old_price FROM product_changes
+                        WHERE event_id = ?
+                        ORDER BY product_id""", (event_id,)).fetchall();
+    return [dict(r) for r in rows]  # type: ignore[misc]
+
+def get_event_changes(db_path: str, event_id: int) -> Optional[Dict[str, List[ProductSummary]]]:
+    """Diff guardado del evento ({"added", "removed", "updated"}, ordenados por id de producto).
+
+    None si el evento no existe o su diff no esta indexado (base sin "index-products").
+    """
+    with _read(db_path) as conn:
+        row = conn.execute("SELECT changes_indexed FROM events WHERE id = ?", (event_id,)).fetchone();
+        if row is None or not row[0]:
+            return None
+        return _read_changes(conn, event_id)
+
+def _read_changes(conn: sqlite3.Connection, event_id: int) -> Dict[str, List[ProductSummary]]:
+    changes: Dict[str, List[ProductSummary]] = {"added": [], "removed": [], "updated": []}
+    for kind, pid, title, price in conn.execute("""SELECT kind, product_id, title, price FROM product_changes
+                                                WHERE event_id = ?
+                                                ORDER BY product_id ASC""", (event_id,)):
+        changes[kind].append({"id": pid, "title": title, "price": price})
+    return changes
+
+class EventChangeCounts(TypedDict):
+    added: int
+    removed: int
+    updated: int
+
+def get_event_change_counts(db_path: str, event_id: int) -> Optional[EventChangeCounts]:
+    """Cantidad de cambios de cada tipo del evento; None si no existe o su diff no esta indexado."""
+    with _read(db_path) as conn:
+        row = conn.execute("""SELECT changes_indexed, added_count, removed_count, updated_count FROM events
+                           WHERE id = ?""", (event_id,)).fetchone();
+        if row is None or not row[0]:
+            return None
+        if None not in (row[1], row[2], row[3]):
+            return {"added": row[1], "removed": row[2], "updated": row[3]}
+        # Base sin "backfill-metrics": se cuentan las filas guardadas
+        counts: EventChangeCounts = {"added": 0, "removed": 0, "updated": 0}
+        for kind, n in conn.execute("""SELECT kind, COUNT(*) FROM product_changes
+                                    WHERE event_id = ? GROUP BY kind""", (event_id,)):
+            counts[kind] = n  # type: ignore[literal-required]
+        return counts
+
+def list_event_changes(db_path: str, event_id: int, kind: Optional[str] = None,
+                       after_product_id: Optional[str] = None, limit: int = 100) -> List[ProductChange]:
+    """Una pagina de los cambios guardados de un evento, por id de producto ascendente.
+
+    after_product_id es el cursor: el id del ultimo producto de la pagina anterior.
+    """
+    # Con kind la consulta va por idx_product_changes_kind; sin kind, por la clave primaria
+    kind_filter = "AND kind = :kind" if kind is not None else ""
+    cursor_filter = "AND product_id > :after" if after_product_id is not None else ""
+    with _read(db_path) as conn:
+        rows = conn.execute(f"""SELECT product_id AS id, kind, title, price, old_title, old_price
+                            FROM product_changes
+                            WHERE event_id = :event_id {kind_filter} {cursor_filter}
+                            ORDER BY product_id ASC
+                            LIMIT :limit""",
+                            {"event_id": event_id, "kind": kind, "after": after_product_id, "limit": limit}).fetchall();
+        return [dict(r) for r in rows]  # type: ignore[misc]
+
+class ExportedEvent(TypedDict, total=False):
+    id: int
+    source: str
+    hash: str
+    hash_algo: str
+    created_at: str
+    added: List[ProductSummary]
+    removed: List[ProductSummary]
+    updated: List[ProductSummary]
+    # Solo con include_state; None en los eventos compactados
+    state: Optional[ProductState]
+
+def iter_events_export(db_path: str, since_id: int = 0, created_from: Optional[str] = None,
+                       created_to: Optional[str] = None, source: Optional[str] = None,
+                       include_state: bool = False, batch_size: int = 200) -> Iterator[ExportedEvent]:
+    """Eventos con id mayor a since_id (y created_at en [created_from, created_to)), en orden.
+
+    Cada evento trae su diff guardado y, con include_state, el catalogo completo.
+    Se lee por lotes de ids y un evento por vez, sin transaccion abierta entre
+    uno y otro: la memoria no crece con la historia y un cliente lento no frena
+    los checkpoints del WAL. El estado de cada fuente se arrastra de un evento al
+    siguiente, asi que un delta cuesta lo mismo que en _iter_states.
+    """
+    states: Dict[str, Tuple[int, Optional[ProductState]]] = {}
+    last_id = since_id
+    while True:
+        with _read(db_path) as conn:
+            rows = conn.execute(f"""SELECT {_EVENT_FIELDS}, changes_indexed FROM events
+                                WHERE id > ? AND (? IS NULL OR source = ?)
+                                AND (? IS NULL OR created_at >= ?) AND (? IS NULL OR created_at < ?)
+                                ORDER BY id ASC
+                                LIMIT ?""", (last_id, source, source, created_from, created_from,
+                                             created_to, created_to, batch_size)).fetchall();
+        if not rows:
+            return
+        for row in rows:
+            with _read(db_path) as conn:
+                record = _export_record(conn, row, states, include_state)
+            yield record
+        last_id = rows[-1]["id"]
+
+def _export_record(conn: sqlite3.Connection, row: sqlite3.Row,
+                   states: Dict[str, Tuple[int, Optional[ProductState]]], include_state: bool) -> ExportedEvent:
+    event_id, source = row["id"], row["source"]
+    record: ExportedEvent = {"id": event_id, "source": source, "hash": row["hash"], "hash_algo": row["hash_algo"],
+                             "created_at": row["created_at"]}
+    indexed = bool(row["changes_indexed"])
+    state: Optional[ProductState] = None
+    previous: Optional[Tuple[int, Optional[ProductState]]] = None
+    if include_state or not indexed:
+        # Un keyframe con el diff guardado no necesita el estado anterior
+        if row["storage"] == STORAGE_DELTA or not indexed:
+            previous = _previous_export_state(conn, states, source, event_id)
+        state = _export_state(conn, row["storage"], event_id, previous)
+        states[source] = (event_id, state)
+    if indexed:
+        record.update(_read_changes(conn, event_id))  # type: ignore[typeddict-item]
+    else:
+        # Base sin "index-products": el diff se calcula como en el detalle del evento
+        previous_state = previous[1] if previous else None
+        record["added"], record["removed"], record["updated"] = diff_products(previous_state or {}, state or {})
+    if include_state:
+        record["state"] = state
+    return record
+
+def _previous_export_state(conn: sqlite3.Connection, states: Dict[str, Tuple[int, Optional[ProductState]]],
+                           source: str, event_id: int) -> Optional[Tuple[int, Optional[ProductState]]]:
+    # Estado del evento anterior de la fuente: el que se arrastra si es ese, si no se reconstruye
+    row = conn.execute("""SELECT id FROM events WHERE source = ? AND id < ?
+                       ORDER BY id DESC LIMIT 1""", (source, event_id)).fetchone();
+    if row is None:
+        return None
+    cached = states.get(source)
+    if cached is not None and cached[0] == row[0]:
+        return cached
+    return row[0], _load_state(conn, row[0])
+
+def _export_state(conn: sqlite3.Connection, storage: str, event_id: int,
+                  previous: Optional[Tuple[int, Optional[ProductState]]]) -> Optional[ProductState]:
+    if storage == STORAGE_DELTA and previous is not None and previous[1] is not None:
+        row = conn.execute("SELECT delta_json FROM events WHERE id = ?", (event_id,)).fetchone();
+        return apply_delta(previous[1], _loads_delta(row[0]))
+    return _load_state(conn, event_id)
+
+class ProductRow(TypedDict):
+    source: str
+    id: str
+    title: str
+    price: float
+    first_seen_event_id: int
+    last_changed_event_id: int
+    last_changed_at: str
+    removed_event_id: Optional[int]
+    last_seen_event_id: Optional[int]
+    last_seen_at: Optional[str]
+
+# Un producto que sigue en el feed estaba en el ultimo evento de su fuente (source_state)
+_PRODUCT_FIELDS = """p.source, p.product_id AS id, p.title, p.price, p.first_seen_event_id,
+                     p.last_changed_event_id, p.last_changed_at, p.removed_event_id,
+                     CASE WHEN p.removed_event_id IS NULL THEN s.last_event_id ELSE p.last_seen_event_id END
+                        AS last_seen_event_id,
+                     CASE WHEN p.removed_event_id IS NULL THEN s.last_event_at ELSE p.last_seen_at END
+                        AS last_seen_at"""
+_PRODUCT_FROM = "products AS p LEFT JOIN source_state AS s ON s.source = p.source"
+
+def get_product(db_path: str, product_id: str, source: str = DEFAULT_SOURCE) -> Optional[ProductRow]:
+    with _read(db_path) as conn:
+        row = conn.execute(f"SELECT {_PRODUCT_FIELDS} FROM {_PRODUCT_FROM} WHERE p.source = ? AND p.product_id = ?",
+                           (source, product_id)).fetchone();
+        return dict(row) if row else None  # type: ignore[return-value]
+
+def list_products_changed_since(db_path: str, changed_since: Optional[str], limit: int = 50, offset: int = 0,
+                                source: Optional[str] = None) -> List[ProductRow]:
+    """Productos cuyo ultimo cambio es posterior a `changed_since` (ISO), del mas viejo al mas nuevo."""
+    with _read(db_path) as conn:
+        rows = conn.execute(f"""SELECT {_PRODUCT_FIELDS} FROM {_PRODUCT_FROM}
+                            WHERE p.last_changed_at > COALESCE(?, '')
+                              AND (? IS NULL OR p.source = ?)
+                            ORDER BY p.last_changed_at ASC, p.source ASC, p.product_id ASC
+                            LIMIT ? OFFSET ?""",
+                            (changed_since, source, source, limit, offset)).fetchall();
+        return [dict(r) for r in rows]  # type: ignore[misc]
+
+class ProductHistoryRow(TypedDict):
+    event_id: int
+    created_at: str
+    kind: str
+    title: str
+    price: float
+    old_title: Optional[str]
+    old_price: Optional[float]
+
+def list_product_history(db_path: str, product_id: str, source: str = DEFAULT_SOURCE,
+                         limit: int = 100) -> List[ProductHistoryRow]:
+    with _read(db_path) as conn:
+        rows = conn.execute("""SELECT c.event_id, e.created_at, c.kind, c.title, c.price, c.old_title, c.old_price
+                            FROM product_changes AS c
+                            JOIN events AS e ON e.id = c.event_id
+                            WHERE c.source = ? AND c.product_id = ?
+                            ORDER BY c.event_id DESC
+                            LIMIT ?""", (source, product_id, limit)).fetchall();
+        return [dict(r) for r in rows]  # type: ignore[misc]
+
+
 def get_overview_metrics(db_path: str) -> dict:
-    con = sqlite3.connect(db_path)
-    con.row_factory = sqlite3.Row
-    cur = con.cursor()
+    with _read(db_path) as conn:
+        row = conn.execute("""SELECT total_events, sum_added, sum_removed, sum_updated
+                           FROM metrics_totals WHERE id = 1""").fetchone();
 
-    rows = cur.execute("""
-        SELECT id, state_json
-        FROM events
-        ORDER BY id ASC
-    """).fetchall()
+    if row is None:
+        # Base sin backfill: se mantiene el calculo original (lento) hasta correr "backfill-metrics"
+        return _replay_overview_metrics(db_path)
+
+    return {
+        "total_events": row[0],
+        "sum_added": row[1],
+        "sum_removed": row[2],
+        "sum_updated": row[3],
+    }
 
-    con.close()
 
-    total_events = len(rows)
+def _replay_overview_metrics(db_path: str) -> dict:
+    total_events = 0
     sum_added = 0
     sum_removed = 0
     sum_updated = 0
 
-    prev_state: Dict[str, Any] | None = None
-
-    for r in rows:
-        curr_state = _loads_state(r["state_json"])
+    with _read(db_path) as con:
+        for step in _iter_states(con):
+            total_events += 1
+            prev_state = step["previous"]
 
-        if prev_state is None:
-            # primer evento: no tiene "prev", puedes contarlo como added = len(curr)
-            # o 0. Yo recomiendo contarlo como "baseline" y dejarlo en 0.
-            prev_state = curr_state
-            continue
+            if prev_state is None or step["state"] is None:
+                # primer evento: no tiene "prev", puedes contarlo como added = len(curr)
+                # o 0. Yo recomiendo contarlo como "baseline" y dejarlo en 0.
+                continue
 
-        a, rm, up = _diff_counts(prev_state, curr_state)
-        sum_added += a
-        sum_removed += rm
-        sum_updated += up
-        prev_state = curr_state
+            a, rm, up = _diff_counts(prev_state, step["state"])
+            sum_added += a
+            sum_removed += rm
+            sum_updated += up
 
     return {
         "total_events": total_events,
         "sum_added": sum_added,
         "sum_removed": sum_removed,
         "sum_updated": sum_updated,
-    }
\ No newline at end of file
+    }
+
+
+def migrate_event_storage(db_path: str, storage_mode: str, keyframe_interval: int,
+                          codec: str = "zlib", batch_size: int = 200) -> int:
+    """Reescribe la tabla events al modo de almacenamiento indicado.
+
+    En modo delta deja un keyframe cada keyframe_interval eventos y el resto como
+    deltas; en modo full vuelve a guardar el catalogo completo en cada evento.
+    Los keyframes quedan como snapshots comprimidos y los snapshots que ya no
+    referencia ningun evento se eliminan. Devuelve la cantidad de eventos reescritos.
+    """
+    if storage_mode not in (STORAGE_FULL, STORAGE_DELTA):
+        raise ValueError(f"Unknown storage mode '{storage_mode}'.");
+
+    written = 0
+    # Cadena de deltas de cada fuente: (keyframe actual, eventos desde ese keyframe)
+    chains: Dict[str, Tuple[int, int]] = {}
+    updates: List[Tuple[str, Optional[str], Optional[int], Optional[str], int]] = []
+
+    def flush() -> None:
+        conn.executemany("""UPDATE events
+                         SET state_json = NULL, storage = ?, delta_json = ?, keyframe_id = ?, snapshot_hash = ?
+                         WHERE id = ?""", updates);
+        conn.commit()
+        updates.clear()
+
+    with _write(db_path) as conn:
+        for step in _iter_states(conn, batch_size):
+            event_id, storage, curr_state = step["id"], step["storage"], step["state"]
+            if curr_state is None:
+                # Evento compactado: el siguiente de la fuente arranca una cadena nueva
+                chains.pop(step["source"], None)
+                continue
+            chain = chains.get(step["source"])
+            is_keyframe = (
+                storage_mode == STORAGE_FULL
+                or chain is None
+                or chain[1] + 1 >= keyframe_interval
+            )
+            if is_keyframe:
+                chains[step["source"]] = (event_id, 0)
+                if storage != STORAGE_SNAPSHOT:
+                    state_json = serialize_state(curr_state)
+                    snapshot_hash = hash_serialized_state(state_json)
+                    _store_snapshot(conn, snapshot_hash, state_json, codec)
+                    updates.append((STORAGE_SNAPSHOT, None, None, snapshot_hash, event_id))
+            else:
+                keyframe_id, since_keyframe = chain
+                chains[step["source"]] = (keyframe_id, since_keyframe + 1)
+                added, removed, updated = diff_products(step["previous"] or {}, curr_state)
+                delta = make_delta(curr_state, added, removed, updated)
+                updates.append((STORAGE_DELTA, _dumps(delta), keyframe_id, None, event_id))
+            if len(updates) >= batch_size:
+                written += len(updates)
+                flush()
+        written += len(updates)
+        flush()
+        _delete_orphan_snapshots(conn)
+
+    return written
+
+
+class ArchivedEvent(TypedDict, total=False):
+    id: int
+    source: str
+    created_at: str
+    hash: str
+    hash_algo: str
+    added_count: Optional[int]
+    removed_count: Optional[int]
+    updated_count: Optional[int]
+    changes: List[ProductChange]
+    # Solo cuando el evento anterior no esta en el mismo lote; si no, se reconstruye con "changes"
+    state: ProductState
+
+class CompactionStats(TypedDict):
+    events_pruned: int
+    snapshots_written: int
+    snapshots_deleted: int
+
+def _materialize(conn: sqlite3.Connection, event_id: int, state: ProductState, codec: str) -> None:
+    # Convierte un evento en keyframe (snapshot) con el estado ya reconstruido
+    state_json = serialize_state(state)
+    snapshot_hash = hash_serialized_state(state_json)
+    _store_snapshot(conn, snapshot_hash, state_json, codec)
+    conn.execute("""UPDATE events
+                 SET storage = ?, state_json = NULL, delta_json = NULL, keyframe_id = NULL, snapshot_hash = ?
+                 WHERE id = ?""", (STORAGE_SNAPSHOT, snapshot_hash, event_id));
+
+def compact_events(db_path: str, keep_all_before: str, daily_before: Optional[str],
+                   archive: Callable[[str, List[ArchivedEvent]], Any], codec: str = "zlib",
+                   batch_size: int = 200) -> CompactionStats:
+    """Aplica la politica de retencion a los eventos escritos antes de `keep_all_before`.
+
+    Entre `daily_before` y `keep_all_before` se conserva el catalogo del ultimo evento
+    de cada dia (UTC); antes de `daily_before` (o en todo el tramo si es None) solo
+    quedan el resumen y el diff de cada evento. El ultimo evento de cada fuente se
+    conserva siempre. Los catalogos que se borran pasan antes por `archive`, que
+    recibe la fuente y el lote de eventos en orden; cada lote se confirma despues de
+    archivarlo. Los contadores y metrics_totals no cambian: los eventos no se borran.
+    El writer se toma por lote, asi el monitor puede escribir entre lotes.
+    """
+    stats: CompactionStats = {"events_pruned": 0, "snapshots_written": 0, "snapshots_deleted": 0}
+    with _read(db_path) as conn:
+        if conn.execute("SELECT 1 FROM metrics_totals WHERE id = 1").fetchone() is None:
+            raise ValueError("metrics_totals is missing: run backfill-metrics before compacting.");
+        sources = [r[0] for r in conn.execute("SELECT DISTINCT source FROM events")]
+    for source in sources:
+        _compact_source(db_path, source, keep_all_before, daily_before, archive, codec, batch_size, stats)
+    with _write(db_path) as conn:
+        stats["snapshots_deleted"] = _delete_orphan_snapshots(conn)
+    return stats
+
+def _compact_source(db_path: str, source: str, keep_all_before: str, daily_before: Optional[str],
+                    archive: Callable[[str, List[ArchivedEvent]], Any], codec: str, batch_size: int,
+                    stats: CompactionStats) -> None:
+    latest_id = get_latest_event_id(db_path, source)
+    # Ultimo evento procesado y su estado, para no reconstruir deltas desde el keyframe
+    prev: Optional[Tuple[int, Optional[ProductState]]] = None
+    last_id = 0
+    while True:
+        with _write(db_path) as conn:
+            prev, last_id = _compact_batch(conn, source, latest_id, last_id, prev, keep_all_before,
+                                           daily_before, archive, codec, batch_size, stats)
+        if last_id is None:
+            return
+
+def _compact_batch(conn: sqlite3.Connection, source: str, latest_id: int, last_id: int,
+                   prev: Optional[Tuple[int, Optional[ProductState]]], keep_all_before: str,
+                   daily_before: Optional[str], archive: Callable[[str, List[ArchivedEvent]], Any],
+                   codec: str, batch_size: int, stats: CompactionStats
+                   ) -> Tuple[Optional[Tuple[int, Optional[ProductState]]], Optional[int]]:
+    # Devuelve el cache del ultimo evento y el id desde el que sigue (None al terminar)
+    rows = conn.execute("""SELECT id, created_at, hash, hash_algo, storage, state_json, snapshot_hash, delta_json,
+                               added_count, removed_count, updated_count, changes_indexed
+                        FROM events
+                        WHERE source = ? AND id > ? AND id < ? AND created_at < ? AND storage != ?
+                        ORDER BY id ASC
+                        LIMIT ?""",
+                        (source, last_id, latest_id, keep_all_before, STORAGE_PRUNED, batch_size)).fetchall();
+    if not rows:
+        return prev, None
+    batch_last = rows[-1]["id"]
+    # El evento siguiente al lote: fija si el ultimo del lote cierra su dia y, si es
+    # un delta encadenado a un keyframe del lote, hay que reconstruirlo antes de borrar
+    after = conn.execute("""SELECT id, created_at, storage, keyframe_id FROM events
+                         WHERE source = ? AND id > ?
+                         ORDER BY id ASC LIMIT 1""", (source, batch_last)).fetchone();
+    after_state: Optional[ProductState] = None
+    if after is not None and after["storage"] == STORAGE_DELTA and after["keyframe_id"] <= batch_last:
+        after_state = _load_state(conn, after["id"])
+
+    archived: List[ArchivedEvent] = []
+    for i, row in enumerate(rows):
+        event_id = row["id"]
+        previous_id = conn.execute("SELECT MAX(id) FROM events WHERE source = ? AND id < ?",
+                                   (source, event_id)).fetchone()[0];
+        previous: Optional[ProductState]
+        if previous_id is None:
+            previous = {}
+        elif prev is not None and prev[0] == previous_id:
+            previous = prev[1]
+        else:
+            previous = _load_state(conn, previous_id)
+
+        if row["storage"] == STORAGE_DELTA:
+            # Un delta nunca sigue a un evento compactado: su anterior siempre tiene estado
+            state = apply_delta(previous or {}, _loads_delta(row["delta_json"]))
+        else:
+            state = _keyframe_state(conn, row["storage"], row["state_json"], row["snapshot_hash"])
+        prev = (event_id, state)
+
+        if not row["changes_indexed"] and previous is not None:
+            changes = product_changes(previous, *diff_products(previous, state))
+            conn.executemany("""INSERT OR REPLACE INTO product_changes
+                             (event_id, source, product_id, kind, title, price, old_title, old_price)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                             [(event_id, source, c["id"], c["kind"], c["title"], c["price"],
+                               c["old_title"], c["old_price"]) for c in changes]);
+            conn.execute("UPDATE events SET changes_indexed = 1 WHERE id = ?", (event_id,));
+        elif not row["changes_indexed"]:
+            # Sin el estado anterior no hay diff que conservar: el catalogo se queda
+            if row["storage"] == STORAGE_DELTA:
+                _materialize(conn, event_id, state, codec)
+                stats["snapshots_written"] += 1
+            continue
+
+        next_created = rows[i + 1]["created_at"] if i + 1 < len(rows) else (after["created_at"] if after else None)
+        day_last = next_created is None or next_created[:10] != row["created_at"][:10]
+        if daily_before is not None and row["created_at"] >= daily_before and day_last:
+            if row["storage"] == STORAGE_DELTA:
+                _materialize(conn, event_id, state, codec)
+                stats["snapshots_written"] += 1
+            continue
+
+        event_hash, hash_algo = row["hash"], row["hash_algo"]
+        if hash_algo != HASH_BUCKETS:
+            # Ultima vez que se tiene el catalogo: el hash viejo se pasa a la raiz antes de borrarlo
+            event_hash, hash_algo = hash_state(state).root, HASH_BUCKETS
+            conn.execute("UPDATE events SET hash = ?, hash_algo = ? WHERE id = ?", (event_hash, hash_algo, event_id));
+        record: ArchivedEvent = {
+            "id": event_id, "source": source, "created_at": row["created_at"], "hash": event_hash,
+            "hash_algo": hash_algo,
+            "added_count": row["added_count"], "removed_count": row["removed_count"],
+            "updated_count": row["updated_count"], "changes": _stored_product_changes(conn, event_id),
+        }
+        if not archived or archived[-1]["id"] != previous_id:
+            record["state"] = state
+        archived.append(record)
+        conn.execute("""UPDATE events
+                     SET storage = ?, state_json = NULL, delta_json = NULL, keyframe_id = NULL, snapshot_hash = NULL,
+                         bucket_hashes = NULL
+                     WHERE id = ?""", (STORAGE_PRUNED, event_id));
+
+    if after_state is not None:
+        old_keyframe = after["keyframe_id"]
+        _materialize(conn, after["id"], after_state, codec)
+        conn.execute("""UPDATE events SET keyframe_id = ?
+                     WHERE source = ? AND storage = ? AND keyframe_id = ? AND id > ?""",
+                     (after["id"], source, STORAGE_DELTA, old_keyframe, after["id"]));
+        stats["snapshots_written"] += 1
+
+    if archived:
+        archive(source, archived)
+    stats["events_pruned"] += len(archived)
+    return prev, batch_last
+
+def _delete_orphan_snapshots(conn: sqlite3.Connection) -> int:
+    cur = conn.execute("""DELETE FROM snapshots
+                       WHERE hash NOT IN (SELECT snapshot_hash FROM events
+                                          WHERE snapshot_hash IS NOT NULL)""");
+    return cur.rowcount
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"))
+
+
+def incremental_vacuum(db_path: str, max_pages: int = 0) -> bool:
+    """Devuelve al sistema las paginas libres (todas si max_pages es 0).
+
+    Las bases creadas sin auto_vacuum=INCREMENTAL necesitan un VACUUM completo para
+    cambiar de modo; se hace una sola vez y devuelve True en ese caso.
+    """
+    with get_pool(db_path).write() as conn:
+        conn.commit()
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL");
+            conn.execute("VACUUM");
+            return True
+        conn.execute(f"PRAGMA incremental_vacuum({int(max_pages)})").fetchall();
+        return False
+
+def vacuum(db_path: str) -> None:
+    # VACUUM no puede correr dentro de una transaccion: se usa el writer sin abrir una
+    with get_pool(db_path).write() as conn:
+        conn.commit()
+        conn.execute("VACUUM");
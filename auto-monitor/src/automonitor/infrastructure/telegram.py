@@ -1,13 +1,84 @@
+from typing import List, Optional
 import httpx;
 
-def send_telegram_message(token: str, chat_id: str, text: str) -> None:
-    url = f"https://api.telegram.org/bot{token}/sendMessage";
-    payload = {
-        "chat_id": chat_id,
-        "text": text,
-        "disable_web_page_preview": True,
-    }
-
-    with httpx.Client(timeout=15.0) as client:
-        res = client.post(url, json=payload);
-        res.raise_for_status();
\ No newline at end of file
+DEFAULT_API_BASE = "https://api.telegram.org"
+
+# Limite de Telegram para el texto de un mensaje
+MAX_MESSAGE_LENGTH = 4096
+
+def send_telegram_message(token: str, chat_id: str, text: str, api_base: str = DEFAULT_API_BASE) -> None:
+    with TelegramClient(token, chat_id, api_base=api_base) as client:
+        client.send(text);
+
+class TelegramSendError(Exception):
+    """Fallo al enviar; `retry_after` trae la espera pedida por Telegram (429), si la hay.
+
+    `permanent` marca un 4xx que no se arregla reintentando (token o chat invalido,
+    mensaje rechazado).
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None, permanent: bool = False) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.permanent = permanent
+
+class TelegramClient:
+    """Un solo httpx.Client (con keep-alive) para todos los envios."""
+
+    def __init__(self, token: str, chat_id: str, api_base: str = DEFAULT_API_BASE, timeout_seconds: float = 15.0) -> None:
+        self._url = f"{api_base.rstrip('/')}/bot{token}/sendMessage";
+        self._chat_id = chat_id
+        self._client = httpx.Client(timeout=timeout_seconds)
+
+    def send(self, text: str) -> None:
+        payload = {
+            "chat_id": self._chat_id,
+            "text": text,
+            "disable_web_page_preview": True,
+        }
+        try:
+            res = self._client.post(self._url, json=payload);
+        except httpx.HTTPError as e:
+            raise TelegramSendError(f"{type(e).__name__}: {e}") from e
+        if res.status_code == 429:
+            retry_after = None
+            try:
+                retry_after = float(res.json().get("parameters", {}).get("retry_after"))
+            except (ValueError, TypeError, AttributeError):
+                pass
+            raise TelegramSendError("429 Too Many Requests", retry_after=retry_after)
+        if res.is_error:
+            # 408 es un timeout del lado de Telegram: se reintenta como un 5xx
+            raise TelegramSendError(f"{res.status_code} {res.text[:200]}",
+                                    permanent=res.is_client_error and res.status_code != 408)
+
+    def close(self) -> None:
+        self._client.close();
+
+    def __enter__(self) -> "TelegramClient":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Parte un texto en mensajes de hasta `limit` caracteres, cortando por lineas
+    cuando se puede y a la fuerza solo si una linea sola no entra."""
+    parts: List[str] = []
+    current = ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            parts.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        parts.append(current)
+    return parts
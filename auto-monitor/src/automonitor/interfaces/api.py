@@ -1,20 +1,123 @@
 from __future__ import annotations
 
 import os
-from fastapi import FastAPI, HTTPException, Query
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 
-from ..config import get_settings
+from ..config import DEFAULT_SOURCE_NAME, Settings, get_settings
+from .event_stream import EventBroadcaster
+from .prometheus import CONTENT_TYPE as PROMETHEUS_CONTENT_TYPE, render_metrics
 from ..application.query_service import (
     list_event_summaries_paged,
     get_event_detail,
-    get_latest_event_detail,
-    get_metrics
+    get_event_version,
+    get_latest_event_version,
+    is_final_version,
+    EventVersion,
+    project_event_detail,
+    EVENT_DETAIL_FIELDS,
+    EVENT_DIFF_FIELDS,
+    get_metrics,
+    get_runs_metrics,
+    get_runtime_counters,
+    list_recent_runs,
+    get_sources,
+    get_product_history,
+    list_changed_products,
+    export_events,
+    get_timeseries,
+    get_event_changes_page,
 )
 
+# Para las respuestas que ya no pueden cambiar (ver _event_cache_control)
+_IMMUTABLE = "public, max-age=31536000, immutable"
+# El resto se revalida con el ETag: la compactacion puede reescribir el catalogo y
+# /events/latest apunta a otro evento cuando llega uno nuevo
+_REVALIDATE = "no-cache"
+
+def _detail_fields(fields: str | None, include: str | None) -> tuple[str, ...]:
+    if fields:
+        requested = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = sorted(set(requested) - set(EVENT_DETAIL_FIELDS))
+        if unknown:
+            raise HTTPException(status_code=422, detail=f"Unknown fields: {', '.join(unknown)}")
+        return tuple(f for f in EVENT_DETAIL_FIELDS if f in requested)
+    if include is None or include == "all":
+        return EVENT_DETAIL_FIELDS
+    if include == "diff":
+        return EVENT_DIFF_FIELDS
+    raise HTTPException(status_code=422, detail="include must be 'diff' or 'all'")
+
+def _etag(version: EventVersion, fields: tuple[str, ...]) -> str:
+    # Etag fuerte: el hash del estado no alcanza solo (dos eventos pueden llegar al
+    # mismo estado), cada proyeccion es una representacion distinta y la compactacion
+    # cambia el storage (un evento pruned ya no trae su catalogo)
+    if fields == EVENT_DETAIL_FIELDS:
+        projection = "all"
+    elif fields == EVENT_DIFF_FIELDS:
+        projection = "diff"
+    else:
+        projection = ".".join(fields)
+    return f'"{version["id"]}-{version["storage"]}-{version["hash"][:16]}-{projection}"'
+
+def _event_cache_control(settings: Settings, version: EventVersion, fields: tuple[str, ...]) -> str:
+    # El diff y el resumen no cambian despues del insert; el catalogo solo lo borra la
+    # compactacion, que no corre con la retencion apagada ni vuelve sobre un evento pruned
+    if "state" not in fields or settings.retention_keep_all_days <= 0 or is_final_version(version):
+        return _IMMUTABLE
+    return _REVALIDATE
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [c.strip().removeprefix("W/") for c in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def _event_response(request: Request, db_path: str, version: EventVersion,
+                    fields: tuple[str, ...], cache_control: str) -> Response:
+    headers = {"ETag": _etag(version, fields), "Cache-Control": cache_control}
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    detail = get_event_detail(db_path, version["id"], include_state="state" in fields)
+    if detail is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    return JSONResponse(project_event_detail(detail, fields), headers=headers)
+
+
+def _resume_id(request: Request, last_event_id: int | None) -> int | None:
+    # EventSource reenvia el ultimo id en el header al reconectar; el query sirve para la primera conexion
+    header = request.headers.get("last-event-id")
+    if header:
+        try:
+            return int(header)
+        except ValueError:
+            raise HTTPException(status_code=422, detail="Last-Event-ID must be an event id")
+    return last_event_id
+
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="AutoMonitor API", version="0.1.0")
+    # Un broadcaster por base: todos los clientes de /events/stream comparten sus lecturas
+    broadcasters: Dict[str, EventBroadcaster] = {}
+
+    def broadcaster_for(settings: Settings) -> EventBroadcaster:
+        broadcaster = broadcasters.get(settings.db_path)
+        if broadcaster is None:
+            broadcaster = EventBroadcaster(settings.db_path, poll_seconds=settings.stream_poll_seconds)
+            broadcasters[settings.db_path] = broadcaster
+        return broadcaster
+
+    @asynccontextmanager
+    async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+        yield
+        for broadcaster in broadcasters.values():
+            await broadcaster.close()
+
+    app = FastAPI(title="AutoMonitor API", version="0.1.0", lifespan=lifespan)
 
     cors_origins = os.getenv("CORS_ORIGINS", "")
     origins = [o.strip() for o in cors_origins.split(",") if o.strip()]
@@ -25,7 +128,9 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["ETag"],
     )
+    app.add_middleware(GZipMiddleware, minimum_size=1024)
 
     @app.get("/health")
     def health() -> dict:
@@ -35,35 +140,161 @@ def create_app() -> FastAPI:
     def events(
         limit: int = Query(default=50, ge=1, le=200),
         offset: int = Query(default=0, ge=0),
+        before_id: int | None = Query(default=None, ge=1),
+        source: str | None = Query(default=None),
     ) -> dict:
         settings = get_settings()
         return list_event_summaries_paged(
             settings.db_path,
             limit=limit,
             offset=offset,
+            before_id=before_id,
+            source=source,
         )
 
+    @app.get("/sources")
+    def sources() -> dict:
+        settings = get_settings()
+        return {"items": get_sources(settings.db_path)}
+
+    @app.get("/events/stream")
+    async def events_stream(
+        request: Request,
+        last_event_id: int | None = Query(default=None, ge=0),
+    ) -> StreamingResponse:
+        settings = get_settings()
+        resume = _resume_id(request, last_event_id)
+        return StreamingResponse(broadcaster_for(settings).stream(resume), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @app.get("/events/export")
+    def events_export(
+        request: Request,
+        since_id: int = Query(default=0, ge=0),
+        created_from: str | None = Query(default=None, alias="from"),
+        created_to: str | None = Query(default=None, alias="to"),
+        source: str | None = Query(default=None),
+        include: str | None = Query(default=None),
+    ) -> StreamingResponse:
+        settings = get_settings()
+        if include not in (None, "diff", "state"):
+            raise HTTPException(status_code=422, detail="include must be 'diff' or 'state'")
+        # Se comprime aca (nivel 6, de a un evento) y el GZipMiddleware deja pasar la respuesta ya codificada
+        gzip = "gzip" in request.headers.get("accept-encoding", "")
+        try:
+            lines = export_events(settings.db_path, since_id, created_from, created_to, source,
+                                  include_state=include == "state", gzip=gzip)
+        except ValueError:
+            raise HTTPException(status_code=422, detail="from and to must be ISO 8601 timestamps")
+        headers = {"Cache-Control": "no-store", "Vary": "Accept-Encoding"}
+        if gzip:
+            headers["Content-Encoding"] = "gzip"
+        return StreamingResponse(lines, media_type="application/x-ndjson", headers=headers)
+
     @app.get("/events/latest")
-    def latest_event() -> dict:
+    def latest_event(
+        request: Request,
+        source: str | None = Query(default=None),
+        fields: str | None = Query(default=None),
+        include: str | None = Query(default=None),
+    ) -> Response:
         settings = get_settings()
-        detail = get_latest_event_detail(settings.db_path)
-        if detail is None:
+        projection = _detail_fields(fields, include)
+        version = get_latest_event_version(settings.db_path, source)
+        if version is None:
             raise HTTPException(status_code=404, detail="No events yet")
-        return detail
+        return _event_response(request, settings.db_path, version, projection, _REVALIDATE)
     
     @app.get("/metrics/overview")
     def overview_metrics() -> dict:
         settings = get_settings()
         return get_metrics(settings.db_path)
 
+    @app.get("/metrics/timeseries")
+    def timeseries_metrics(
+        bucket: str = Query(default="day", pattern="^(hour|day)$"),
+        created_from: str | None = Query(default=None, alias="from"),
+        created_to: str | None = Query(default=None, alias="to"),
+        source: str | None = Query(default=None),
+    ) -> dict:
+        settings = get_settings()
+        try:
+            return get_timeseries(settings.db_path, bucket, created_from, created_to, source)
+        except ValueError:
+            raise HTTPException(status_code=422, detail="from and to must be ISO 8601 timestamps")
+
+    @app.get("/metrics/runs")
+    def runs_metrics() -> dict:
+        settings = get_settings()
+        return get_runs_metrics(settings.db_path)
+
+    @app.get("/runs")
+    def runs(
+        limit: int = Query(default=100, ge=1, le=1000),
+        before_id: int | None = Query(default=None, ge=1),
+        source: str | None = Query(default=None),
+    ) -> dict:
+        settings = get_settings()
+        return list_recent_runs(settings.db_path, limit=limit, before_id=before_id, source=source)
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def prometheus_metrics() -> Response:
+        settings = get_settings()
+        data = get_runtime_counters(settings.db_path)
+        return Response(render_metrics(data["counters"], data["notifications"]), media_type=PROMETHEUS_CONTENT_TYPE)
+
+    @app.get("/products")
+    def products(
+        changed_since: str | None = Query(default=None),
+        source: str | None = Query(default=None),
+        limit: int = Query(default=50, ge=1, le=500),
+        offset: int = Query(default=0, ge=0),
+    ) -> dict:
+        settings = get_settings()
+        try:
+            return list_changed_products(settings.db_path, changed_since, limit=limit, offset=offset, source=source)
+        except ValueError:
+            raise HTTPException(status_code=422, detail="changed_since must be an ISO 8601 timestamp")
+
+    @app.get("/products/{product_id}/history")
+    def product_history(
+        product_id: str,
+        source: str = Query(default=DEFAULT_SOURCE_NAME),
+        limit: int = Query(default=100, ge=1, le=1000),
+    ) -> dict:
+        settings = get_settings()
+        history = get_product_history(settings.db_path, product_id, source, limit=limit)
+        if history is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return history
+
+    @app.get("/events/{event_id}/changes")
+    def event_changes(
+        event_id: int,
+        kind: str | None = Query(default=None, pattern="^(added|removed|updated)$"),
+        cursor: str | None = Query(default=None),
+        limit: int = Query(default=100, ge=1, le=1000),
+    ) -> dict:
+        settings = get_settings()
+        page = get_event_changes_page(settings.db_path, event_id, kind, cursor, limit)
+        if page is None:
+            raise HTTPException(status_code=404, detail="Event not found")
+        return page
 
     @app.get("/events/{event_id}")
-    def event_detail(event_id: int) -> dict:
+    def event_detail(
+        request: Request,
+        event_id: int,
+        fields: str | None = Query(default=None),
+        include: str | None = Query(default=None),
+    ) -> Response:
         settings = get_settings()
-        detail = get_event_detail(settings.db_path, event_id)
-        if detail is None:
+        projection = _detail_fields(fields, include)
+        version = get_event_version(settings.db_path, event_id)
+        if version is None:
             raise HTTPException(status_code=404, detail="Event not found")
-        return detail
+        return _event_response(request, settings.db_path, version, projection,
+                               _event_cache_control(settings, version, projection))
     
     return app
 
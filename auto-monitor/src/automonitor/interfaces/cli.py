@@ -1,11 +1,13 @@
+import argparse
 import logging
 import sys
 from datetime import datetime, timezone
 
 from ..config import get_settings
-from ..application.monitor_service import run_monitor
-from ..infrastructure.telegram import send_telegram_message
-from ..infrastructure.scheduler import run_scheduler
+from ..application.monitor_service import (run_monitor_all, backfill_metrics, migrate_storage, index_products,
+                                           compact_history, rebuild_history, RebuildStatus)
+from ..application.query_service import export_events
+from ..infrastructure.notifier import NotificationDispatcher, queue_notification
 
 logging.basicConfig(
     level=logging.INFO,
@@ -15,11 +17,21 @@ logging.basicConfig(
 
 def run_once() -> None:
     settings = get_settings();
-    result = run_monitor(settings.source_url, settings.db_path)
+    source_urls = {s.name: s.url for s in settings.sources}
+
+    for result in run_monitor_all(settings):
+        source = result["source"]
+        if result.get("error"):
+            logging.error("Monitor run failed | source=%s error=%s", source, result["error"])
+            continue
+
+        if not result["changed"]:
+            logging.info("No changes detected | source=%s outcome=%s", source, result["outcome"])
+            continue
 
-    if result["changed"]:
         logging.info(
-         "Change detected | added=%s removed=%s updated=%s",
+         "Change detected | source=%s added=%s removed=%s updated=%s",
+            source,
             len(result["added"]),
             len(result["removed"]),
             len(result["updated"]),
@@ -31,18 +43,21 @@ def run_once() -> None:
                 format_products("Added", result["added"]),
                 format_products("Removed", result["removed"]),
                 format_products("Updated", result["updated"]),
-                f"Source: {settings.source_url}",
+                f"Source: {source} ({source_urls.get(source, '?')})",
             ])
-            send_telegram_message(
-                settings.telegram_bot_token,
-                settings.telegram_chat_id,
-                msg
-            )
-            logging.info("Telegram notification sent.")
+            queue_notification(settings.db_path, msg)
+            logging.info("Telegram notification queued.")
         else:
             logging.info("Telegram settings not configured; skipping notification.")
-    else:
-        logging.info("No changes detected.")
+
+    # Con todas las fuentes ya procesadas se envia la cola (incluye lo que quedo
+    # pendiente de corridas anteriores); lo que falle se reintenta en la proxima
+    dispatcher = NotificationDispatcher.from_settings(settings)
+    if dispatcher is not None:
+        try:
+            dispatcher.drain()
+        finally:
+            dispatcher.stop()
 
 def format_products(label: str, items: list[dict], limit: int = 5) -> str:
     if not items:
@@ -59,10 +74,63 @@ def format_products(label: str, items: list[dict], limit: int = 5) -> str:
         lines.append(f"... + {len(items) - limit} más")
     return "\n".join(lines)
 
+def rebuild(argv: list[str]) -> None:
+    parser = argparse.ArgumentParser(prog="cli rebuild",
+                                     description="Recompute counts, diffs, products, totals and rollups in parallel.")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="event ids per chunk and per transaction")
+    parser.add_argument("--restart", action="store_true", help="discard an interrupted rebuild and start over")
+    args = parser.parse_args(argv)
+    if args.chunk_size < 1 or (args.workers is not None and args.workers < 1):
+        raise SystemExit("--workers and --chunk-size must be at least 1.")
+
+    def report(status: RebuildStatus) -> None:
+        rate = status.events / status.elapsed_seconds if status.elapsed_seconds else 0.0
+        logging.info("Rebuild progress | event=%s/%s (%.1f%%) events/s=%.0f", status.last_event_id,
+                     status.target_id, 100.0 * status.last_event_id / max(status.target_id, 1), rate)
+
+    settings = get_settings()
+    status = rebuild_history(settings.db_path, workers=args.workers, chunk_size=args.chunk_size,
+                             restart=args.restart, progress=report)
+    logging.info("Rebuild finished | events=%s seconds=%.1f", status.events, status.elapsed_seconds)
+
+def export_history(argv: list[str]) -> None:
+    parser = argparse.ArgumentParser(prog="cli export", description="Write the event history as NDJSON.")
+    parser.add_argument("--since-id", type=int, default=0, help="only events with a greater id")
+    parser.add_argument("--from", dest="created_from", help="only events created at or after this ISO 8601 time")
+    parser.add_argument("--to", dest="created_to", help="only events created before this ISO 8601 time")
+    parser.add_argument("--source")
+    parser.add_argument("--state", action="store_true", help="include the full catalog of each event")
+    parser.add_argument("--out", help="output file (gzip-compressed if it ends in .gz); stdout by default")
+    args = parser.parse_args(argv)
+
+    settings = get_settings()
+    gzip = bool(args.out and args.out.endswith(".gz"))
+    try:
+        chunks = export_events(settings.db_path, args.since_id, args.created_from, args.created_to, args.source,
+                               include_state=args.state, gzip=gzip)
+    except ValueError:
+        raise SystemExit("--from and --to must be ISO 8601 timestamps.")
+    out = open(args.out, "wb") if args.out else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if args.out:
+            out.close()
+        else:
+            out.flush()
+
 def main() -> None:
     # Uso:
     # python -m src.automonitor.interfaces.cli run
     # python -m src.automonitor.interfaces.cli watch
+    # python -m src.automonitor.interfaces.cli backfill-metrics
+    # python -m src.automonitor.interfaces.cli migrate-storage
+    # python -m src.automonitor.interfaces.cli index-products
+    # python -m src.automonitor.interfaces.cli compact
+    # python -m src.automonitor.interfaces.cli rebuild [--workers N] [--chunk-size N] [--restart]
+    # python -m src.automonitor.interfaces.cli export [--since-id N] [--from TS] [--to TS] [--source S] [--state] [--out F]
     cmd = sys.argv[1] if len(sys.argv) > 1 else "run"
 
     if cmd == "run":
@@ -70,11 +138,51 @@ def main() -> None:
         return
 
     if cmd == "watch":
+        # APScheduler solo hace falta aca: "run" (cron) no paga su import
+        from ..infrastructure.scheduler import run_scheduler
         settings = get_settings()
         run_scheduler(settings)
         return
 
-    raise SystemExit("Usage: python -m src.automonitor.cli [run|watch]")
+    if cmd == "backfill-metrics":
+        settings = get_settings()
+        written = backfill_metrics(settings.db_path)
+        logging.info("Metrics backfill finished | events updated=%s", written)
+        return
+
+    if cmd == "migrate-storage":
+        settings = get_settings()
+        written = migrate_storage(settings.db_path, settings.storage_mode, settings.keyframe_interval,
+                                  snapshot_codec=settings.snapshot_codec)
+        logging.info("Storage migration finished | mode=%s events rewritten=%s", settings.storage_mode, written)
+        return
+
+    if cmd == "index-products":
+        settings = get_settings()
+        written = index_products(settings.db_path)
+        logging.info("Product index rebuilt | product changes=%s", written)
+        return
+
+    if cmd == "compact":
+        settings = get_settings()
+        if settings.retention_keep_all_days <= 0:
+            raise SystemExit("Set RETENTION_KEEP_ALL_DAYS to enable compaction.")
+        stats = compact_history(settings.db_path, settings.retention_keep_all_days, settings.retention_daily_days,
+                                settings.archive_dir, snapshot_codec=settings.snapshot_codec)
+        logging.info("Compaction finished | pruned=%s snapshots written=%s snapshots deleted=%s archives=%s full vacuum=%s",
+                     stats["events_pruned"], stats["snapshots_written"], stats["snapshots_deleted"],
+                     stats["archived_files"], stats["full_vacuum"])
+        return
+
+    if cmd == "rebuild":
+        rebuild(sys.argv[2:])
+        return
+
+    if cmd == "export":
+        export_history(sys.argv[2:])
+        return
+
+    raise SystemExit("Usage: python -m src.automonitor.cli [run|watch|backfill-metrics|migrate-storage|index-products|compact|rebuild|export]")
 
 
 if __name__ == "__main__":
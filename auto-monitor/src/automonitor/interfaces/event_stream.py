@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, List, Optional, Set
+
+from ..application.query_service import EventSummary, get_latest_event_id, get_metrics, list_event_summaries_after
+
+logger = logging.getLogger(__name__)
+
+# Mensajes pendientes por cliente; uno que se atrasa mas se desconecta y retoma con Last-Event-ID
+QUEUE_SIZE = 256
+# Eventos que se reenvian al reconectar; si falto mas, el cliente recibe "reset" y recarga /events
+REPLAY_LIMIT = 1000
+HEARTBEAT_SECONDS = 15.0
+_PAGE = 200
+
+def _message(event: str, data: object, event_id: Optional[int] = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+class _Subscriber:
+    def __init__(self) -> None:
+        self.queue: "asyncio.Queue[tuple[int, str]]" = asyncio.Queue(QUEUE_SIZE)
+        self.dropped = False
+
+class EventBroadcaster:
+    """Reparte los eventos nuevos a todos los clientes de /events/stream.
+
+    Los eventos los escribe otro proceso (run/watch), asi que un unico lector
+    consulta la base cada `poll_seconds` mientras haya clientes conectados: una
+    lectura por el PK si no hay nada nuevo, y un resumen de los eventos nuevos mas
+    las metricas cuando los hay, sin importar cuantos clientes esten escuchando.
+    """
+
+    def __init__(self, db_path: str, poll_seconds: float = 1.0) -> None:
+        self.db_path = db_path
+        self._poll_seconds = poll_seconds
+        self._subscribers: Set[_Subscriber] = set()
+        self._task: Optional[asyncio.Task[None]] = None
+        self._last_id = 0
+        self.metrics: Optional[dict] = None
+        self._start_lock = asyncio.Lock()
+
+    async def _subscribe(self) -> tuple[_Subscriber, int]:
+        """Registra un cliente y devuelve el ultimo id ya publicado: lo que siga llega por su cola."""
+        subscriber = _Subscriber()
+        async with self._start_lock:
+            if self._task is None or self._task.done():
+                self._last_id = await asyncio.to_thread(get_latest_event_id, self.db_path)
+                self.metrics = await asyncio.to_thread(get_metrics, self.db_path)
+                self._subscribers.add(subscriber)
+                self._task = asyncio.create_task(self._poll())
+            else:
+                self._subscribers.add(subscriber)
+            # Sin await entre el alta y la lectura de _last_id: no se puede colar una publicacion
+            return subscriber, self._last_id
+
+    def _unsubscribe(self, subscriber: _Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+
+    async def _poll(self) -> None:
+        while self._subscribers:
+            try:
+                events = await asyncio.to_thread(list_event_summaries_after, self.db_path, self._last_id, _PAGE)
+                if events:
+                    self.metrics = await asyncio.to_thread(get_metrics, self.db_path)
+                    self._publish(events, self.metrics)
+                    self._last_id = events[-1]["id"]
+                    if len(events) == _PAGE:
+                        continue
+            except Exception:
+                logger.exception("Event stream poll failed")
+            await asyncio.sleep(self._poll_seconds)
+
+    def _publish(self, events: List[EventSummary], metrics: dict) -> None:
+        messages = [(e["id"], _message("change", e, e["id"])) for e in events]
+        messages.append((events[-1]["id"], _message("metrics", metrics)))
+        for subscriber in list(self._subscribers):
+            try:
+                for item in messages:
+                    subscriber.queue.put_nowait(item)
+            except asyncio.QueueFull:
+                subscriber.dropped = True
+                self._unsubscribe(subscriber)
+
+    async def stream(self, last_event_id: Optional[int]) -> AsyncIterator[str]:
+        """Mensajes SSE para un cliente: primero lo que se perdio desde last_event_id, despues en vivo."""
+        # Se suscribe antes de leer lo atrasado: lo que llegue mientras tanto queda en la cola
+        subscriber, sent_id = await self._subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            if last_event_id is not None and last_event_id < sent_id:
+                missed = await asyncio.to_thread(list_event_summaries_after, self.db_path, last_event_id,
+                                                 REPLAY_LIMIT + 1)
+                if len(missed) > REPLAY_LIMIT:
+                    yield _message("reset", {"last_event_id": sent_id})
+                else:
+                    for event in missed:
+                        yield _message("change", event, event["id"])
+                    sent_id = max(sent_id, missed[-1]["id"]) if missed else sent_id
+            yield _message("metrics", self.metrics)
+
+            while True:
+                if subscriber.dropped and subscriber.queue.empty():
+                    return
+                try:
+                    event_id, message = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if message.startswith("id: ") and event_id <= sent_id:
+                    continue
+                sent_id = max(sent_id, event_id)
+                yield message
+        finally:
+            self._unsubscribe(subscriber)
+
+    async def close(self) -> None:
+        self._subscribers.clear()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import math
+from typing import Dict, List, Tuple
+
+from ..infrastructure.sqlite_repo import DURATION_BUCKETS
+
+# Formato de texto de Prometheus (version 0.0.4)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_SKIPPED_OUTCOMES = ("not_modified", "unchanged_body")
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(**labels: str) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+def _value(value: float) -> str:
+    # Enteros tal cual y floats con repr (ida y vuelta exacta): "{:g}" escribia 1e+06 para 1000001
+    if isinstance(value, int):
+        return str(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+class _Writer:
+    def __init__(self) -> None:
+        self.lines: List[str] = []
+
+    def family(self, name: str, kind: str, help_text: str) -> None:
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value: float, **labels: str) -> None:
+        self.lines.append(f"{name}{_labels(**labels)} {_value(value)}")
+
+def render_metrics(counters: Dict[str, int], notifications: Dict[str, int]) -> str:
+    """Arma /metrics a partir de la tabla counters (la mantiene record_run / insert_event)."""
+    out = _Writer()
+
+    runs: List[Tuple[str, str, int]] = []
+    histograms: Dict[str, Dict[str, int]] = {}
+    events: List[Tuple[str, int]] = []
+    for name, value in sorted(counters.items()):
+        parts = name.split(":")
+        if parts[0] == "runs" and len(parts) >= 3:
+            runs.append((":".join(parts[1:-1]), parts[-1], value))
+        elif parts[0] == "phase_seconds" and len(parts) == 3:
+            histograms.setdefault(parts[1], {})[parts[2]] = value
+        elif parts[0] == "events" and len(parts) >= 2:
+            events.append((":".join(parts[1:]), value))
+
+    out.family("automonitor_runs_total", "counter", "Monitor cycles by source and outcome.")
+    for source, outcome, value in runs:
+        out.sample("automonitor_runs_total", value, source=source, outcome=outcome)
+
+    out.family("automonitor_runs_skipped_total", "counter", "Cycles cut short by a 304 or an unchanged body.")
+    out.sample("automonitor_runs_skipped_total", sum(counters.get(f"runs:{o}", 0) for o in _SKIPPED_OUTCOMES))
+
+    out.family("automonitor_run_failures_total", "counter", "Cycles that ended with an error.")
+    out.sample("automonitor_run_failures_total", counters.get("runs:error", 0))
+
+    out.family("automonitor_bytes_downloaded_total", "counter", "Feed bytes downloaded.")
+    out.sample("automonitor_bytes_downloaded_total", counters.get("bytes_downloaded", 0))
+
+    out.family("automonitor_products_parsed_total", "counter", "Products parsed from feed bodies.")
+    out.sample("automonitor_products_parsed_total", counters.get("products_parsed", 0))
+
+    out.family("automonitor_events_total", "counter", "Change events recorded by source.")
+    for source, value in events:
+        out.sample("automonitor_events_total", value, source=source)
+
+    name = "automonitor_phase_duration_seconds"
+    out.family(name, "histogram", "Duration of each monitor cycle phase; phase=\"total\" is the whole cycle.")
+    for phase, values in sorted(histograms.items()):
+        cumulative = 0
+        for le in DURATION_BUCKETS:
+            cumulative += values.get(repr(le), 0)
+            out.sample(f"{name}_bucket", cumulative, phase=phase, le=repr(le))
+        out.sample(f"{name}_bucket", values.get("count", 0), phase=phase, le="+Inf")
+        out.sample(f"{name}_sum", values.get("sum_us", 0) / 1_000_000, phase=phase)
+        out.sample(f"{name}_count", values.get("count", 0), phase=phase)
+
+    out.family("automonitor_notifications", "gauge", "Notifications in the outbound queue by status.")
+    for status, value in sorted(notifications.items()):
+        out.sample("automonitor_notifications", value, status=status)
+
+    return "\n".join(out.lines) + "\n"
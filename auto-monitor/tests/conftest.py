@@ -0,0 +1,70 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.automonitor.application.monitor_service import run_monitor
+from src.automonitor.infrastructure.sqlite_repo import DEFAULT_SOURCE
+from src.automonitor.interfaces.api import create_app
+
+class FeedServer:
+    """Servidor local que responde cualquier GET con el feed del catalogo actual."""
+
+    def __init__(self):
+        self.state = {}
+        feed = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                products = [{"id": pid, **p} for pid, p in feed.state.items()]
+                data = json.dumps({"products": products}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/products.json"
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       kwargs={"poll_interval": 0.05}, daemon=True)
+
+@pytest.fixture
+def feed():
+    server = FeedServer()
+    server.thread.start()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+@pytest.fixture
+def record(feed):
+    """Pasa cada catalogo por un ciclo del monitor (run_monitor contra el FeedServer), en orden."""
+
+    def record(db_path, states, storage_mode="full", keyframe_interval=10, source=DEFAULT_SOURCE):
+        results = []
+        for state in states:
+            feed.state = state
+            results.append(run_monitor(feed.url, db_path, storage_mode=storage_mode,
+                                       keyframe_interval=keyframe_interval, snapshot_codec="none", source=source))
+        return results
+
+    return record
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Base vacia, configurada tambien para la API (get_settings lee el entorno)."""
+    path = str(tmp_path / "monitor.db")
+    monkeypatch.setenv("DB_PATH", path)
+    monkeypatch.setenv("SOURCE_URL", "http://127.0.0.1:9/products.json")
+    return path
+
+@pytest.fixture
+def client(db_path):
+    with TestClient(create_app()) as c:
+        yield c
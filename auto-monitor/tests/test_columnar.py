@@ -0,0 +1,124 @@
+import json
+import math
+import random
+
+import pytest
+
+from src.automonitor.domain.columnar import ColumnarState, diff_columnar
+from src.automonitor.domain.diff import diff_products, product_changes, serialize_state
+from src.automonitor.domain.merkle import diff_buckets, hash_state
+from src.automonitor.domain.models import build_product_state
+
+NAN = float("nan")
+
+def _feed(*products):
+    return [{"id": pid, "title": title, "price": price} for pid, title, price in products]
+
+CASES = {
+    "empty": ([], []),
+    "empty_to_full": ([], _feed(("1", "uno", 1.0), ("2", "dos", 2.0))),
+    "full_to_empty": (_feed(("1", "uno", 1.0), ("2", "dos", 2.0)), []),
+    "added_removed_changed": (
+        _feed(("a", "A", 1.0), ("b", "B", 2.0), ("c", "C", 3.0), ("d", "D", 4.0)),
+        _feed(("b", "B", 2.5), ("c", "C2", 3.0), ("d", "D", 4.0), ("e", "E", 5.0)),
+    ),
+    "duplicate_ids": (
+        _feed(("1", "primero", 1.0), ("2", "x", 2.0), ("1", "ultimo", 9.0)),
+        _feed(("2", "x", 2.0), ("1", "ultimo", 9.0), ("2", "y", 3.0), ("2", "x", 2.0)),
+    ),
+    "non_ascii": (
+        _feed(("ñ", "Pingüino ☃", 1.0), ("é", "café", 2.0), ("z", "\U0001F600 emoji", 3.0)),
+        _feed(("ñ", "Pingüino ☃", 1.5), ("é", "café", 2.0), ("ü", "über \"quotes\" \\ \n", 4.0)),
+    ),
+    "numeric_ids_sort_as_text": (
+        _feed((10, "diez", 10), (9, "nueve", 9), (100, "cien", 100)),
+        _feed((9, "nueve", 9), (100, "cien", 101), (11, "once", 11)),
+    ),
+    "nan_prices": (
+        _feed(("1", "nan igual", NAN), ("2", "a nan", 2.0), ("3", "desde nan", NAN), ("4", "inf", math.inf)),
+        _feed(("1", "nan igual", NAN), ("2", "a nan", NAN), ("3", "desde nan", 3.0), ("4", "inf", -math.inf)),
+    ),
+    "same_ids": (
+        _feed(("1", "a", 1.0), ("2", "b", NAN), ("3", "c", 3.0), ("4", "d", NAN), ("5", "e", 5.0)),
+        _feed(("1", "a", 1.5), ("2", "b", NAN), ("3", "C", 3.0), ("4", "d", 4.0), ("5", "e", 5.0)),
+    ),
+    "unchanged": (
+        _feed(("1", "a", 1.0), ("2", "b", NAN)),
+        _feed(("2", "b", NAN), ("1", "a", 1.0)),
+    ),
+    "float_precision": (
+        _feed(("1", "p", 0.1 + 0.2), ("2", "q", 1e-300), ("3", "r", 2 ** 53)),
+        _feed(("1", "p", 0.3), ("2", "q", 1e-300), ("3", "r", 2 ** 53 + 1)),
+    ),
+}
+
+def _same(a, b):
+    # NaN != NaN: se comparan los textos JSON, que escriben NaN igual de los dos lados
+    return json.dumps(a, sort_keys=True) == json.dumps(b, sort_keys=True)
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_diff_columnar_matches_diff_products(name):
+    old_feed, new_feed = CASES[name]
+    old, new = build_product_state(old_feed), build_product_state(new_feed)
+    expected = diff_products(old, new)
+
+    col_old, col_new = ColumnarState.from_products(old_feed), ColumnarState.from_products(new_feed)
+    assert _same(diff_columnar(col_old, col_new), expected)
+    # diff_products pasa al merge-join con un lado en columnas
+    assert _same(diff_products(col_old, new), expected)
+    assert _same(diff_products(old, col_new), expected)
+    assert _same(product_changes(col_old, *diff_columnar(col_old, col_new)),
+                 product_changes(old, *expected))
+    # El diff por buckets del hash llega a lo mismo
+    assert _same(diff_buckets(old, hash_state(old), new, hash_state(new)), expected)
+    assert _same(diff_buckets(col_old, hash_state(col_old), col_new, hash_state(col_new)), expected)
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_to_json_matches_serialize_state(name):
+    for feed in CASES[name]:
+        state = build_product_state(feed)
+        columnar = ColumnarState.from_products(feed)
+        assert columnar.to_json() == serialize_state(state)
+        assert serialize_state(columnar) == serialize_state(state)
+        assert ColumnarState.from_state(state).to_json() == serialize_state(state)
+        assert hash_state(columnar).root == hash_state(state).root
+
+def test_same_nan_price_is_not_a_change():
+    old = build_product_state(_feed(("1", "a", NAN)))
+    new = build_product_state(_feed(("1", "a", float("nan"))))
+    assert diff_products(old, new) == ([], [], [])
+    assert diff_columnar(ColumnarState.from_state(old), ColumnarState.from_state(new)) == ([], [], [])
+
+@pytest.mark.parametrize("price", [None, "abc", {"amount": 1}])
+def test_bad_price_fails_the_same_in_both_builders(price):
+    feed = _feed(("1", "a", price))
+    with pytest.raises((TypeError, ValueError)) as expected:
+        build_product_state(feed)
+    with pytest.raises(expected.type):
+        ColumnarState.from_products(feed)
+
+def test_duplicate_ids_keep_the_last_product():
+    feed = _feed(("b", "1", 1.0), ("a", "2", 2.0), ("b", "3", 3.0), ("a", "4", 4.0), ("c", "5", 5.0))
+    columnar = ColumnarState.from_products(feed)
+    assert columnar.ids == ["a", "b", "c"]
+    assert columnar.to_state() == build_product_state(feed)
+
+def test_random_catalogs_agree():
+    rng = random.Random(1604)
+    titles = ["uno", "dos", "tres", "ñandú", "日本", ""]
+    for _ in range(200):
+        ids = [str(rng.randrange(60)) for _ in range(rng.randrange(40))]
+        old_feed = [{"id": i, "title": rng.choice(titles), "price": rng.choice([1.0, 2.5, NAN, 0.1])} for i in ids]
+        new_feed = [dict(p) for p in old_feed if rng.random() > 0.2]
+        for p in new_feed:
+            if rng.random() < 0.3:
+                p["price"] = rng.choice([1.0, 2.5, NAN, 0.1])
+            if rng.random() < 0.1:
+                p["title"] = rng.choice(titles)
+        new_feed += [{"id": str(rng.randrange(60, 90)), "title": "nuevo", "price": 9.0} for _ in range(rng.randrange(5))]
+        rng.shuffle(new_feed)
+
+        old, new = build_product_state(old_feed), build_product_state(new_feed)
+        col_old, col_new = ColumnarState.from_products(old_feed), ColumnarState.from_products(new_feed)
+        assert _same(diff_columnar(col_old, col_new), diff_products(old, new))
+        assert col_new.to_json() == serialize_state(new)
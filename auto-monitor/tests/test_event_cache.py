@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.automonitor.application.monitor_service import compact_history
+from src.automonitor.application.query_service import get_event_detail
+from src.automonitor.infrastructure.sqlite_repo import get_pool
+
+STATES = [{f"p{j}": {"title": f"P{j}", "price": float(i + j)} for j in range(5)} for i in range(4)]
+
+@pytest.fixture
+def db_path(db_path, record, monkeypatch):
+    monkeypatch.setenv("RETENTION_KEEP_ALL_DAYS", "1")
+    monkeypatch.setenv("RETENTION_DAILY_DAYS", "2")
+    record(db_path, STATES)
+    # Los tres primeros eventos quedan fuera de toda retencion
+    old = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    with get_pool(db_path).write() as conn:
+        for event_id in (1, 2, 3):
+            conn.execute("UPDATE events SET created_at = ? WHERE id = ?",
+                         ((old + timedelta(hours=event_id)).isoformat(), event_id))
+    return db_path
+
+def _compact(db_path, tmp_path):
+    return compact_history(db_path, 1, 2, str(tmp_path / "archive"), snapshot_codec="none")
+
+def test_compaction_changes_the_etag_and_cache_control(client, db_path, tmp_path):
+    before = client.get("/events/2")
+    assert before.status_code == 200
+    assert before.headers["cache-control"] == "no-cache"
+    assert before.json()["state"] == STATES[1]
+    assert client.get("/events/2", headers={"If-None-Match": before.headers["etag"]}).status_code == 304
+
+    _compact(db_path, tmp_path)
+
+    after = client.get("/events/2", headers={"If-None-Match": before.headers["etag"]})
+    assert after.status_code == 200
+    assert after.headers["etag"] != before.headers["etag"]
+    assert after.json()["state"] == {}
+    assert after.json()["updated"] == before.json()["updated"]
+    # Pruned es el ultimo paso de la compactacion: de aca en mas no cambia
+    assert after.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert client.get("/events/2", headers={"If-None-Match": after.headers["etag"]}).status_code == 304
+
+def test_recent_events_are_revalidated(client, db_path, tmp_path):
+    _compact(db_path, tmp_path)
+    latest = client.get("/events/4")
+    assert latest.headers["cache-control"] == "no-cache"
+    assert latest.json()["state"] == STATES[3]
+
+def test_cache_control_follows_the_projection(client, db_path, monkeypatch):
+    # El diff no lo reescribe nadie; el catalogo si, mientras haya retencion
+    assert client.get("/events/2?include=diff").headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert client.get("/events/2?fields=id,updated").headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert client.get("/events/2?fields=id,state").headers["cache-control"] == "no-cache"
+    monkeypatch.setenv("RETENTION_KEEP_ALL_DAYS", "0")
+    assert client.get("/events/2").headers["cache-control"] == "public, max-age=31536000, immutable"
+
+def test_detail_cache_follows_compaction_from_another_process(db_path, tmp_path, monkeypatch):
+    assert get_event_detail(db_path, 2)["state"] == STATES[1]
+    # Otro proceso compacta: este no llega a vaciar su cache
+    from src.automonitor.application import monitor_service
+    monkeypatch.setattr(monitor_service, "clear_event_cache", lambda: None)
+    _compact(db_path, tmp_path)
+    assert get_event_detail(db_path, 2)["state"] == {}
+
+def test_compact_history_clears_the_detail_cache(db_path, tmp_path):
+    from src.automonitor.application import query_service
+    get_event_detail(db_path, 4)
+    assert query_service._detail_cache._entries
+    _compact(db_path, tmp_path)
+    assert not query_service._detail_cache._entries
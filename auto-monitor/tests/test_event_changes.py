@@ -0,0 +1,81 @@
+import pytest
+
+from src.automonitor.infrastructure.sqlite_repo import get_pool
+
+BEFORE = {**{f"u{i}": {"title": f"U{i}", "price": float(i)} for i in range(5)},
+          **{f"r{i}": {"title": f"R{i}", "price": 1.0} for i in range(3)}}
+AFTER = {**{f"u{i}": {"title": f"U{i}", "price": float(i)} for i in range(5)},
+         "u1": {"title": "U1", "price": 11.0},
+         "u3": {"title": "U3", "price": 0.5},
+         "u4": {"title": "U4 new", "price": 4.0},
+         **{f"a{i}": {"title": f"A{i}", "price": 2.0} for i in range(4)}}
+# Los cambios del evento 2, en el orden de las paginas (id de producto)
+IDS = ["a0", "a1", "a2", "a3", "r0", "r1", "r2", "u1", "u3", "u4"]
+
+@pytest.fixture
+def db_path(db_path, record):
+    record(db_path, [BEFORE, AFTER])
+    return db_path
+
+@pytest.fixture(params=["indexed", "recomputed"])
+def pages(request, client, db_path):
+    """Recorre /events/2/changes siguiendo next_cursor, con el diff indexado o recalculado."""
+    if request.param == "recomputed":
+        with get_pool(db_path).write() as conn:
+            conn.execute("UPDATE events SET changes_indexed = 0")
+
+    def pages(limit, **params):
+        result = [client.get("/events/2/changes", params={"limit": limit, **params}).json()]
+        while result[-1]["next_cursor"] is not None:
+            result.append(client.get("/events/2/changes", params={"limit": limit, "cursor": result[-1]["next_cursor"],
+                                                                   **params}).json())
+        return result
+
+    return pages
+
+def _ids(pages):
+    return [[c["id"] for c in p["items"]] for p in pages]
+
+def test_cursor_walks_every_change_once(pages):
+    result = pages(3)
+    assert _ids(result) == [IDS[0:3], IDS[3:6], IDS[6:9], IDS[9:]]
+    assert [p["next_cursor"] for p in result] == ["a2", "r1", "u3", None]
+    assert {(p["event_id"], p["kind"], p["limit"]) for p in result} == {(2, None, 3)}
+    assert all(p["counts"] == {"added": 4, "removed": 3, "updated": 3} for p in result)
+
+def test_exactly_full_last_page_is_followed_by_an_empty_page(pages):
+    result = pages(5)
+    assert _ids(result) == [IDS[:5], IDS[5:], []]
+    assert [p["next_cursor"] for p in result] == ["r0", "u4", None]
+
+def test_updated_changes_carry_the_old_values(pages):
+    result = pages(2, kind="updated")
+    assert _ids(result) == [["u1", "u3"], ["u4"]]
+    items = {c["id"]: c for p in result for c in p["items"]}
+    assert (items["u1"]["price"], items["u1"]["old_price"]) == (11.0, 1.0)
+    assert (items["u3"]["price"], items["u3"]["old_price"]) == (0.5, 3.0)
+    assert (items["u4"]["title"], items["u4"]["old_title"], items["u4"]["old_price"]) == ("U4 new", "U4", 4.0)
+    assert {c["kind"] for c in items.values()} == {"updated"}
+
+def test_added_and_removed_have_no_old_values(pages):
+    added = [c for p in pages(10, kind="added") for c in p["items"]]
+    assert [c["id"] for c in added] == IDS[:4]
+    assert {(c["old_title"], c["old_price"]) for c in added} == {(None, None)}
+    removed = pages(3, kind="removed")
+    assert _ids(removed) == [["r0", "r1", "r2"], []]
+    assert removed[0]["items"][0] == {"id": "r0", "kind": "removed", "title": "R0", "price": 1.0,
+                                      "old_title": None, "old_price": None}
+
+def test_cursor_between_ids(client):
+    page = client.get("/events/2/changes", params={"cursor": "b", "limit": 3}).json()
+    assert [c["id"] for c in page["items"]] == ["r0", "r1", "r2"]
+    assert client.get("/events/2/changes", params={"cursor": "u4"}).json()["items"] == []
+
+@pytest.mark.parametrize("path, params, status", [
+    ("/events/99/changes", {}, 404),
+    ("/events/2/changes", {"kind": "moved"}, 422),
+    ("/events/2/changes", {"limit": 0}, 422),
+    ("/events/2/changes", {"limit": 1001}, 422),
+])
+def test_invalid_requests(client, path, params, status):
+    assert client.get(path, params=params).status_code == status
@@ -0,0 +1,89 @@
+import pytest
+
+from src.automonitor.application.query_service import EVENT_DETAIL_FIELDS, EVENT_DIFF_FIELDS
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# Catalogos grandes para que el detalle completo pase el minimo de GZip
+STATES = [{f"p{j}": {"title": f"Product {j}", "price": float(i + j)} for j in range(80)} for i in range(3)]
+
+@pytest.fixture
+def db_path(db_path, record, monkeypatch):
+    # Con retencion activa el catalogo se puede compactar: se revalida
+    monkeypatch.setenv("RETENTION_KEEP_ALL_DAYS", "1")
+    monkeypatch.setenv("RETENTION_DAILY_DAYS", "2")
+    record(db_path, STATES)
+    return db_path
+
+@pytest.mark.parametrize("params, keys", [
+    ({}, EVENT_DETAIL_FIELDS),
+    ({"include": "all"}, EVENT_DETAIL_FIELDS),
+    ({"include": "diff"}, EVENT_DIFF_FIELDS),
+    ({"fields": "updated,id"}, ("id", "updated")),
+    ({"fields": " state , hash ,"}, ("hash", "state")),
+    ({"fields": "id,id"}, ("id",)),
+])
+def test_projection_keys(client, params, keys):
+    response = client.get("/events/2", params=params)
+    assert response.status_code == 200
+    assert tuple(response.json()) == keys
+
+@pytest.mark.parametrize("params", [{"fields": "id,prices"}, {"include": "state"}])
+def test_unknown_projection(client, params):
+    assert client.get("/events/2", params=params).status_code == 422
+
+@pytest.mark.parametrize("path, params, cache_control", [
+    ("/events/2", {}, "no-cache"),
+    ("/events/2", {"fields": "id,state"}, "no-cache"),
+    ("/events/2", {"include": "diff"}, IMMUTABLE),
+    ("/events/2", {"fields": "id,added,removed"}, IMMUTABLE),
+    ("/events/latest", {}, "no-cache"),
+    ("/events/latest", {"include": "diff"}, "no-cache"),
+])
+def test_cache_control_per_projection(client, path, params, cache_control):
+    assert client.get(path, params=params).headers["cache-control"] == cache_control
+
+def test_if_none_match_returns_304(client):
+    first = client.get("/events/2")
+    etag = first.headers["etag"]
+    assert etag.startswith('"2-')
+
+    cached = client.get("/events/2", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+    assert cached.headers["cache-control"] == first.headers["cache-control"]
+    # Lista de etags, prefijo debil y comodin
+    assert client.get("/events/2", headers={"If-None-Match": f'"x", W/{etag}'}).status_code == 304
+    assert client.get("/events/2", headers={"If-None-Match": "*"}).status_code == 304
+    assert client.get("/events/2", headers={"If-None-Match": '"x"'}).status_code == 200
+
+def test_each_projection_has_its_own_etag(client):
+    etags = {client.get("/events/2", params=p).headers["etag"]
+             for p in ({}, {"include": "diff"}, {"fields": "id,state"}, {"fields": "id"})}
+    assert len(etags) == 4
+    diff = client.get("/events/2", params={"include": "diff"}).headers["etag"]
+    assert client.get("/events/2", headers={"If-None-Match": diff}).status_code == 200
+    assert client.get("/events/2", params={"fields": ",".join(EVENT_DIFF_FIELDS)},
+                      headers={"If-None-Match": diff}).status_code == 304
+
+def test_latest_etag_follows_new_events(client, db_path, record):
+    etag = client.get("/events/latest").headers["etag"]
+    assert client.get("/events/latest", headers={"If-None-Match": etag}).status_code == 304
+    record(db_path, [{"x": {"title": "X", "price": 1.0}}])
+    response = client.get("/events/latest", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["id"] == 4
+
+def test_large_responses_are_gzipped(client):
+    full = client.get("/events/2", headers={"Accept-Encoding": "gzip"})
+    assert full.headers["content-encoding"] == "gzip"
+    assert full.json()["state"] == STATES[1]
+    assert "etag" in full.headers
+
+    plain = client.get("/events/2", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.json() == full.json()
+    # Por debajo de minimum_size se manda sin comprimir
+    small = client.get("/events/2", params={"fields": "id"}, headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
@@ -0,0 +1,88 @@
+import gzip
+import json
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+from src.automonitor.application.monitor_service import compact_history, rebuild_history
+from src.automonitor.domain.diff import compute_state_hash
+from src.automonitor.domain.merkle import hash_state
+from src.automonitor.infrastructure import sqlite_repo
+from src.automonitor.infrastructure.sqlite_repo import (HASH_BUCKETS, HASH_SHA256, backfill_event_counts,
+                                                        get_event_state, get_last_hash, get_pool, list_events)
+
+STATES = [{f"p{j}": {"title": f"P{j}", "price": float(i * j)} for j in range(6)} for i in range(5)]
+
+@pytest.fixture
+def db_path(db_path, record):
+    record(db_path, STATES, storage_mode="delta", keyframe_interval=3)
+    return db_path
+
+def _make_legacy(db_path, ids):
+    # Como quedan los eventos escritos antes de los hashes por bucket
+    with get_pool(db_path).write() as conn:
+        for event_id in ids:
+            conn.execute("""UPDATE events SET hash = ?, hash_algo = ?, bucket_hashes = NULL WHERE id = ?""",
+                         (compute_state_hash(STATES[event_id - 1]), HASH_SHA256, event_id))
+
+def _hashes(db_path):
+    return {e["id"]: (e["hash"], e["hash_algo"]) for e in list_events(db_path, limit=100)}
+
+def _expected():
+    return {i: (hash_state(state).root, HASH_BUCKETS) for i, state in enumerate(STATES, 1)}
+
+def test_new_events_record_the_bucket_root(db_path):
+    assert _hashes(db_path) == _expected()
+    assert get_last_hash(db_path) == hash_state(STATES[-1]).root
+
+@pytest.mark.parametrize("recompute", [
+    backfill_event_counts,
+    lambda db_path: rebuild_history(db_path, workers=1, chunk_size=2, restart=True),
+])
+def test_backfill_and_rebuild_recompute_legacy_hashes(db_path, recompute):
+    _make_legacy(db_path, [1, 2, 5])
+    with get_pool(db_path).write() as conn:
+        conn.execute("UPDATE source_state SET last_hash = ?", (compute_state_hash(STATES[-1]),))
+    assert _hashes(db_path)[2] == (compute_state_hash(STATES[1]), HASH_SHA256)
+
+    recompute(db_path)
+
+    assert _hashes(db_path) == _expected()
+    assert get_last_hash(db_path) == hash_state(STATES[-1]).root
+    with get_pool(db_path).read() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM events WHERE bucket_hashes IS NULL").fetchone()[0] == 0
+    assert [get_event_state(db_path, i) for i in range(1, 6)] == STATES
+
+def test_compaction_rehashes_before_dropping_the_catalog(db_path, tmp_path):
+    _make_legacy(db_path, [1, 2])
+    old = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    with get_pool(db_path).write() as conn:
+        for event_id in (1, 2, 3):
+            conn.execute("UPDATE events SET created_at = ? WHERE id = ?",
+                         ((old + timedelta(days=event_id)).isoformat(), event_id))
+    compact_history(db_path, 1, 2, str(tmp_path / "archive"), snapshot_codec="none")
+
+    events = {e["id"]: e for e in list_events(db_path, limit=100)}
+    assert events[2]["storage"] == "pruned"
+    assert (events[2]["hash"], events[2]["hash_algo"]) == _expected()[2]
+    archived = [json.loads(line) for f in sorted(Path(tmp_path / "archive").rglob("*.gz"))
+                for line in gzip.open(f, "rt")]
+    assert archived
+    assert {r["id"]: (r["hash"], r["hash_algo"]) for r in archived} == {
+        r["id"]: _expected()[r["id"]] for r in archived}
+
+def test_schema_upgrade_labels_existing_hashes(db_path):
+    _make_legacy(db_path, [1, 2])
+    conn = sqlite3.connect(db_path)
+    conn.execute("ALTER TABLE events DROP COLUMN hash_algo")
+    conn.execute("PRAGMA user_version = 5")
+    conn.commit()
+    conn.close()
+    sqlite_repo._schema_ready.discard(db_path)
+
+    hashes = _hashes(db_path)
+    assert hashes[1] == (compute_state_hash(STATES[0]), HASH_SHA256)
+    assert hashes[2] == (compute_state_hash(STATES[1]), HASH_SHA256)
+    assert {i: hashes[i] for i in (3, 4, 5)} == {i: _expected()[i] for i in (3, 4, 5)}
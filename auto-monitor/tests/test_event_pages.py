@@ -0,0 +1,48 @@
+import pytest
+
+STATES = [{f"p{j}": {"title": f"P{j}", "price": float(i + j)} for j in range(3)} for i in range(7)]
+
+@pytest.fixture
+def db_path(db_path, record):
+    record(db_path, STATES)
+    record(db_path, [{"x": {"title": "X", "price": 1.0}}, {"x": {"title": "X", "price": 2.0}}], source="other")
+    return db_path
+
+def _pages(client, limit, **params):
+    # Sigue next_before_id hasta que se corta; devuelve cada pagina
+    pages = [client.get("/events", params={"limit": limit, **params}).json()]
+    while pages[-1]["next_before_id"] is not None:
+        pages.append(client.get("/events", params={"limit": limit, "before_id": pages[-1]["next_before_id"],
+                                                   **params}).json())
+    return pages
+
+def test_before_id_walks_every_event_once(client):
+    pages = _pages(client, 3, source="default")
+    assert [[e["id"] for e in p["items"]] for p in pages] == [[7, 6, 5], [4, 3, 2], [1]]
+    assert [p["next_before_id"] for p in pages] == [5, 2, None]
+    assert {p["total_count"] for p in pages} == {7}
+    assert all(p["offset"] == 0 and p["limit"] == 3 for p in pages)
+
+def test_exactly_full_last_page_is_followed_by_an_empty_page(client):
+    # Con la pagina justa no se sabe si hay mas: el cursor sigue y la pagina siguiente llega vacia
+    pages = _pages(client, 9)
+    assert [[e["id"] for e in p["items"]] for p in pages] == [[9, 8, 7, 6, 5, 4, 3, 2, 1], []]
+    assert [p["next_before_id"] for p in pages] == [1, None]
+    assert pages[-1]["total_count"] == 9
+
+def test_before_id_is_exclusive_and_filters_by_source(client):
+    page = client.get("/events", params={"before_id": 9, "limit": 50}).json()
+    assert [e["id"] for e in page["items"]] == [8, 7, 6, 5, 4, 3, 2, 1]
+    assert page["next_before_id"] is None
+    other = client.get("/events", params={"before_id": 9, "source": "other"}).json()
+    assert [e["id"] for e in other["items"]] == [8]
+    assert client.get("/events", params={"before_id": 1}).json()["items"] == []
+
+def test_before_id_ignores_offset(client):
+    page = client.get("/events", params={"before_id": 5, "offset": 2, "limit": 2}).json()
+    assert [e["id"] for e in page["items"]] == [4, 3]
+    assert page["offset"] == 0
+
+@pytest.mark.parametrize("params", [{"limit": 0}, {"limit": 201}, {"before_id": 0}])
+def test_invalid_page_parameters(client, params):
+    assert client.get("/events", params=params).status_code == 422
@@ -0,0 +1,57 @@
+import pytest
+
+from src.automonitor.infrastructure.sqlite_repo import (STORAGE_DELTA, STORAGE_FULL, STORAGE_SNAPSHOT, get_event_state,
+                                                        list_events, migrate_event_storage)
+
+KEYFRAME_INTERVAL = 4
+
+def _state(i):
+    # Cada estado agrega, quita y cambia productos; el 7 deja la fuente vacia
+    if i == 7:
+        return {}
+    return {f"p{j}": {"title": f"P{j}" if j % 3 else f"P{j} ü{i}", "price": float(j * (i % 4) + 0.5)}
+            for j in range(i % 5, i + 6)}
+
+STATES = [_state(i) for i in range(15)]
+OTHER = [{"x": {"title": "X", "price": float(i)}} for i in range(6)]
+
+@pytest.fixture
+def db_path(db_path, record):
+    # Dos fuentes intercaladas: cada una lleva su propia cadena de deltas
+    for i, state in enumerate(STATES):
+        record(db_path, [state], storage_mode="delta", keyframe_interval=KEYFRAME_INTERVAL)
+        if i < len(OTHER):
+            record(db_path, [OTHER[i]], storage_mode="delta", keyframe_interval=KEYFRAME_INTERVAL, source="other")
+    return db_path
+
+def _events(db_path, source):
+    return [e for e in sorted(list_events(db_path, limit=100), key=lambda e: e["id"]) if e["source"] == source]
+
+def _assert_states(db_path):
+    assert [get_event_state(db_path, e["id"]) for e in _events(db_path, "default")] == STATES
+    assert [get_event_state(db_path, e["id"]) for e in _events(db_path, "other")] == OTHER
+
+def test_delta_chains_past_the_keyframe_interval(db_path):
+    storages = [e["storage"] for e in _events(db_path, "default")]
+    assert STORAGE_DELTA in storages
+    assert storages.count(STORAGE_DELTA) > KEYFRAME_INTERVAL
+    assert len(storages) > 3 * KEYFRAME_INTERVAL
+    _assert_states(db_path)
+
+def test_states_survive_storage_migrations(db_path):
+    deltas = [e for e in list_events(db_path, limit=100) if e["storage"] == STORAGE_DELTA]
+    # Los keyframes ya son snapshots: solo se reescriben los deltas
+    assert migrate_event_storage(db_path, STORAGE_FULL, KEYFRAME_INTERVAL, codec="none") == len(deltas)
+    assert {e["storage"] for e in list_events(db_path, limit=100)} == {STORAGE_SNAPSHOT}
+    _assert_states(db_path)
+
+    migrate_event_storage(db_path, STORAGE_DELTA, KEYFRAME_INTERVAL, codec="zlib")
+    storages = [e["storage"] for e in _events(db_path, "default")]
+    assert storages == [STORAGE_SNAPSHOT if i % KEYFRAME_INTERVAL == 0 else STORAGE_DELTA
+                        for i in range(len(STATES))]
+    _assert_states(db_path)
+
+    # Otro intervalo: las cadenas se rearman sobre los deltas existentes
+    migrate_event_storage(db_path, STORAGE_DELTA, KEYFRAME_INTERVAL + 3, codec="lzma")
+    assert [e["storage"] for e in _events(db_path, "default")].count(STORAGE_SNAPSHOT) == 3
+    _assert_states(db_path)
@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+import pytest
+
+from src.automonitor.interfaces import event_stream
+from src.automonitor.interfaces.event_stream import EventBroadcaster
+
+STATES = [{"p": {"title": "P", "price": float(i)}} for i in range(5)]
+MORE = [{"p": {"title": "P", "price": float(i)}} for i in range(10, 13)]
+
+@pytest.fixture
+def db_path(db_path, record):
+    record(db_path, STATES)
+    return db_path
+
+def _parse(message):
+    # (event, id, data) de un mensaje SSE; los comentarios y "retry" quedan como (None, None, texto)
+    fields = dict(line.split(": ", 1) for line in message.strip().split("\n") if not line.startswith(":"))
+    if "event" not in fields:
+        return None, None, message
+    return fields["event"], int(fields["id"]) if "id" in fields else None, json.loads(fields["data"])
+
+async def _take(stream, count):
+    return [_parse(await asyncio.wait_for(stream.__anext__(), 5)) for _ in range(count)]
+
+def _changes(messages):
+    return [event_id for event, event_id, _ in messages if event == "change"]
+
+async def _take_changes(stream, count):
+    # Hasta `count` cambios y las metricas que los siguen (el poll puede partirlos en varias tandas)
+    messages = []
+    while len(_changes(messages)) < count or messages[-1][0] != "metrics":
+        messages += await _take(stream, 1)
+    return messages
+
+def _run(db_path, scenario):
+    async def main():
+        broadcaster = EventBroadcaster(db_path, poll_seconds=0.01)
+        try:
+            return await scenario(broadcaster)
+        finally:
+            await broadcaster.close()
+    return asyncio.run(main())
+
+def test_replays_missed_events_then_streams_new_ones(db_path, record):
+    async def scenario(broadcaster):
+        stream = broadcaster.stream(2)
+        head = await _take(stream, 5)
+        await asyncio.to_thread(record, db_path, MORE)
+        live = await _take_changes(stream, len(MORE))
+        await stream.aclose()
+        return head, live
+
+    head, live = _run(db_path, scenario)
+    assert head[0] == (None, None, "retry: 3000\n\n")
+    assert _changes(head) == [3, 4, 5]
+    assert [m[2]["id"] for m in head[1:4]] == [3, 4, 5]
+    assert head[4][0] == "metrics" and head[4][2]["total_events"] == 5
+    # Los ids nuevos llegan en orden, y despues de ellos las metricas ya actualizadas
+    assert _changes(live) == [6, 7, 8]
+    assert [m[2]["id"] for m in live if m[0] == "change"] == [6, 7, 8]
+    assert live[-1][0] == "metrics" and live[-1][2]["total_events"] == 8
+
+def test_new_clients_start_from_the_latest_event(db_path, record):
+    async def scenario(broadcaster):
+        stream = broadcaster.stream(None)
+        head = await _take(stream, 2)
+        await asyncio.to_thread(record, db_path, MORE)
+        messages = await _take_changes(stream, len(MORE))
+        await stream.aclose()
+        return head, messages
+
+    head, messages = _run(db_path, scenario)
+    assert [m[0] for m in head] == [None, "metrics"]
+    assert _changes(messages) == [6, 7, 8]
+    assert messages[-1][2]["total_events"] == 8
+
+def test_up_to_date_clients_get_no_replay(db_path):
+    async def scenario(broadcaster):
+        stream = broadcaster.stream(5)
+        head = await _take(stream, 2)
+        await stream.aclose()
+        return head
+
+    assert [m[0] for m in _run(db_path, scenario)] == [None, "metrics"]
+
+def test_too_many_missed_events_send_a_reset(db_path, monkeypatch):
+    monkeypatch.setattr(event_stream, "REPLAY_LIMIT", 3)
+
+    async def scenario(broadcaster):
+        reset = broadcaster.stream(1)
+        replay = broadcaster.stream(2)
+        messages = await _take(reset, 3), await _take(replay, 5)
+        await reset.aclose()
+        await replay.aclose()
+        return messages
+
+    reset, replay = _run(db_path, scenario)
+    assert reset[1] == ("reset", None, {"last_event_id": 5})
+    assert reset[2][0] == "metrics"
+    # Justo REPLAY_LIMIT eventos todavia se reenvian
+    assert _changes(replay) == [3, 4, 5]
+
+def test_slow_clients_are_dropped(db_path, record, monkeypatch):
+    # Cada publicacion trae al menos un cambio y las metricas: no entra en la cola
+    monkeypatch.setattr(event_stream, "QUEUE_SIZE", 1)
+
+    async def scenario(broadcaster):
+        stream = broadcaster.stream(None)
+        await _take(stream, 2)
+        await asyncio.to_thread(record, db_path, MORE)
+        while broadcaster._subscribers:
+            await asyncio.sleep(0.01)
+        # Lo que alcanzo a entrar en la cola se entrega y despues el stream termina
+        return [m async for m in stream]
+
+    assert [_parse(m)[:2] for m in _run(db_path, scenario)] == [("change", 6)]
@@ -0,0 +1,100 @@
+import gzip
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.automonitor.application.monitor_service import compact_history
+from src.automonitor.application.query_service import EVENT_DIFF_FIELDS, export_events
+from src.automonitor.infrastructure.sqlite_repo import get_pool, iter_events_export
+
+STATES = [{f"p{j}": {"title": f"P{j}", "price": float(i * j)} for j in range(i % 3, 5)} for i in range(7)]
+OTHER = [{"x": {"title": "X", "price": float(i)}} for i in range(2)]
+
+@pytest.fixture
+def db_path(db_path, record):
+    record(db_path, STATES[:4], storage_mode="delta", keyframe_interval=3)
+    record(db_path, OTHER[:1], source="other")
+    record(db_path, STATES[4:], storage_mode="delta", keyframe_interval=3)
+    record(db_path, OTHER[1:], source="other")
+    return db_path
+
+def _lines(db_path, **kwargs):
+    return b"".join(export_events(db_path, **kwargs)).split(b"\n")
+
+def test_ndjson_lines_match_the_event_detail(client, db_path):
+    lines = _lines(db_path)
+    # Una linea por evento, JSON compacto, y la ultima termina en "\n"
+    assert lines[-1] == b""
+    records = [json.loads(line) for line in lines[:-1]]
+    assert lines[:-1] == [json.dumps(r, separators=(",", ":")).encode() for r in records]
+    assert [r["id"] for r in records] == list(range(1, 10))
+    assert [tuple(r) for r in records] == [EVENT_DIFF_FIELDS] * 9
+    for record in records:
+        assert record == client.get(f"/events/{record['id']}", params={"include": "diff"}).json()
+
+def test_state_is_exported_per_source(db_path):
+    records = list(iter_events_export(db_path, include_state=True, batch_size=2))
+    assert [r["state"] for r in records if r["source"] == "default"] == STATES
+    assert [r["state"] for r in records if r["source"] == "other"] == OTHER
+    assert tuple(records[0])[-1] == "state"
+
+def test_filters_and_batches_keep_the_order(db_path):
+    everything = list(iter_events_export(db_path))
+    for batch_size in (1, 2, 200):
+        assert list(iter_events_export(db_path, batch_size=batch_size)) == everything
+    assert [r["id"] for r in iter_events_export(db_path, since_id=4)] == [5, 6, 7, 8, 9]
+    assert [r["id"] for r in iter_events_export(db_path, source="other")] == [5, 9]
+    # since_id sobre una fuente filtrada retoma despues de ese id, no de esa posicion
+    assert [r["id"] for r in iter_events_export(db_path, since_id=5, source="other", batch_size=1)] == [9]
+    assert list(iter_events_export(db_path, since_id=9)) == []
+
+def test_created_range_is_half_open(db_path):
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    with get_pool(db_path).write() as conn:
+        for event_id in range(1, 10):
+            conn.execute("UPDATE events SET created_at = ? WHERE id = ?",
+                         ((start + timedelta(hours=event_id)).isoformat(), event_id))
+    records = iter_events_export(db_path, created_from=(start + timedelta(hours=3)).isoformat(),
+                                 created_to=(start + timedelta(hours=6)).isoformat())
+    assert [r["id"] for r in records] == [3, 4, 5]
+
+def test_export_after_compaction(db_path, tmp_path):
+    old = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    with get_pool(db_path).write() as conn:
+        for event_id in range(1, 6):
+            conn.execute("UPDATE events SET created_at = ? WHERE id = ?",
+                         ((old + timedelta(hours=event_id)).isoformat(), event_id))
+    before = list(iter_events_export(db_path, include_state=True))
+    compact_history(db_path, 1, 2, str(tmp_path / "archive"), snapshot_codec="none")
+
+    after = list(iter_events_export(db_path, include_state=True, batch_size=2))
+    pruned = {1, 2, 3, 4, 5}
+    # Los eventos compactados siguen con su diff; el catalogo ya no esta
+    assert [r["id"] for r in after] == [r["id"] for r in before]
+    for old_record, new_record in zip(before, after):
+        expected = {**old_record, "state": None} if old_record["id"] in pruned else old_record
+        assert new_record == expected
+    # Sin catalogo se exporta lo mismo que antes
+    assert _lines(db_path) == [json.dumps({k: v for k, v in r.items() if k != "state"},
+                                          separators=(",", ":")).encode() for r in before] + [b""]
+
+def test_unindexed_events_are_diffed_on_the_fly(db_path):
+    expected = list(iter_events_export(db_path))
+    with get_pool(db_path).write() as conn:
+        conn.execute("UPDATE events SET changes_indexed = 0")
+    assert list(iter_events_export(db_path, batch_size=2)) == expected
+
+def test_gzip_export_matches_the_plain_one(db_path):
+    assert gzip.decompress(b"".join(export_events(db_path, gzip=True))) == b"".join(export_events(db_path))
+
+def test_export_endpoint(client):
+    response = client.get("/events/export", params={"since_id": 7, "include": "state"},
+                          headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["cache-control"] == "no-store"
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [(r["id"], r["state"]) for r in records] == [(8, STATES[6]), (9, OTHER[1])]
+    assert client.get("/events/export", params={"include": "all"}).status_code == 422
+    assert client.get("/events/export", params={"from": "yesterday"}).status_code == 422
@@ -0,0 +1,71 @@
+import io
+import json
+
+import pytest
+
+from src.automonitor.domain.models import build_product_state
+from src.automonitor.infrastructure.http_fetcher import FetchResult
+from src.automonitor.infrastructure.json_stream import iter_json_array
+
+MALFORMED = [
+    b'{"products": 5}',
+    b'{"products": "ab"}',
+    b'{"products": null}',
+    b'{"products": {"id": 1}}',
+    b'{"products": [1]}',
+    b'{"products": [{"id": 1, "price": 2}]}',
+    b'{"products": [{"id": 1, "title": "a", "price": 2}',
+    b'[{"id": 1, "title": "a", "price": 2}]',
+    b'"products"',
+]
+
+VALID = [
+    b'{}',
+    b'{"total": 0}',
+    b'{"products": []}',
+    b'{"meta": {"products": 5}, "products": [{"id": 1, "title": "\\u00f1and\\u00fa", "price": 1e2}]}',
+    b'{"products": [{"id": 2, "title": "b", "price": 1.5}, {"id": 3, "title": "c", "price": 12345678901234567890}], "tail": [1, 2]}',
+]
+
+def _small(body):
+    return FetchResult(False, body, None, None, None, size=len(body))
+
+def _spooled(body):
+    return FetchResult(False, b"", None, None, None, size=len(body), spool=io.BytesIO(body))
+
+def _parse(result):
+    try:
+        return "ok", build_product_state(result.iter_products())
+    except Exception as exc:
+        return type(exc), str(exc)
+
+@pytest.mark.parametrize("body", MALFORMED)
+def test_malformed_body_fails_the_same_in_both_paths(body):
+    small = _parse(_small(body))
+    spooled = _parse(_spooled(body))
+    assert small[0] != "ok"
+    assert issubclass(small[0], (ValueError, TypeError, KeyError))
+    assert issubclass(spooled[0], small[0]) or issubclass(small[0], spooled[0])
+
+@pytest.mark.parametrize("body", [b'{"products": 5}', b'{"products": null}', b'{"products": {}}'])
+def test_non_list_products_raises_the_same_message(body):
+    small = _parse(_small(body))
+    spooled = _parse(_spooled(body))
+    assert small == spooled == (ValueError, "Invalid JSON feed: expected 'products' to be a list.")
+
+@pytest.mark.parametrize("body", VALID)
+def test_valid_body_gives_the_same_state_in_both_paths(body):
+    assert _parse(_small(body)) == _parse(_spooled(body)) == ("ok", build_product_state(json.loads(body).get("products", [])))
+
+@pytest.mark.parametrize("body", VALID + MALFORMED)
+def test_byte_by_byte_chunks_match_whole_body(body):
+    def collect(chunks):
+        try:
+            return "ok", list(iter_json_array(chunks, "products"))
+        except Exception as exc:
+            return type(exc), str(exc)
+    whole = collect([body])
+    split = collect([body[i:i + 1] for i in range(len(body))])
+    assert whole[0] == split[0]
+    if whole[0] == "ok":
+        assert whole == split
@@ -0,0 +1,86 @@
+from src.automonitor.domain.diff import diff_products
+from src.automonitor.domain.merkle import (MAX_BUCKETS, MIN_BUCKETS, PRODUCTS_PER_BUCKET, StateHashes, bucket_count,
+                                           bucket_of, changed_buckets, diff_buckets, hash_state, pack_buckets,
+                                           unpack_buckets)
+
+class RecordingState(dict):
+    """Catalogo que anota que productos se leyeron por id."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.read = set()
+
+    def __getitem__(self, pid):
+        self.read.add(pid)
+        return super().__getitem__(pid)
+
+def _catalog(size):
+    return {f"p{i}": {"title": f"P{i}", "price": float(i)} for i in range(size)}
+
+def _bucket_members(state, pid, count):
+    return {other for other in state if bucket_of(other, count) == bucket_of(pid, count)}
+
+def test_bucket_count_grows_with_the_catalog():
+    assert bucket_count(0) == MIN_BUCKETS
+    assert bucket_count(MIN_BUCKETS * PRODUCTS_PER_BUCKET) == MIN_BUCKETS
+    assert bucket_count(MIN_BUCKETS * PRODUCTS_PER_BUCKET + 1) == 2 * MIN_BUCKETS
+    assert bucket_count(200_000) == 4096
+    assert bucket_count(10**9) == MAX_BUCKETS
+
+def test_bucket_count_keeps_the_previous_count_near_a_limit():
+    assert bucket_count(200_000, 4096) == 4096
+    assert bucket_count(250_000, 4096) == 4096
+    assert bucket_count(150_000, 4096) == 4096
+    # Cuatro veces fuera del objetivo se vuelve a calcular
+    assert bucket_count(2_000_000, 4096) == bucket_count(2_000_000)
+    assert bucket_count(1_000, 4096) == MIN_BUCKETS
+    assert bucket_count(1_000, 300) == MIN_BUCKETS
+
+def test_only_changed_buckets_are_diffed():
+    old_state = _catalog(50_000)
+    new_state = {**old_state, "p7": {"title": "P7", "price": 70.0}}
+    old = RecordingState(old_state)
+    new = RecordingState(new_state)
+    old_hashes = hash_state(old)
+    new_hashes = hash_state(new, old_hashes.count)
+
+    assert changed_buckets(old_hashes, new_hashes) == [bucket_of("p7", new_hashes.count)]
+    added, removed, updated = diff_buckets(old, old_hashes, new, new_hashes)
+    assert (added, removed, updated) == ([], [], [{"id": "p7", "title": "P7", "price": 70.0}])
+    bucket = _bucket_members(new_state, "p7", new_hashes.count)
+    assert new.read <= bucket and old.read <= bucket
+    assert len(bucket) < 2 * PRODUCTS_PER_BUCKET
+
+def test_only_changed_buckets_are_diffed_with_stored_hashes():
+    # Cache fria: los hashes anteriores vienen de la base, sin los ids de cada bucket
+    old = RecordingState(_catalog(50_000))
+    new = RecordingState({**old, "p7": {"title": "P7", "price": 70.0}})
+    old.read.clear()
+    old_hashes = unpack_buckets(pack_buckets(hash_state(old).buckets))
+    new_hashes = hash_state(new, old_hashes.count)
+
+    assert diff_buckets(old, old_hashes, new, new_hashes)[2] == [{"id": "p7", "title": "P7", "price": 70.0}]
+    assert "p7" in old.read and old.read <= _bucket_members(old, "p7", old_hashes.count)
+
+def test_falls_back_to_the_full_diff():
+    old = _catalog(1_000)
+    new = {pid: {"title": p["title"], "price": p["price"] + 1} for pid, p in old.items()}
+    old_hashes = hash_state(old)
+    assert len(changed_buckets(old_hashes, hash_state(new))) == old_hashes.count
+    assert diff_buckets(old, old_hashes, new, hash_state(new)) == diff_products(old, new)
+
+    # El catalogo cambio de escala: los buckets no se pueden comparar
+    grown = {**old, **{f"q{i}": {"title": "Q", "price": 1.0} for i in range(100_000)}}
+    grown_hashes = hash_state(grown)
+    assert grown_hashes.count != old_hashes.count
+    assert diff_buckets(old, old_hashes, grown, grown_hashes) == diff_products(old, grown)
+
+def test_stored_hashes_keep_their_bucket_count():
+    hashes = hash_state(_catalog(50_000))
+    stored = unpack_buckets(pack_buckets(hashes.buckets))
+    assert stored.count == hashes.count and stored.root == hashes.root
+    # Los eventos guardados con 256 buckets fijos se siguen leyendo
+    assert unpack_buckets(bytes(8 * 256)).count == 256
+    assert unpack_buckets(bytes(8 * 300)) is None
+    assert unpack_buckets(bytes(8 * 128)) is None
+    assert isinstance(unpack_buckets(bytes(8 * MAX_BUCKETS)), StateHashes)
@@ -0,0 +1,220 @@
+import json
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.automonitor.infrastructure import notifier
+from src.automonitor.infrastructure.notifier import (BACKOFF_BASE_SECONDS, NotificationDispatcher, _batches,
+                                                     queue_notification)
+from src.automonitor.infrastructure import sqlite_repo
+from src.automonitor.infrastructure.sqlite_repo import (count_notifications, get_pool, list_due_notifications)
+from src.automonitor.infrastructure.telegram import (MAX_MESSAGE_LENGTH, TelegramClient, TelegramSendError,
+                                                     split_message)
+
+class StubTelegram:
+    """Servidor local que responde /bot<token>/sendMessage con las respuestas encoladas."""
+
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                stub.requests.append((self.path, json.loads(body)))
+                status, payload = stub.responses.pop(0) if stub.responses else (200, {"ok": True})
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       kwargs={"poll_interval": 0.05}, daemon=True)
+
+    def texts(self):
+        return [payload["text"] for _, payload in self.requests]
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def stub():
+    server = StubTelegram()
+    server.thread.start()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(notifier, "time", fake)
+    return fake
+
+@pytest.fixture
+def dispatcher(stub, tmp_path):
+    d = NotificationDispatcher(str(tmp_path / "monitor.db"), TelegramClient("TOKEN", "42", api_base=stub.url))
+    yield d
+    d._client.close()
+
+def _row(db_path, notification_id):
+    with get_pool(db_path).read() as conn:
+        return dict(conn.execute("SELECT * FROM notifications WHERE id = ?", (notification_id,)).fetchone())
+
+def test_client_posts_to_the_bot_url(stub):
+    with TelegramClient("TOKEN", "42", api_base=stub.url + "/") as client:
+        client.send("hola")
+    assert stub.requests == [("/botTOKEN/sendMessage",
+                              {"chat_id": "42", "text": "hola", "disable_web_page_preview": True})]
+
+def test_server_error_is_retried_with_backoff(stub, dispatcher, clock, monkeypatch):
+    monkeypatch.setattr(notifier.random, "uniform", lambda a, b: 1.0)
+    nid = queue_notification(dispatcher._db_path, "cambio")
+    stub.responses = [(500, {"ok": False}), (500, {"ok": False})]
+
+    assert dispatcher.drain() == 0
+    row = _row(dispatcher._db_path, nid)
+    assert (row["status"], row["attempts"]) == ("pending", 1)
+    assert row["next_attempt_at"] == clock.now + BACKOFF_BASE_SECONDS
+    assert row["last_error"].startswith("500")
+    # Antes de la espera no se vuelve a intentar
+    assert dispatcher.drain() == 0
+    assert len(stub.requests) == 1
+
+    clock.now = row["next_attempt_at"]
+    assert dispatcher.drain() == 0
+    # El segundo fallo duplica la espera
+    assert _row(dispatcher._db_path, nid)["next_attempt_at"] == clock.now + 2 * BACKOFF_BASE_SECONDS
+
+    clock.now += 2 * BACKOFF_BASE_SECONDS
+    assert dispatcher.drain() == 1
+    assert stub.texts() == ["cambio"] * 3
+    assert count_notifications(dispatcher._db_path) == {}
+
+def test_429_waits_for_retry_after(stub, dispatcher, clock):
+    nid = queue_notification(dispatcher._db_path, "cambio")
+    stub.responses = [(429, {"ok": False, "parameters": {"retry_after": 37}})]
+
+    assert dispatcher.drain() == 0
+    row = _row(dispatcher._db_path, nid)
+    assert row["next_attempt_at"] == clock.now + 37
+    assert row["last_error"] == "429 Too Many Requests"
+
+    clock.now += 36
+    assert dispatcher.drain() == 0
+    clock.now += 1
+    assert dispatcher.drain() == 1
+    assert len(stub.requests) == 2
+
+def test_429_error_carries_retry_after(stub):
+    stub.responses = [(429, {"ok": False, "parameters": {"retry_after": 3}})]
+    with TelegramClient("TOKEN", "42", api_base=stub.url) as client, pytest.raises(TelegramSendError) as exc:
+        client.send("x")
+    assert exc.value.retry_after == 3
+    assert not exc.value.permanent
+
+def test_permanent_client_error_is_not_retried(stub, dispatcher, clock):
+    rejected = queue_notification(dispatcher._db_path, "x" * (MAX_MESSAGE_LENGTH + 1))
+    queue_notification(dispatcher._db_path, "despues")
+    stub.responses = [(400, {"ok": False, "description": "Bad Request: chat not found"})]
+
+    # El rechazo no frena la cola: lo que sigue sale en la misma vuelta
+    assert dispatcher.drain() == 1
+    row = _row(dispatcher._db_path, rejected)
+    assert (row["status"], row["attempts"]) == ("failed", 1)
+    assert "chat not found" in row["last_error"]
+    assert count_notifications(dispatcher._db_path) == {"failed": 1}
+
+    clock.now += 10 ** 6
+    assert dispatcher.drain() == 0
+    # La primera parte del mensaje rechazado y el siguiente; nada se reintenta
+    assert stub.texts() == ["x" * MAX_MESSAGE_LENGTH, "despues"]
+    assert list_due_notifications(dispatcher._db_path, clock.now) == []
+
+def test_queued_notifications_are_sent_as_one_message(stub, dispatcher, clock):
+    for text in ("fuente a", "fuente b", "fuente c"):
+        queue_notification(dispatcher._db_path, text)
+
+    assert dispatcher.drain() == 3
+    assert stub.texts() == ["fuente a\n\nfuente b\n\nfuente c"]
+
+def _rows(*texts, parts_sent=0):
+    return [{"id": i, "text": t, "attempts": 0, "parts_sent": parts_sent} for i, t in enumerate(texts, 1)]
+
+def test_batches_respect_the_limit_and_order():
+    rows = _rows("aaaa", "bbbb", "cc", "d" * 12, "e")
+    assert _batches(rows, 10) == [
+        ([1, 2], ["aaaa\n\nbbbb"]),
+        ([3], ["cc"]),
+        ([4], ["d" * 10, "dd"]),
+        ([5], ["e"]),
+    ]
+
+def test_batch_of_exactly_the_limit_is_one_message():
+    assert _batches(_rows("a" * 5, "b" * 3), 10) == [([1, 2], ["aaaaa\n\nbbb"])]
+
+def test_batches_skip_the_parts_already_sent():
+    assert _batches(_rows("d" * 25, parts_sent=2), 10) == [([1], ["ddddd"])]
+    # Un mensaje partido no se junta con otros aunque lo que falta entre en el limite
+    rows = _rows("d" * 12, "e")
+    rows[0]["parts_sent"] = 1
+    assert _batches(rows, 10) == [([1], ["dd"]), ([2], ["e"])]
+
+def test_failed_part_is_retried_without_resending_the_previous_ones(stub, dispatcher, clock, monkeypatch):
+    monkeypatch.setattr(notifier.random, "uniform", lambda a, b: 1.0)
+    parts = ["a" * MAX_MESSAGE_LENGTH, "b" * MAX_MESSAGE_LENGTH, "c"]
+    nid = queue_notification(dispatcher._db_path, "".join(parts))
+    queue_notification(dispatcher._db_path, "despues")
+    stub.responses = [(200, {"ok": True}), (500, {"ok": False})]
+
+    assert dispatcher.drain() == 0
+    row = _row(dispatcher._db_path, nid)
+    assert (row["status"], row["attempts"], row["parts_sent"]) == ("pending", 1, 1)
+
+    clock.now += BACKOFF_BASE_SECONDS
+    assert dispatcher.drain() == 2
+    assert stub.texts() == [parts[0], parts[1], parts[1], parts[2], "despues"]
+    assert count_notifications(dispatcher._db_path) == {}
+
+def test_schema_upgrade_adds_parts_sent(tmp_path):
+    db_path = str(tmp_path / "monitor.db")
+    nid = queue_notification(db_path, "cambio")
+    conn = sqlite3.connect(db_path)
+    conn.execute("ALTER TABLE notifications DROP COLUMN parts_sent")
+    conn.execute("PRAGMA user_version = 8")
+    conn.commit()
+    conn.close()
+    sqlite_repo._schema_ready.discard(db_path)
+
+    assert list_due_notifications(db_path, 0) == [{"id": nid, "text": "cambio", "attempts": 0, "parts_sent": 0}]
+
+@pytest.mark.parametrize("text, expected", [
+    ("a" * MAX_MESSAGE_LENGTH, ["a" * MAX_MESSAGE_LENGTH]),
+    ("a" * (MAX_MESSAGE_LENGTH + 1), ["a" * MAX_MESSAGE_LENGTH, "a"]),
+    ("a" * (MAX_MESSAGE_LENGTH - 2) + "\nb", ["a" * (MAX_MESSAGE_LENGTH - 2) + "\nb"]),
+    ("a" * (MAX_MESSAGE_LENGTH - 1) + "\nb", ["a" * (MAX_MESSAGE_LENGTH - 1), "b"]),
+    ("a" * (2 * MAX_MESSAGE_LENGTH) + "\nb", ["a" * MAX_MESSAGE_LENGTH, "a" * MAX_MESSAGE_LENGTH, "b"]),
+])
+def test_split_message_at_the_telegram_limit(text, expected):
+    assert split_message(text) == expected
+
+def test_split_message_keeps_whole_lines():
+    lines = [f"producto {i}: " + "x" * (i % 50) for i in range(2000)]
+    text = "\n".join(lines)
+    parts = split_message(text)
+    assert all(len(p) <= MAX_MESSAGE_LENGTH for p in parts)
+    assert "\n".join(parts) == text
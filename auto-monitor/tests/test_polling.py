@@ -0,0 +1,74 @@
+import pytest
+
+from src.automonitor.domain.polling import GROWTH, HISTORY, AdaptiveInterval
+
+def _interval(initial=10.0, rng=lambda lo, hi: 1.0):
+    # Sin jitter: cada espera es exactamente el intervalo
+    return AdaptiveInterval(10.0, 100.0, initial, rng=rng)
+
+def _quiet(interval, now, cycles):
+    return [interval.next_delay(changed=False, failed=False, now=now) for _ in range(cycles)]
+
+@pytest.mark.parametrize("initial, expected", [(1.0, 10.0), (40.0, 40.0), (1000.0, 100.0)])
+def test_initial_interval_is_clamped(initial, expected):
+    assert _interval(initial).interval == expected
+
+def test_backs_off_to_the_maximum_without_history():
+    interval = _interval()
+    delays = _quiet(interval, now=0.0, cycles=8)
+    assert delays[:3] == pytest.approx([10 * GROWTH, 10 * GROWTH ** 2, 10 * GROWTH ** 3])
+    assert delays == sorted(delays)
+    assert delays[-2:] == [100.0, 100.0]
+
+def test_a_change_speeds_up_to_the_minimum():
+    interval = _interval(80.0)
+    assert interval.next_delay(changed=True, failed=False, now=1000.0) == 10.0
+    assert interval.next_delay(changed=False, failed=False, now=1001.0) == 10.0
+    assert interval.next_delay(changed=True, failed=False, now=1002.0) == 10.0
+
+def test_ceiling_follows_the_typical_gap():
+    interval = _interval()
+    interval.seed([0.0, 60.0, 120.0, 180.0])
+    assert interval.typical_gap() == 60.0
+    # Mitad del tiempo tipico entre cambios, aunque la fuente lleve poco quieta
+    assert _quiet(interval, now=190.0, cycles=5) == pytest.approx([15.0, 22.5, 30.0, 30.0, 30.0])
+    # Quieta mas que lo tipico: el techo pasa a la mitad de ese tiempo, hasta el maximo
+    assert _quiet(interval, now=300.0, cycles=3)[-1] == pytest.approx(60.0)
+    assert _quiet(interval, now=10_000.0, cycles=3)[-1] == 100.0
+
+def test_ceiling_is_clamped():
+    interval = _interval()
+    interval.seed([0.0, 1.0, 2.0])
+    assert interval.ceiling(2.0) == 10.0
+    assert _quiet(interval, now=2.0, cycles=3) == [10.0, 10.0, 10.0]
+    assert interval.ceiling(1e9) == 100.0
+
+def test_only_recent_changes_set_the_pace():
+    interval = _interval()
+    interval.seed([i * 1000.0 for i in range(HISTORY)])
+    for i in range(HISTORY):
+        interval.next_delay(changed=True, failed=False, now=HISTORY * 1000.0 + i)
+    assert interval.typical_gap() == 1.0
+
+def test_failures_back_off_exponentially_and_resume_the_interval():
+    interval = _interval()
+    _quiet(interval, now=0.0, cycles=1)
+    assert interval.interval == 15.0
+    failures = [interval.next_delay(changed=False, failed=True, now=0.0) for _ in range(4)]
+    assert failures == [30.0, 60.0, 100.0, 100.0]
+    assert interval.failures == 4 and interval.interval == 15.0
+    # El primer ciclo bueno sigue desde el intervalo normal
+    assert interval.next_delay(changed=False, failed=False, now=0.0) == 22.5
+    assert interval.failures == 0
+
+def test_jitter_bounds_every_delay():
+    calls = []
+
+    def rng(lo, hi):
+        calls.append((lo, hi))
+        return lo
+
+    interval = _interval(rng=rng)
+    assert interval.next_delay(changed=True, failed=False, now=0.0) == pytest.approx(9.0)
+    assert interval.next_delay(changed=False, failed=True, now=0.0) == pytest.approx(18.0)
+    assert calls == [(0.9, 1.1), (0.9, 1.1)]
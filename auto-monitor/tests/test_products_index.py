@@ -0,0 +1,101 @@
+import sqlite3
+
+import pytest
+
+from src.automonitor.application.monitor_service import index_products, rebuild_history
+from src.automonitor.infrastructure import sqlite_repo
+from src.automonitor.infrastructure.sqlite_repo import get_product, list_events
+
+STATES = [
+    {"a": {"title": "A", "price": 1.0}, "b": {"title": "B", "price": 2.0}},
+    {"a": {"title": "A", "price": 1.0}, "b": {"title": "B", "price": 2.5}},
+    {"a": {"title": "A", "price": 1.0}},
+    {"a": {"title": "A", "price": 1.0}, "c": {"title": "C", "price": 3.0}},
+]
+
+SEEN_FIELDS = ("last_seen_event_id", "last_seen_at", "last_changed_event_id", "removed_event_id")
+
+@pytest.fixture
+def db_path(db_path, record):
+    record(db_path, STATES)
+    return db_path
+
+def _event_ids(db_path):
+    return [e["id"] for e in reversed(list_events(db_path, limit=10))]
+
+def _raw_products(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    rows = {r["product_id"]: dict(r) for r in conn.execute("SELECT * FROM products")}
+    conn.close()
+    return rows
+
+def _seen(db_path, product_id):
+    row = get_product(db_path, product_id)
+    return {k: row[k] for k in SEEN_FIELDS}
+
+def test_last_seen_follows_each_event(db_path):
+    e1, e2, e3, e4 = _event_ids(db_path)
+    events = {e["id"]: e["created_at"] for e in list_events(db_path, limit=10)}
+
+    assert get_product(db_path, "a")["last_seen_event_id"] == e4
+    assert get_product(db_path, "a")["last_seen_at"] == events[e4]
+    assert get_product(db_path, "a")["last_changed_event_id"] == e1
+    # Quitado en e3: la ultima vez que estuvo fue e2
+    assert get_product(db_path, "b")["last_seen_event_id"] == e2
+    assert get_product(db_path, "b")["removed_event_id"] == e3
+    assert get_product(db_path, "c")["last_seen_event_id"] == e4
+
+def test_index_products_and_rebuild_give_the_same_last_seen(db_path):
+    expected = {pid: _seen(db_path, pid) for pid in "abc"}
+    index_products(db_path)
+    assert {pid: _seen(db_path, pid) for pid in "abc"} == expected
+    rebuild_history(db_path, workers=1, restart=True)
+    assert {pid: _seen(db_path, pid) for pid in "abc"} == expected
+
+def test_new_events_do_not_rewrite_unchanged_products(db_path, record):
+    before = _raw_products(db_path)
+    record(db_path, [{**STATES[-1], "d": {"title": "D", "price": 4.0}}])
+    after = _raw_products(db_path)
+
+    assert {pid: after[pid] for pid in before} == before
+    # Lo que sigue en el feed no guarda last_seen: se lee del ultimo evento de la fuente
+    assert before["a"]["last_seen_event_id"] is None
+    assert get_product(db_path, "a")["last_seen_event_id"] == _event_ids(db_path)[-1]
+    assert get_product(db_path, "b")["last_seen_event_id"] == _event_ids(db_path)[1]
+
+def test_schema_upgrade_fills_last_seen(db_path):
+    expected = {pid: _seen(db_path, pid) for pid in "abc"}
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE products SET last_seen_event_id = NULL, last_seen_at = NULL")
+    conn.execute("PRAGMA user_version = 4")
+    conn.commit()
+    conn.close()
+    sqlite_repo._schema_ready.discard(db_path)
+
+    assert {pid: _seen(db_path, pid) for pid in "abc"} == expected
+
+def test_upgrade_from_per_product_last_seen(db_path):
+    expected = {pid: _seen(db_path, pid) for pid in "abc"}
+    # Como quedaba una base de la version 7: huella por producto y last_seen en cada fila
+    conn = sqlite3.connect(db_path)
+    conn.execute("ALTER TABLE products ADD COLUMN fingerprint TEXT NOT NULL DEFAULT ''")
+    conn.execute("UPDATE products SET last_seen_event_id = 1, last_seen_at = '' WHERE removed_event_id IS NULL")
+    conn.execute("ALTER TABLE source_state DROP COLUMN last_event_id")
+    conn.execute("ALTER TABLE source_state DROP COLUMN last_event_at")
+    conn.execute("PRAGMA user_version = 7")
+    conn.commit()
+    conn.close()
+    sqlite_repo._schema_ready.discard(db_path)
+
+    assert {pid: _seen(db_path, pid) for pid in "abc"} == expected
+    assert "fingerprint" not in _raw_products(db_path)["a"]
+
+def test_history_endpoint_defaults_to_the_default_source(client, db_path, record):
+    record(db_path, [{"a": {"title": "Other A", "price": 9.0}}], source="other")
+    history = client.get("/products/b/history").json()
+    assert history["product"]["source"] == "default"
+    assert [(i["kind"], i["price"], i["old_price"]) for i in history["items"]][:2] == [
+        ("removed", 2.5, None), ("updated", 2.5, 2.0)]
+    assert client.get("/products/a/history", params={"source": "other"}).json()["product"]["title"] == "Other A"
+    assert client.get("/products/b/history", params={"source": "other"}).status_code == 404
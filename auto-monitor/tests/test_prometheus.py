@@ -0,0 +1,42 @@
+import pytest
+
+from src.automonitor.interfaces.prometheus import render_metrics
+
+def _samples(text):
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = value
+    return samples
+
+def test_large_counters_are_written_exactly():
+    counters = {
+        "bytes_downloaded": 1_000_001,
+        "products_parsed": 2 ** 53 + 1,
+        "runs:default:changed": 1_234_567,
+        "events:default": 10_000_019,
+    }
+    samples = _samples(render_metrics(counters, {"pending": 1_000_003}))
+    assert samples["automonitor_bytes_downloaded_total"] == "1000001"
+    assert samples["automonitor_products_parsed_total"] == str(2 ** 53 + 1)
+    assert samples['automonitor_runs_total{source="default",outcome="changed"}'] == "1234567"
+    assert samples['automonitor_events_total{source="default"}'] == "10000019"
+    assert samples['automonitor_notifications{status="pending"}'] == "1000003"
+
+def test_histogram_sum_keeps_microseconds():
+    counters = {
+        "phase_seconds:fetch:0.005": 3,
+        "phase_seconds:fetch:count": 3,
+        "phase_seconds:fetch:sum_us": 1_234_567_891,
+    }
+    samples = _samples(render_metrics(counters, {}))
+    assert float(samples['automonitor_phase_duration_seconds_sum{phase="fetch"}']) == 1234.567891
+    assert samples['automonitor_phase_duration_seconds_bucket{phase="fetch",le="0.005"}'] == "3"
+    assert samples['automonitor_phase_duration_seconds_bucket{phase="fetch",le="+Inf"}'] == "3"
+    assert samples['automonitor_phase_duration_seconds_count{phase="fetch"}'] == "3"
+
+@pytest.mark.parametrize("value", [0, 1, 999_999, 1_000_000, 1_000_001, 123_456_789_012])
+def test_counter_round_trip(value):
+    samples = _samples(render_metrics({"bytes_downloaded": value}, {}))
+    assert int(samples["automonitor_bytes_downloaded_total"]) == value
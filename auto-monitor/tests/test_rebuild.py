@@ -0,0 +1,65 @@
+import pytest
+
+from src.automonitor.application import monitor_service
+from src.automonitor.application.monitor_service import rebuild_history
+from src.automonitor.infrastructure.sqlite_repo import get_pool
+
+STATES = [{f"p{j}": {"title": f"P{j}", "price": float(i * j)} for j in range(i % 4, 6)} for i in range(10)]
+
+class Interrupted(Exception):
+    pass
+
+@pytest.fixture
+def db_path(db_path, record):
+    record(db_path, STATES)
+    return db_path
+
+@pytest.fixture
+def written(monkeypatch):
+    """Ultimo id de cada tramo que rebuild_history escribe, en orden."""
+    ranges = []
+    write = monitor_service.write_rebuilt_events
+
+    def record_range(db_path, events, last_event_id):
+        ranges.append((events[0].id if events else None, last_event_id))
+        write(db_path, events, last_event_id)
+
+    monkeypatch.setattr(monitor_service, "write_rebuilt_events", record_range)
+    return ranges
+
+def _history(db_path):
+    with get_pool(db_path).read() as conn:
+        return (conn.execute("SELECT id, added_count, removed_count, updated_count FROM events ORDER BY id").fetchall(),
+                conn.execute("SELECT * FROM products ORDER BY source, product_id").fetchall())
+
+def _stop_after(last_event_id):
+    def progress(status):
+        if status.last_event_id >= last_event_id:
+            raise Interrupted
+    return progress
+
+def test_resume_skips_the_ranges_already_written(db_path, written):
+    expected = _history(db_path)
+    with pytest.raises(Interrupted):
+        rebuild_history(db_path, workers=2, chunk_size=3, restart=True, progress=_stop_after(6))
+    assert written == [(1, 3), (4, 6)]
+
+    written.clear()
+    status = rebuild_history(db_path, workers=2, chunk_size=3)
+    assert written == [(7, 9), (10, 10)]
+    assert (status.last_event_id, status.target_id, status.events) == (10, 10, 4)
+    assert _history(db_path) == expected
+
+def test_fewer_ranges_than_workers(db_path, written):
+    expected = _history(db_path)
+    status = rebuild_history(db_path, workers=4, chunk_size=6, restart=True)
+    assert written == [(1, 6), (7, 10)]
+    assert status.events == len(STATES)
+    assert _history(db_path) == expected
+
+def test_finished_rebuild_starts_over(db_path, written):
+    rebuild_history(db_path, workers=1, chunk_size=4, restart=True)
+    written.clear()
+    # Sin una corrida cortada, la siguiente recorre toda la historia otra vez
+    assert rebuild_history(db_path, workers=1, chunk_size=4).events == len(STATES)
+    assert written == [(1, 4), (5, 8), (9, 10)]
@@ -0,0 +1,67 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.automonitor.application.monitor_service import backfill_metrics
+from src.automonitor.application.query_service import get_timeseries
+from src.automonitor.infrastructure import sqlite_repo
+from src.automonitor.infrastructure.sqlite_repo import get_pool
+
+# Cada estado cambia un producto y agrega otro respecto del anterior
+STATES = [{f"p{j}": {"title": "t", "price": float(j + (i if j == 0 else 0))} for j in range(i + 2)}
+          for i in range(6)]
+
+@pytest.fixture
+def db_path(db_path, record):
+    record(db_path, STATES)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    with get_pool(db_path).write() as conn:
+        for event_id in range(1, len(STATES) + 1):
+            conn.execute("UPDATE events SET created_at = ? WHERE id = ?",
+                         ((start + timedelta(hours=event_id // 2)).isoformat(), event_id))
+    backfill_metrics(db_path)
+    return db_path
+
+def _upgrade_from_v6(db_path, uncounted_ids):
+    # Eventos de antes de los contadores y rollups armados antes de la columna uncounted
+    conn = sqlite3.connect(db_path)
+    conn.executemany("UPDATE events SET added_count = NULL, removed_count = NULL, updated_count = NULL WHERE id = ?",
+                     [(i,) for i in uncounted_ids])
+    conn.execute("ALTER TABLE metrics_rollups DROP COLUMN uncounted")
+    conn.execute("PRAGMA user_version = 6")
+    conn.commit()
+    conn.close()
+    sqlite_repo._schema_ready.discard(db_path)
+
+def test_complete_history(db_path):
+    series = get_timeseries(db_path, "hour")
+    assert series["complete"]
+    assert [(i["events"], i["added"], i["updated"], i["uncounted"]) for i in series["items"]] == [
+        (1, 0, 0, 0), (2, 2, 2, 0), (2, 2, 2, 0), (1, 1, 1, 0)]
+
+def test_events_without_counts_are_reported(db_path):
+    expected = get_timeseries(db_path, "hour")
+    _upgrade_from_v6(db_path, [2, 3])
+
+    series = get_timeseries(db_path, "hour")
+    assert not series["complete"]
+    assert [(i["start"], i["events"], i["added"], i["uncounted"]) for i in series["items"]] == [
+        ("2026-01-01T00:00:00+00:00", 1, 0, 0),
+        ("2026-01-01T01:00:00+00:00", 2, 0, 2),
+        ("2026-01-01T02:00:00+00:00", 2, 2, 0),
+        ("2026-01-01T03:00:00+00:00", 1, 1, 0),
+    ]
+    day = get_timeseries(db_path, "day")
+    assert not day["complete"] and day["items"][0]["uncounted"] == 2
+    # El primer evento de la fuente es la linea base: sin contadores igual cuenta como sin cambios
+    assert get_timeseries(db_path, "hour", created_to="2026-01-01T01:00:00+00:00")["complete"]
+
+    backfill_metrics(db_path)
+    assert get_timeseries(db_path, "hour") == expected
+
+def test_new_events_are_counted(db_path, record):
+    _upgrade_from_v6(db_path, [])
+    assert get_timeseries(db_path, "hour")["complete"]
+    record(db_path, [{"x": {"title": "x", "price": 1.0}}])
+    assert get_timeseries(db_path, "day")["complete"]
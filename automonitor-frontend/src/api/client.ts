@@ -13,3 +13,30 @@ export async function apiGet<T>(path: string): Promise<T> {
 
   return (await res.json()) as T;
 }
+
+export type StreamHandlers = Record<string, (data: unknown) => void>;
+
+// Abre un EventSource sobre la API y reparte cada tipo de mensaje a su handler.
+// Devuelve la funcion que lo cierra, o null si el navegador no soporta EventSource.
+// `onClosed` se llama cuando el navegador deja de reconectar (error que no se resuelve solo).
+export function apiStream(path: string, handlers: StreamHandlers, onClosed: () => void): (() => void) | null {
+  if (typeof EventSource === "undefined") return null;
+
+  const source = new EventSource(`${BASE_URL}${path}`);
+
+  for (const [name, handler] of Object.entries(handlers)) {
+    source.addEventListener(name, (e) => {
+      try {
+        handler(JSON.parse((e as MessageEvent<string>).data));
+      } catch (err) {
+        console.error(err);
+      }
+    });
+  }
+
+  source.onerror = () => {
+    if (source.readyState === EventSource.CLOSED) onClosed();
+  };
+
+  return () => source.close();
+}
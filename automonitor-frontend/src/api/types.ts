@@ -32,4 +32,24 @@ export type OverviewMetrics = {
   sum_added: number;
   sum_removed: number;
   sum_updated: number;
-}
\ No newline at end of file
+}
+
+export type ChangeKind = "added" | "removed" | "updated";
+
+export type ProductChange = {
+  id: string;
+  kind: ChangeKind;
+  title: string;
+  price: number;
+  old_title: string | null;
+  old_price: number | null;
+};
+
+export type EventChangesPage = {
+  event_id: number;
+  kind: ChangeKind | null;
+  counts: Record<ChangeKind, number>;
+  items: ProductChange[];
+  limit: number;
+  next_cursor: string | null;
+};
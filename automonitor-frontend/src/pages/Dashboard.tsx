@@ -1,24 +1,89 @@
 import { useEffect, useState } from "react";
-import { apiGet } from "../api/client";
+import { apiGet, apiStream } from "../api/client";
 import type { Page, EventSummary, OverviewMetrics } from "../api/types";
-import { normalizePage } from "../api/normalize";
+import { normalizeEvent, normalizePage } from "../api/normalize";
 import { Link } from "react-router-dom";
 
+const LATEST_LIMIT = 10;
+// Solo si /events/stream no esta disponible: se vuelve a pedir todo cada tanto
+const POLL_INTERVAL_MS = 15000;
+
 export default function Dashboard() {
   const [page, setPage] = useState<Page<EventSummary> | null>(null);
   const [metrics, setMetrics] = useState<OverviewMetrics | null>(null);
   const [loading, setLoading] = useState(true);
+  const [live, setLive] = useState(false);
 
   useEffect(() => {
-    const metricsPromise = apiGet<OverviewMetrics>("/metrics/overview")
-      .then(setMetrics)
-      .catch(console.error);
+    let cancelled = false;
+    let stop: (() => void) | null = null;
+
+    const loadMetrics = () =>
+      apiGet<OverviewMetrics>("/metrics/overview")
+        .then((m) => {
+          if (!cancelled) setMetrics(m);
+        })
+        .catch(console.error);
+
+    const loadLatest = () =>
+      apiGet<unknown>(`/events?limit=${LATEST_LIMIT}&offset=0`)
+        .then((raw) => {
+          const latest = normalizePage(raw);
+          if (!cancelled) setPage(latest);
+          return latest;
+        })
+        .catch((err) => {
+          console.error(err);
+          return null;
+        });
+
+    const startPolling = () => {
+      stop?.();
+      if (cancelled) return;
+      setLive(false);
+      const timer = window.setInterval(() => {
+        loadMetrics();
+        loadLatest();
+      }, POLL_INTERVAL_MS);
+      stop = () => window.clearInterval(timer);
+    };
 
-    const latestPromise = apiGet<unknown>("/events?limit=10&offset=0")
-      .then((raw) => setPage(normalizePage(raw)))
-      .catch(console.error);
+    Promise.all([loadMetrics(), loadLatest()]).then(([, latest]) => {
+      if (cancelled) return;
+      setLoading(false);
 
-    Promise.all([metricsPromise, latestPromise]).finally(() => setLoading(false));
+      // El stream arranca despues del ultimo evento cargado: lo que llego entre medio se reenvia
+      const lastId = latest?.items[0]?.id;
+      const path = lastId != null ? `/events/stream?last_event_id=${lastId}` : "/events/stream";
+      const close = apiStream(
+        path,
+        {
+          change: (data) => {
+            const event = normalizeEvent(data as Record<string, unknown>);
+            setPage((current) => (current ? prependEvent(current, event) : current));
+          },
+          metrics: (data) => setMetrics(data as OverviewMetrics),
+          // Se perdieron demasiados eventos mientras estaba desconectado: se recarga todo
+          reset: () => {
+            loadMetrics();
+            loadLatest();
+          },
+        },
+        startPolling
+      );
+
+      if (close === null) {
+        startPolling();
+      } else {
+        stop = close;
+        setLive(true);
+      }
+    });
+
+    return () => {
+      cancelled = true;
+      stop?.();
+    };
   }, []);
 
   if (loading) return (
@@ -34,7 +99,12 @@ export default function Dashboard() {
       {/* Header del Dashboard */}
       <div>
         <h1 className="text-xl font-semibold tracking-tight">Overview</h1>
-        <p className="text-sm text-neutral-500 mt-1">Real-time summary of your monitored sources.</p>
+        <p className="text-sm text-neutral-500 mt-1">
+          Real-time summary of your monitored sources.{" "}
+          <span className="text-xs text-neutral-400">
+            {live ? "Live" : `Refreshing every ${POLL_INTERVAL_MS / 1000}s`}
+          </span>
+        </p>
       </div>
 
       {/* CARDS */}
@@ -99,6 +169,12 @@ export default function Dashboard() {
   );
 }
 
+// Un evento recibido por el stream va primero en la tabla (los ids son crecientes)
+function prependEvent(page: Page<EventSummary>, event: EventSummary): Page<EventSummary> {
+  if (page.items.some((e) => e.id === event.id)) return page;
+  return { ...page, items: [event, ...page.items].slice(0, page.limit), total: page.total + 1 };
+}
+
 function StatCard({ title, value, color }: { title: string; value: number; color: 'blue' | 'green' | 'red' | 'amber' }) {
   const colors = {
     blue: "text-blue-600 dark:text-blue-400 bg-blue-500/5 border-blue-200/50 dark:border-blue-500/10",
@@ -2,14 +2,20 @@ import { useEffect, useState } from "react";
 import { useParams, Link } from "react-router-dom";
 import { apiGet } from "../api/client";
 import { normalizeEvent } from "../api/normalize";
-import type { EventSummary } from "../api/types";
+import type { EventChangesPage, EventSummary, ProductChange } from "../api/types";
 
 type UnknownRecord = Record<string, unknown>;
 
+// Los cambios se piden por paginas: un evento grande puede tener cientos de miles
+const CHANGES_PAGE_SIZE = 200;
+
 export default function EventDetails() {
   const { id } = useParams<{ id: string }>();
   const [raw, setRaw] = useState<UnknownRecord | null>(null);
   const [event, setEvent] = useState<EventSummary | null>(null);
+  const [changes, setChanges] = useState<ProductChange[]>([]);
+  const [cursor, setCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
@@ -21,16 +27,36 @@ export default function EventDetails() {
       return;
     }
 
-    apiGet<unknown>(`/events/${eventId}`)
-      .then((data) => {
+    // Solo el resumen (sin listas ni catalogo) y la primera pagina de cambios
+    Promise.all([
+      apiGet<unknown>(`/events/${eventId}?fields=id,source,hash,created_at`),
+      apiGet<EventChangesPage>(`/events/${eventId}/changes?limit=${CHANGES_PAGE_SIZE}`),
+    ])
+      .then(([data, page]) => {
         const rec = (typeof data === "object" && data !== null) ? (data as UnknownRecord) : null;
         setRaw(rec);
-        if (rec) setEvent(normalizeEvent(rec));
+        if (rec) setEvent(normalizeEvent({ ...rec, ...page.counts }));
+        setChanges(page.items);
+        setCursor(page.next_cursor);
       })
       .catch(console.error)
       .finally(() => setLoading(false));
   }, [id]);
 
+  function loadMore() {
+    if (!event || cursor === null) return;
+    setLoadingMore(true);
+    apiGet<EventChangesPage>(
+      `/events/${event.id}/changes?limit=${CHANGES_PAGE_SIZE}&cursor=${encodeURIComponent(cursor)}`
+    )
+      .then((page) => {
+        setChanges((prev) => [...prev, ...page.items]);
+        setCursor(page.next_cursor);
+      })
+      .catch(console.error)
+      .finally(() => setLoadingMore(false));
+  }
+
   if (loading) return (
     <div className="flex items-center justify-center min-h-[400px]">
       <p className="text-sm text-neutral-500 animate-pulse font-medium">Loading event details...</p>
@@ -74,7 +100,9 @@ export default function EventDetails() {
       {/* JSON VIEWER */}
       <div className="bg-[#0d1117] dark:bg-[#010409] rounded-xl border border-neutral-800 shadow-xl overflow-hidden">
         <div className="px-4 py-2 border-b border-neutral-800 bg-neutral-900/50 flex items-center justify-between">
-          <span className="text-[10px] font-bold text-neutral-500 uppercase tracking-widest">Raw Payload (JSON)</span>
+          <span className="text-[10px] font-bold text-neutral-500 uppercase tracking-widest">
+            Changes (JSON) • {changes.length} of {event.added + event.removed + event.updated}
+          </span>
           <div className="flex gap-1.5">
             <div className="w-2.5 h-2.5 rounded-full bg-neutral-800" />
             <div className="w-2.5 h-2.5 rounded-full bg-neutral-800" />
@@ -82,8 +110,17 @@ export default function EventDetails() {
         </div>
         <div className="p-6">
           <pre className="text-[13px] leading-relaxed text-blue-300/90 font-mono overflow-auto whitespace-pre-wrap max-h-[500px] scrollbar-thin scrollbar-thumb-neutral-800">
-            {JSON.stringify(raw, null, 2)}
+            {JSON.stringify({ ...raw, changes }, null, 2)}
           </pre>
+          {cursor !== null && (
+            <button
+              className="mt-4 text-xs font-medium px-3 py-1.5 bg-neutral-900 border border-neutral-800 rounded-md text-neutral-300 hover:bg-neutral-800 transition-colors disabled:opacity-50"
+              onClick={loadMore}
+              disabled={loadingMore}
+            >
+              {loadingMore ? "Loading..." : "Load more changes"}
+            </button>
+          )}
         </div>
       </div>
     </div>